@@ -1,126 +1,47 @@
 import os
-import struct
-import io
 import glob
 import re  # 新增: 用於處理檔名正則
 from PIL import Image
+import g00_codec
 
 # ================= 設定區 =================
 # 輸出資料夾名稱
 OUTPUT_DIR = "merged_results"
 # =========================================
 
-# --- 基礎二進位讀取函式 (保持不變) ---
-def read_u8(stream): return struct.unpack('B', stream.read(1))[0]
-def read_u16(stream): return struct.unpack('<H', stream.read(2))[0]
-def read_s16(stream): return struct.unpack('<h', stream.read(2))[0]
-def read_u32(stream): return struct.unpack('<I', stream.read(4))[0]
-def read_s32(stream): return struct.unpack('<i', stream.read(4))[0]
-
-# --- LZ 解壓縮算法 (保持不變) ---
-def lz_decompress(stream, min_count=2, bytes_pp=1):
-    packed_size = read_s32(stream) - 8
-    output_size = read_s32(stream)
-    output = bytearray()
-    
-    bits = 2
-    while len(output) < output_size and packed_size > 0:
-        bits >>= 1
-        if bits == 1:
-            bits = read_u8(stream) | 0x100
-            packed_size -= 1
-        
-        if (bits & 1) != 0:
-            output.extend(stream.read(bytes_pp))
-            packed_size -= bytes_pp
-        else:
-            if packed_size < 2: break
-            offset = read_u16(stream)
-            packed_size -= 2
-            count = (offset & 0xF) + min_count
-            offset >>= 4
-            offset *= bytes_pp
-            count *= bytes_pp
-            
-            current_pos = len(output)
-            src_pos = current_pos - offset
-            for _ in range(count):
-                if src_pos < 0 or src_pos >= len(output):
-                    output.append(0)
-                else:
-                    output.append(output[src_pos])
-                src_pos += 1
-    return bytes(output)
-
-# --- G00 檔案讀取器 (保持不變) ---
+# --- G00 檔案讀取器 (解碼共用 g00_codec) ---
 def load_images_from_g00(filepath):
     images = []
     filename = os.path.basename(filepath)
     base_name_no_ext = os.path.splitext(filename)[0]
     
-    with open(filepath, 'rb') as f:
-        if read_u8(f) != 2: return [] 
-        width = read_u16(f)
-        height = read_u16(f)
-        count = read_s16(f)
+    with g00_codec.open_g00(filepath) as data:
+        # 檢查 Header
+        if g00_codec.read_header(data)[0] != 2: return [] # 只支援 Type 2
         
-        f.seek(9)
-        entries = []
-        for i in range(count):
-            ex = read_s32(f)
-            ey = read_s32(f)
-            f.seek(16, 1)
-            entries.append({'id': i, 'x': ex, 'y': ey})
-            
-        data_start = 9 + (count * 24)
-        f.seek(data_start)
+        # 讀取 Entries 目錄並解壓縮數據
         try:
-            decompressed = lz_decompress(f)
+            width, height, entries, decompressed, check_count = g00_codec.read_type2_directory(data)
         except:
             print(f"  [Error] 解壓失敗: {filename}")
             return []
 
-        with io.BytesIO(decompressed) as mem:
-            if read_s32(mem) != count: return []
+    if check_count != len(entries): return []
+        
+    # 構建圖片
+    for entry in entries:
+        if entry['size'] == 0: continue
+        
+        try:
+            img = g00_codec.decode_type2_entry(decompressed, entry, width, height)
+            if img is None: continue
             
-            for i in range(count):
-                entries[i]['offset'] = read_u32(mem)
-                entries[i]['size'] = read_u32(mem)
-                
-            for entry in entries:
-                if entry['size'] == 0: continue
-                
-                img = Image.new("RGBA", (width, height), (0, 0, 0, 0))
-                mem.seek(entry['offset'])
-                
-                try:
-                    tile_type = read_u16(mem)
-                    tile_count = read_u16(mem)
-                    if tile_type != 1: continue
-                    mem.seek(0x70, 1)
-                    
-                    for _ in range(tile_count):
-                        tx = read_u16(mem)
-                        ty = read_u16(mem)
-                        read_s16(mem)
-                        tw = read_u16(mem)
-                        th = read_u16(mem)
-                        mem.seek(0x52, 1)
-                        
-                        final_x = tx + entry['x']
-                        final_y = ty + entry['y']
-                        
-                        pixel_data = mem.read(tw * th * 4)
-                        if len(pixel_data) != tw * th * 4: break
-                        
-                        tile = Image.frombytes('RGBA', (tw, th), pixel_data, 'raw', 'BGRA')
-                        img.paste(tile, (final_x, final_y))
-                    
-                    img_name = f"{base_name_no_ext}_{entry['id']:03d}"
-                    images.append({'name': img_name, 'img': img})
-                    
-                except Exception as e:
-                    print(f"  [Error] 處理圖片錯誤: {e}")
+            # 將構建好的圖片存入列表
+            img_name = f"{base_name_no_ext}_{entry['id']:03d}"
+            images.append({'name': img_name, 'img': img})
+            
+        except Exception as e:
+            print(f"  [Error] 處理圖片錯誤: {e}")
                     
     return images
 
@@ -0,0 +1,266 @@
+"""
+RealLive g00 共用解碼模組 (g00topng.py / g00_direct_merge.py / LOOPERS_merge.py 共用)
+
+- lz_decompress：移植自 C# G00Reader.LzDecompress，直接從 bytes / memoryview / mmap 解壓到預先配置的緩衝區，
+  不重疊的回溯複製整段切片搬移，重疊複製以週期字串一次展開；有安裝 numba 時自動改用編譯版迴圈。
+- Type 0：24-bit BGR，LZ (min_count=1, bytes_pp=3)
+- Type 1：8-bit 調色盤 (BGRA)，LZ (min_count=2, bytes_pp=1)
+- Type 2：多圖層差分，每個 entry 由多個 BGRA tile 組成；tile 以 NumPy view 直接從解壓緩衝區切片賦值到
+  可重複使用的 (高, 寬, 4) 畫布，整個 entry 拼完後才做一次 BGRA -> RGBA 通道交換
+"""
+import mmap
+import struct
+from contextlib import contextmanager
+
+import numpy as np
+from PIL import Image
+
+try:
+    import numba
+except ImportError:
+    numba = None
+
+
+# --- LZ 解壓縮 ---
+def _lz_decompress_py(src, pos, packed_size, output_size, min_count, bytes_pp):
+    # 最後一個指令可能超出 output_size (與 C# 移植版相同)，預留一次最長複製的空間
+    out = bytearray(output_size + (0x10 + min_count) * bytes_pp)
+    o = 0
+    bits = 2
+    while o < output_size and packed_size > 0:
+        bits >>= 1
+        if bits == 1:
+            bits = src[pos] | 0x100
+            pos += 1
+            packed_size -= 1
+
+        if (bits & 1) != 0:
+            chunk = src[pos:pos + bytes_pp]
+            n = len(chunk)
+            out[o:o + n] = chunk
+            o += n
+            pos += n
+            packed_size -= bytes_pp
+        else:
+            if packed_size < 2:
+                break
+            token = src[pos] | (src[pos + 1] << 8)
+            pos += 2
+            packed_size -= 2
+
+            count = ((token & 0xF) + min_count) * bytes_pp
+            offset = (token >> 4) * bytes_pp
+            src_pos = o - offset
+
+            if src_pos >= 0 and offset >= count:
+                # 不重疊：整段搬移
+                out[o:o + count] = out[src_pos:src_pos + count]
+            elif src_pos >= 0 and offset > 0:
+                # 重疊 (CopyOverlapped)：等同以 offset 為週期重複前面的資料
+                pattern = bytes(out[src_pos:o])
+                out[o:o + count] = (pattern * (count // offset + 1))[:count]
+            else:
+                # 錯誤數據防禦：超出範圍的來源位置補 0
+                for k in range(count):
+                    sp = src_pos + k
+                    out[o + k] = out[sp] if 0 <= sp < o + k else 0
+            o += count
+
+    del out[o:]
+    return out, pos
+
+
+def _lz_decompress_kernel(src, pos, packed_size, output_size, min_count, bytes_pp, out):
+    o = 0
+    bits = 2
+    end = src.shape[0]
+    while o < output_size and packed_size > 0:
+        bits >>= 1
+        if bits == 1:
+            if pos >= end:
+                return -1, pos
+            bits = int(src[pos]) | 0x100
+            pos += 1
+            packed_size -= 1
+
+        if (bits & 1) != 0:
+            for _ in range(bytes_pp):
+                if pos >= end:
+                    break
+                out[o] = src[pos]
+                o += 1
+                pos += 1
+            packed_size -= bytes_pp
+        else:
+            if packed_size < 2:
+                break
+            if pos + 2 > end:
+                return -1, pos
+            token = int(src[pos]) | (int(src[pos + 1]) << 8)
+            pos += 2
+            packed_size -= 2
+
+            count = ((token & 0xF) + min_count) * bytes_pp
+            offset = (token >> 4) * bytes_pp
+            src_pos = o - offset
+            for k in range(count):
+                sp = src_pos + k
+                if sp < 0 or sp >= o + k:
+                    out[o + k] = 0
+                else:
+                    out[o + k] = out[sp]
+            o += count
+    return o, pos
+
+
+if numba is not None:
+    _lz_decompress_jit = numba.njit(cache=True, nogil=True)(_lz_decompress_kernel)
+else:
+    _lz_decompress_jit = None
+
+
+def lz_decompress(data, pos, min_count=2, bytes_pp=1, use_jit=True):
+    """
+    從 data[pos] 開始解壓一個 LZ 區塊 (前 8 bytes 為 packed_size+8 與 output_size)。
+    回傳 (解壓結果 bytearray, 區塊結束後的位置)
+    """
+    packed_size = struct.unpack_from('<i', data, pos)[0] - 8
+    output_size = struct.unpack_from('<i', data, pos + 4)[0]
+    pos += 8
+
+    if use_jit and _lz_decompress_jit is not None:
+        src = np.frombuffer(data, dtype=np.uint8)
+        out = np.empty(output_size + (0x10 + min_count) * bytes_pp, dtype=np.uint8)
+        o, pos = _lz_decompress_jit(src, pos, packed_size, output_size, min_count, bytes_pp, out)
+        if o < 0:
+            raise ValueError(f"LZ 數據在 offset {pos} 處截斷")
+        return bytearray(out[:o]), int(pos)
+    return _lz_decompress_py(data, pos, packed_size, output_size, min_count, bytes_pp)
+
+
+# --- 檔頭與各類型解碼 ---
+@contextmanager
+def open_g00(filepath):
+    """以 mmap 唯讀開啟 g00 (with open_g00(path) as data: ...)"""
+    with open(filepath, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+        yield data
+
+
+def read_header(data):
+    """回傳 (type, width, height)"""
+    g00_type = data[0]
+    width, height = struct.unpack_from('<HH', data, 1)
+    return g00_type, width, height
+
+
+def decode_type0(data, width, height):
+    """Type 0：24-bit BGR 全圖"""
+    pixels, _ = lz_decompress(data, 5, min_count=1, bytes_pp=3)
+    return Image.frombytes('RGB', (width, height), bytes(pixels[:width * height * 3]), 'raw', 'BGR').convert('RGBA')
+
+
+def decode_type1(data, width, height):
+    """Type 1：8-bit 索引色，調色盤每色 4 bytes (BGRA)"""
+    unpacked, _ = lz_decompress(data, 5, min_count=2, bytes_pp=1)
+    colors = struct.unpack_from('<H', unpacked, 0)[0]
+    palette = unpacked[2:2 + colors * 4]
+    indices = unpacked[2 + colors * 4:2 + colors * 4 + width * height]
+
+    # 每個通道各一張 256 bytes 轉換表 (不足 256 色的部分補 0)，以 bytes.translate 整段查表
+    planes = []
+    for channel in (2, 1, 0, 3):  # BGRA -> R, G, B, A
+        table = bytearray(256)
+        table[:colors] = palette[channel::4]
+        planes.append(Image.frombytes('L', (width, height), bytes(indices).translate(table)))
+    return Image.merge('RGBA', planes)
+
+
+def read_type2_directory(data):
+    """
+    Type 2：讀取 entry 目錄並解壓主要數據區塊。
+    回傳 (width, height, entries, decompressed, check_count)；entries 為 [{'id','x','y','offset','size'}, ...]
+    check_count 為解壓後數據記錄的圖片數量，與檔頭不符時由呼叫端決定如何處理
+    """
+    _, width, height = read_header(data)
+    count = struct.unpack_from('<h', data, 5)[0]
+
+    # C# 中是從 offset 9 開始讀取 Entry 的 X, Y，每個 entry 佔 0x18 bytes
+    entries = []
+    for i in range(max(count, 0)):
+        entry_x, entry_y = struct.unpack_from('<ii', data, 9 + i * 24)
+        entries.append({'id': i, 'x': entry_x, 'y': entry_y})
+
+    decompressed, _ = lz_decompress(data, 9 + count * 24, min_count=2, bytes_pp=1)
+
+    check_count = struct.unpack_from('<i', decompressed, 0)[0]
+    for i, entry in enumerate(entries):
+        entry['offset'], entry['size'] = struct.unpack_from('<II', decompressed, 4 + i * 8)
+    return width, height, entries, decompressed, check_count
+
+
+def read_type2_tiles(decompressed, entry):
+    """
+    讀取一個 entry 的 tile 列表 [(x, y, w, h, 像素資料 offset), ...]，座標已加上 entry 偏移。
+    tile 類型不是 1 時回傳 None；像素資料不完整的 tile 及其後的 tile 會被捨棄
+    """
+    pos = entry['offset']
+    tile_type, tile_count = struct.unpack_from('<HH', decompressed, pos)
+    if tile_type != 1:
+        return None
+    pos += 4 + 0x70  # Skip unknown header part
+
+    tiles = []
+    for _ in range(tile_count):
+        tx, ty, _unknown, tw, th = struct.unpack_from('<HHhHH', decompressed, pos)
+        pos += 10 + 0x52  # Skip unknown tile header
+
+        pixel_data_size = tw * th * 4
+        if pos + pixel_data_size > len(decompressed):
+            break
+        tiles.append((tx + entry['x'], ty + entry['y'], tw, th, pos))
+        pos += pixel_data_size
+    return tiles
+
+
+def new_canvas(width, height):
+    """建立全透明的 (高, 寬, 4) uint8 畫布"""
+    return np.zeros((height, width, 4), dtype=np.uint8)
+
+
+def assemble_type2_entry(decompressed, entry, canvas):
+    """
+    將一個 entry 的所有 tile 拼到 canvas (會先清空，可跨 entry 重複使用)，完成後 canvas 內容為 RGBA。
+    tile 直接取自解壓緩衝區的 view，不建立任何中間 PIL 物件；tile 類型不是 1 時回傳 False
+    """
+    tiles = read_type2_tiles(decompressed, entry)
+    if tiles is None:
+        return False
+
+    canvas.fill(0)
+    canvas_h, canvas_w = canvas.shape[:2]
+    src = np.frombuffer(decompressed, dtype=np.uint8)
+    # 記錄所有 tile 的聯集範圍，通道交換只需處理這個矩形
+    bx0, by0, bx1, by1 = canvas_w, canvas_h, 0, 0
+    for x, y, tw, th, pos in tiles:
+        # 與 Image.paste 相同：後面的 tile 直接覆蓋，超出畫布的部分裁掉
+        x0, y0 = max(x, 0), max(y, 0)
+        x1, y1 = min(x + tw, canvas_w), min(y + th, canvas_h)
+        if x0 >= x1 or y0 >= y1:
+            continue
+        tile = src[pos:pos + tw * th * 4].reshape(th, tw, 4)
+        canvas[y0:y1, x0:x1] = tile[y0 - y:y1 - y, x0 - x:x1 - x]
+        bx0, by0, bx1, by1 = min(bx0, x0), min(by0, y0), max(bx1, x1), max(by1, y1)
+
+    # BGRA -> RGBA，每個 entry 只做一次
+    if bx0 < bx1 and by0 < by1:
+        region = canvas[by0:by1, bx0:bx1]
+        region[..., [0, 2]] = region[..., [2, 0]]
+    return True
+
+
+def decode_type2_entry(decompressed, entry, width, height):
+    """將一個 entry 解成獨立的全尺寸 RGBA 圖片；tile 類型不是 1 時回傳 None"""
+    canvas = new_canvas(width, height)
+    if not assemble_type2_entry(decompressed, entry, canvas):
+        return None
+    return Image.fromarray(canvas)
@@ -3,6 +3,9 @@ import os
 import struct
 import csv
 import glob
+import mmap
+from collections import Counter
+import numpy as np
 from PIL import Image
 
 class S25Decoder:
@@ -10,28 +13,33 @@ class S25Decoder:
         self.filepath = filepath
         self.image_output_dir = image_output_dir
         self.file = open(filepath, 'rb')
+        # 整個檔案以 mmap 唯讀映射，各畫格/各行直接以 offset 取用，不再逐行 seek/read
+        self.data = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ) if os.path.getsize(filepath) > 0 else b''
         self.base_name = os.path.splitext(os.path.basename(filepath))[0]
 
     def __del__(self):
+        if hasattr(self, 'data') and isinstance(self.data, mmap.mmap):
+            self.data.close()
         if hasattr(self, 'file') and self.file:
             self.file.close()
 
     def decode(self):
         print(f"--- 開始處理檔案: {os.path.basename(self.filepath)} ---")
-        sig = self.file.read(4)
+        sig = self.data[0:4]
         if sig != b'S25\0':
             print("  錯誤: 檔案簽名不符，跳過此檔案。")
             return [], []
         try:
-            frame_count, = struct.unpack('<i', self.file.read(4))
+            frame_count, = struct.unpack_from('<i', self.data, 4)
             if not (0 <= frame_count < 10000): # 允許 0 個畫格
                 print(f"  警告: 畫格數量為 {frame_count}。")
                 if frame_count < 0: return [], []
-            frame_offsets = list(struct.unpack(f'<{frame_count}I', self.file.read(4 * frame_count)))
+            frame_offsets = list(struct.unpack_from(f'<{frame_count}I', self.data, 8))
             print(f"  找到 {len(frame_offsets)} 個畫格。")
         except struct.error:
             print("  錯誤: 讀取檔案標頭失敗，檔案可能已損壞。")
             return [], []
+        self._build_row_index(frame_offsets)
 
         all_frames_metadata = []
         decoded_frames = []
@@ -39,7 +47,7 @@ class S25Decoder:
             if offset == 0:
                 continue
             try:
-                image, metadata = self._decode_frame(i, offset, frame_offsets)
+                image, metadata = self._decode_frame(i, offset)
                 png_filename = f"{self.base_name}_{i}.png"
                 output_image_path = os.path.join(self.image_output_dir, png_filename)
                 image.save(output_image_path, 'PNG')
@@ -47,82 +55,70 @@ class S25Decoder:
                 decoded_frames.append({'image': image, 'metadata': metadata})
             except Exception as e:
                 print(f"    錯誤: 解碼畫格 {i} 失敗: {e}")
+            finally:
+                self._release_rows(offset)
         print(f"--- 完成檔案: {os.path.basename(self.filepath)} ---")
         return all_frames_metadata, decoded_frames
 
-    def _decode_frame(self, frame_index, frame_offset, all_frame_offsets):
-        self.file.seek(frame_offset)
-        width, height, offset_x, offset_y, flags = struct.unpack('<IIiiI', self.file.read(20))
+    def _decode_frame(self, frame_index, frame_offset):
+        width, height, offset_x, offset_y, flags = struct.unpack_from('<IIiiI', self.data, frame_offset)
         is_incremental = (flags & 0x80000000) != 0
         png_basename = f"{self.base_name}_{frame_index}"
         metadata = {'frame_index': png_basename, 'width': width, 'height': height, 'offset_x': offset_x, 'offset_y': offset_y}
         
-        row_offsets = list(struct.unpack(f'<{height}I', self.file.read(4 * height)))
-        pixel_buffer = bytearray(width * height * 4)
+        row_offsets = struct.unpack_from(f'<{height}I', self.data, frame_offset + 20)
+        # 整個畫格解到 (高, 寬, 4) 的 BGRA 陣列，每一行是其中一個 view
+        pixels = np.zeros((height, width, 4), dtype=np.uint8)
 
         if not is_incremental:
             # ===================================================================
             # === 重構部分：直接操作 pixel_buffer，與 C# 邏輯完全一致 ===
             # ===================================================================
-            current_dst_pos = 0
             for y in range(height):
                 row_pos_ptr = row_offsets[y]
                 if row_pos_ptr == 0:
-                    current_dst_pos += width * 4 # 如果行為空，則跳過整行
-                    continue
+                    continue # 如果行為空，則跳過整行
 
-                self.file.seek(row_pos_ptr)
-                row_length, = struct.unpack('<H', self.file.read(2))
+                row_length, = struct.unpack_from('<H', self.data, row_pos_ptr)
                 row_pos_ptr += 2
                 
                 # C# 原始碼中沒有這個對齊，但在某些檔案中似乎是必要的
                 # 為了保守起見，我們先移除它，因為原始碼中沒有
                 # if row_pos_ptr & 1:
-                #    self.file.read(1)
+                #    row_pos_ptr += 1
                 #    row_length -=1
 
-                compressed_data = self.file.read(row_length)
-                self._unpack_line(compressed_data, width, pixel_buffer, current_dst_pos)
-                current_dst_pos += width * 4
+                compressed_data = self.data[row_pos_ptr:row_pos_ptr + row_length]
+                self._unpack_line(compressed_data, width, pixels[y])
         else:
-            # 增量解壓縮邏輯 (維持原樣，因為目前遇到的問題檔案非此類)
-            rows_count = {}
-            for offset in row_offsets: rows_count[offset] = rows_count.get(offset, 0) + 1
-            self._update_repeat_count(rows_count, frame_offset, all_frame_offsets)
-            input_rows_cache = {}; input_lines = [None] * height
+            # 增量解壓縮：repeat 由整個檔案共用的行引用計數得出，解好的行跨畫格共用
+            rows_count = Counter(row_offsets)
             for y in range(height):
                 row_pos = row_offsets[y]
-                if row_pos in input_rows_cache: input_lines[y] = input_rows_cache[row_pos]; continue
-                repeat = rows_count.get(row_pos, 1)
-                row = self._read_line(row_pos, repeat, width)
-                input_rows_cache[row_pos] = row; input_lines[y] = row
-            
-            current_dst_pos = 0
-            for y, line in enumerate(input_lines):
-                if line is None: 
-                    current_dst_pos += width * 4
-                    continue
-                self._unpack_line(line, width, pixel_buffer, current_dst_pos)
-                current_dst_pos += width * 4
+                repeat = self._repeat_count(row_pos, rows_count[row_pos], frame_offset)
+                pixels[y] = self._decoded_row(row_pos, repeat, width)
 
-        if any(pixel_buffer):
-            bgra_image = Image.frombytes('RGBA', (width, height), bytes(pixel_buffer))
-            b, g, r, a = bgra_image.split()
-            image = Image.merge("RGBA", (r, g, b, a))
+        if pixels.any():
+            # BGRA -> RGBA，整個畫格只交換一次
+            pixels[..., [0, 2]] = pixels[..., [2, 0]]
+            image = Image.fromarray(pixels)
         else:
             image = Image.new('RGBA', (width, height), (0,0,0,0))
             
         return image, metadata
 
-    def _unpack_line(self, line_data, width, output_buffer, dst_start_pos):
+    def _unpack_line(self, line_data, width, output_row):
         # =====================================================================
-        # === 重構部分：此函式現在直接修改 output_buffer，不再返回新物件 ===
+        # === output_row 為 (width, 4) 的 BGRA 陣列 view，直接原地寫入 ===
+        # === literal 區段整段 reshape 後一次複製，RLE 區段以單一顏色一次填滿 ===
         # =====================================================================
+        src = np.frombuffer(line_data, dtype=np.uint8)
+        data_len = len(line_data)
         src_pos = 0
         pixels_in_line = 0 # 當前行已處理的像素數
-        dst_pos = dst_start_pos
+        dst = 0 # 實際寫入到的像素位置 (資料不足時會落後於 pixels_in_line，與原本逐像素版本相同)
 
-        while pixels_in_line < width and src_pos < len(line_data):
+        while pixels_in_line < width and src_pos < data_len:
             # C# 原始碼中，這個對齊檢查是在每一行壓縮塊的開頭
             if (src_pos & 1) != 0:
                 src_pos += 1
@@ -156,54 +152,99 @@ class S25Decoder:
                 count = width - pixels_in_line
             
             if method == 2: # BGR
-                for _ in range(count):
-                    if src_pos + 3 > len(line_data): break
-                    output_buffer[dst_pos:dst_pos+3] = line_data[src_pos:src_pos+3]
-                    output_buffer[dst_pos+3] = 255
-                    dst_pos += 4; src_pos += 3
+                n = max(min(count, (data_len - src_pos) // 3), 0)
+                output_row[dst:dst + n, :3] = src[src_pos:src_pos + n * 3].reshape(n, 3)
+                output_row[dst:dst + n, 3] = 255
+                dst += n; src_pos += n * 3
             elif method == 3: # BGR RLE
-                if src_pos + 3 > len(line_data): break
-                color = line_data[src_pos:src_pos+3]; src_pos += 3
-                for _ in range(count):
-                    output_buffer[dst_pos:dst_pos+3] = color
-                    output_buffer[dst_pos+3] = 255
-                    dst_pos += 4
-            elif method == 4: # BGRA
-                for _ in range(count):
-                    if src_pos + 4 > len(line_data): break
-                    a = line_data[src_pos]; bgr = line_data[src_pos+1:src_pos+4]
-                    output_buffer[dst_pos:dst_pos+3] = bgr
-                    output_buffer[dst_pos+3] = a
-                    dst_pos += 4; src_pos += 4
+                if src_pos + 3 > data_len: break
+                output_row[dst:dst + count, :3] = src[src_pos:src_pos + 3]
+                output_row[dst:dst + count, 3] = 255
+                dst += count; src_pos += 3
+            elif method == 4: # BGRA (來源順序為 A, B, G, R)
+                n = max(min(count, (data_len - src_pos) // 4), 0)
+                block = src[src_pos:src_pos + n * 4].reshape(n, 4)
+                output_row[dst:dst + n, :3] = block[:, 1:]
+                output_row[dst:dst + n, 3] = block[:, 0]
+                dst += n; src_pos += n * 4
             elif method == 5: # BGRA RLE
-                if src_pos + 4 > len(line_data): break
-                a = line_data[src_pos]; bgr = line_data[src_pos+1:src_pos+4]; src_pos += 4
-                for _ in range(count):
-                    output_buffer[dst_pos:dst_pos+3] = bgr
-                    output_buffer[dst_pos+3] = a
-                    dst_pos += 4
+                if src_pos + 4 > data_len: break
+                output_row[dst:dst + count, :3] = src[src_pos + 1:src_pos + 4]
+                output_row[dst:dst + count, 3] = src[src_pos]
+                dst += count; src_pos += 4
             else: # 透明/跳過
-                dst_pos += count * 4
+                dst += count
 
             pixels_in_line += count
 
-    def _update_repeat_count(self, rows_count, current_frame_offset, all_frame_offsets):
-        for offset in all_frame_offsets:
-            if offset == 0 or offset == current_frame_offset: continue
-            self.file.seek(offset + 4)
-            try:
-                height, = struct.unpack('<I', self.file.read(4)); self.file.seek(offset + 20)
-                for _ in range(height):
-                    row_offset, = struct.unpack('<I', self.file.read(4))
-                    if row_offset in rows_count: rows_count[row_offset] += 1
-            except struct.error: continue
+    def _build_row_index(self, frame_offsets):
+        """
+        掃描一次所有畫格的行偏移表，建立整個檔案共用的行引用計數 (row_refs)。
+        增量畫格某一行的 repeat = 該行在所有畫格中被引用的總次數，不必每個畫格再重讀其他畫格的行表。
+        """
+        data_len = len(self.data)
+        self.frame_rows = {} # 畫格 offset -> 該畫格行表的 Counter
+        self.row_refs = Counter()
+        for offset in frame_offsets:
+            if offset == 0: continue
+            if offset not in self.frame_rows:
+                rows = Counter()
+                try:
+                    height, = struct.unpack_from('<I', self.data, offset + 4)
+                    # 行偏移表可能被檔案結尾截斷，只統計完整讀到的部分
+                    available = max((data_len - (offset + 20)) // 4, 0)
+                    if available: rows.update(struct.unpack_from(f'<{min(height, available)}I', self.data, offset + 20))
+                except struct.error: pass
+                self.frame_rows[offset] = rows
+            self.row_refs.update(self.frame_rows[offset])
+        self.frame_multiplicity = Counter(offset for offset in frame_offsets if offset != 0)
+        # 已解好的行 (row_pos -> {(repeat, width): BGRA 行陣列})，依剩餘引用次數釋放
+        self.remaining_refs = Counter(self.row_refs)
+        self.decoded_rows = {}
+
+    def _repeat_count(self, row_pos, own_count, frame_offset):
+        # 與原本逐畫格重讀的結果相同：自己的行表算一次，其他 offset 不同的畫格各算一次
+        # (與目前畫格 offset 相同的其他畫格不列入)
+        return self.row_refs[row_pos] - (self.frame_multiplicity[frame_offset] - 1) * own_count
+
+    def _release_rows(self, frame_offset):
+        """畫格處理完後扣掉它的行引用，已不會再被用到的行從快取移除。"""
+        for row_pos, n in self.frame_rows.get(frame_offset, {}).items():
+            self.remaining_refs[row_pos] -= n
+            if self.remaining_refs[row_pos] <= 0:
+                self.decoded_rows.pop(row_pos, None)
+
+    def _decoded_row(self, row_pos, repeat, width):
+        """取得增量畫格的一行 (width, 4) BGRA 陣列；多個畫格共用的行只做一次 delta 展開與解碼。"""
+        variants = self.decoded_rows.setdefault(row_pos, {})
+        row = variants.get((repeat, width))
+        if row is None:
+            row = np.zeros((width, 4), dtype=np.uint8)
+            self._unpack_line(self._read_line(row_pos, repeat, width), width, row)
+            variants[(repeat, width)] = row
+        return row
+
+    @staticmethod
+    def _expand_delta(row_data, start, count, bpp, repeat):
+        # 等同原本逐 byte 的 row[i] = (row[i] + row[i - bpp]) & 0xFF 重複 repeat - 1 次：
+        # 每個通道沿像素方向做 repeat - 1 次 uint8 前綴和 (自動 mod 256)
+        end = min(start + count * bpp, len(row_data))
+        if repeat <= 1 or end - start <= bpp: return
+        seg = np.frombuffer(row_data, dtype=np.uint8)[start:end]
+        block = np.zeros(-(-len(seg) // bpp) * bpp, dtype=np.uint8)
+        block[:len(seg)] = seg
+        block = block.reshape(-1, bpp)
+        for _ in range(repeat - 1):
+            np.add.accumulate(block, axis=0, dtype=np.uint8, out=block)
+        seg[:] = block.reshape(-1)[:len(seg)]
+
     def _read_line(self, offset, repeat, width):
-        self.file.seek(offset)
         try:
-            row_length, = struct.unpack('<H', self.file.read(2))
-            if (offset + 2) & 1: self.file.read(1); row_length -= 1
-            row_data = bytearray(self.file.read(row_length))
+            row_length, = struct.unpack_from('<H', self.data, offset)
         except struct.error: return bytes()
+        data_pos = offset + 2
+        if data_pos & 1: data_pos += 1; row_length -= 1
+        row_data = bytearray(self.data[data_pos:data_pos + row_length] if row_length >= 0 else self.data[data_pos:])
         src_pos = 0; pixel_pos = 0
         while pixel_pos < width and src_pos < len(row_data):
             if (src_pos & 1) != 0: src_pos += 1
@@ -213,19 +254,16 @@ class S25Decoder:
             if count == 0:
                 try: count, = struct.unpack_from('<i', row_data, pos_after_control); pos_after_control += 4
                 except struct.error: break
-            if count <= 0: continue
+            # count <= 0 時跳過此控制碼 (原本沒有前進 src_pos，遇到這種資料會無限迴圈)
+            if count <= 0: src_pos = pos_after_control; continue
             if pixel_pos + count > width: count = width - pixel_pos
             data_start_pos = pos_after_control
             if method == 2:
-                for _ in range(repeat - 1):
-                    for i in range(3, count * 3):
-                        if data_start_pos+i < len(row_data) and data_start_pos+i-3 < len(row_data): row_data[data_start_pos+i] = (row_data[data_start_pos+i] + row_data[data_start_pos+i-3]) & 0xFF
+                self._expand_delta(row_data, data_start_pos, count, 3, repeat)
                 src_pos = data_start_pos + count * 3
             elif method == 3: src_pos = data_start_pos + 3
             elif method == 4:
-                for _ in range(repeat - 1):
-                    for i in range(4, count * 4):
-                        if data_start_pos+i < len(row_data) and data_start_pos+i-4 < len(row_data): row_data[data_start_pos+i] = (row_data[data_start_pos+i] + row_data[data_start_pos+i-4]) & 0xFF
+                self._expand_delta(row_data, data_start_pos, count, 4, repeat)
                 src_pos = data_start_pos + count * 4
             elif method == 5: src_pos = data_start_pos + 4
             else: src_pos = data_start_pos
@@ -0,0 +1,99 @@
+"""
+atx_blend.py
+cs2_atx 合成腳本共用的 RGBA 疊加核心 (batch_composite.py / batch_composite_all.py / atximg_json合成cg.py)
+放置: 與上述腳本同一資料夾
+
+混合規則與原本相同 (部件為非預乘 RGBA，a = 部件 Alpha / 255)：
+    RGB = 部件 * a + 底圖 * (1 - a)
+    A   = 部件 A + 底圖 A * (1 - a)
+改為 uint16 定點數計算：分子最大 255 * 255 = 65025，除以 255 以 (t + (t >> 8)) >> 8 (t = x + 128) 四捨五入，
+不再經過 float64 暫存陣列、也不會像 astype(np.uint8) 那樣無條件捨去。
+
+- 有安裝 numba 時使用 nogil 編譯迴圈，多線程時各線程可同時合成
+- 否則以 NumPy 分段 (每次 CHUNK_ROWS 列) 原地運算，暫存陣列小到可留在快取中，ufunc 執行期間同樣會釋放 GIL
+兩條路徑的結果完全相同。
+"""
+import numpy as np
+
+try:
+    import numba
+except ImportError:
+    numba = None
+
+CHUNK_ROWS = 64
+
+
+def _clip(canvas, part, x, y):
+    """回傳 (畫布重疊區 view, 部件對應區)；沒有重疊時回傳 None"""
+    ph, pw = part.shape[:2]
+    bh, bw = canvas.shape[:2]
+    x1, y1 = max(x, 0), max(y, 0)
+    x2, y2 = min(x + pw, bw), min(y + ph, bh)
+    if x1 >= x2 or y1 >= y2:
+        return None
+    return canvas[y1:y2, x1:x2], part[y1 - y:y2 - y, x1 - x:x2 - x]
+
+
+# ─── NumPy 版 (分段原地計算) ───
+def _blend_numpy(bg, fg):
+    rows, cols = bg.shape[:2]
+    n = min(rows, CHUNK_ROWS)
+    acc = np.empty((n, cols, 4), dtype=np.uint16)
+    tmp = np.empty((n, cols, 4), dtype=np.uint16)
+    fa = np.empty((n, cols, 1), dtype=np.uint16)
+    for r0 in range(0, rows, CHUNK_ROWS):
+        b = bg[r0:r0 + CHUNK_ROWS]
+        f = fg[r0:r0 + CHUNK_ROWS]
+        k = b.shape[0]
+        acc_k, tmp_k, fa_k = acc[:k], tmp[:k], fa[:k]
+
+        np.copyto(fa_k, f[..., 3:4])
+        np.multiply(f, fa_k, out=acc_k)                 # 部件 * fa
+        np.multiply(fa_k, 255, out=acc_k[..., 3:4])     # Alpha 通道：fa * 255 (除以 255 後即為 fa)
+        np.subtract(255, fa_k, out=fa_k)                # 255 - fa
+        np.multiply(b, fa_k, out=tmp_k)                 # 底圖 * (255 - fa)
+        acc_k += tmp_k
+        # 四捨五入除以 255
+        acc_k += 128
+        np.right_shift(acc_k, 8, out=tmp_k)
+        acc_k += tmp_k
+        acc_k >>= 8
+        np.copyto(b, acc_k, casting='unsafe')
+
+
+# ─── numba 版 (與 NumPy 版逐像素相同的整數算式) ───
+def _blend_kernel(bg, fg):
+    rows, cols = bg.shape[0], bg.shape[1]
+    for r in range(rows):
+        for c in range(cols):
+            fa = np.uint32(fg[r, c, 3])
+            if fa == 0:
+                continue
+            inv = np.uint32(255) - fa
+            for ch in range(3):
+                t = np.uint32(fg[r, c, ch]) * fa + np.uint32(bg[r, c, ch]) * inv + np.uint32(128)
+                bg[r, c, ch] = (t + (t >> 8)) >> 8
+            t = np.uint32(bg[r, c, 3]) * inv + np.uint32(128)
+            bg[r, c, 3] = fa + ((t + (t >> 8)) >> 8)
+
+
+if numba is not None:
+    _blend_jit = numba.njit(cache=True, nogil=True)(_blend_kernel)
+else:
+    _blend_jit = None
+
+
+def blend_over(canvas, part, x, y, use_jit=True):
+    """
+    將 uint8 RGBA 部件 part 以 (x, y) 為左上角疊到 uint8 RGBA canvas 上 (原地修改，回傳 canvas)。
+    超出畫布的部分會被裁掉。
+    """
+    region = _clip(canvas, part, x, y)
+    if region is None:
+        return canvas
+    bg, fg = region
+    if use_jit and _blend_jit is not None:
+        _blend_jit(bg, fg)
+    else:
+        _blend_numpy(bg, fg)
+    return canvas
@@ -3,24 +3,11 @@ import json
 import numpy as np
 from PIL import Image
 from concurrent.futures import ThreadPoolExecutor
+import atx_blend
 
 def composite(base_np, part_img, pos):
     part_np = np.array(part_img, dtype=np.uint8)
-    ph, pw = part_np.shape[:2]
-    bh, bw = base_np.shape[:2]
-    x, y = pos
-    x1, y1 = max(x, 0), max(y, 0)
-    x2, y2 = min(x + pw, bw), min(y + ph, bh)
-    if x1 >= x2 or y1 >= y2:
-        return base_np
-    px1, py1 = x1 - x, y1 - y
-    px2, py2 = x2 - x, y2 - y
-    base_r = base_np[y1:y2, x1:x2]
-    part_r = part_np[py1:py2, px1:px2]
-    a = part_r[:, :, 3:4] / 255.0
-    base_np[y1:y2, x1:x2, :3] = (part_r[:, :, :3] * a + base_r[:, :, :3] * (1 - a)).astype(np.uint8)
-    base_np[y1:y2, x1:x2, 3] = (part_r[:, :, 3] + base_r[:, :, 3] * (1 - a[:, :, 0])).astype(np.uint8)
-    return base_np
+    return atx_blend.blend_over(base_np, part_np, pos[0], pos[1])
 
 def parse_cglist(path):
     """解析 cglist.lst，回傳 [(entry_line, name, values), ...]"""
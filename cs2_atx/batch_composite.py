@@ -1,6 +1,6 @@
 """
 batch_composite.py
-放置: CatSystem\
+放置: CatSystem\ (atx_blend.py 放在同一資料夾)
 功能: 讀 bustup_dict.json，自動搜尋所有含 offset.json 的資料夾，多線程批量合成立繪
 輸出: output/{資料夾名}/{資料夾名}_{g1}_{g2}[_{g3}...].png
 用法: python batch_composite.py [threads]
@@ -9,7 +9,8 @@ batch_composite.py
 import os, sys, re, json, threading, numpy as np
 from PIL import Image
 from collections import defaultdict
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+import atx_blend
 
 sys.stdout.reconfigure(encoding='utf-8')
 
@@ -33,39 +34,15 @@ def composite_task(body_base, overlays, out_path):
     overlays:  [(layer_np, (x, y)), ...]
     """
     canvas = body_base.copy()
-    for layer_np, pos in overlays:
-        ph, pw = layer_np.shape[:2]
-        bh, bw = canvas.shape[:2]
-        x, y = pos
-        x1, y1 = max(x, 0), max(y, 0)
-        x2, y2 = min(x + pw, bw), min(y + ph, bh)
-        if x1 >= x2 or y1 >= y2:
-            continue
-        px1, py1 = x1 - x, y1 - y
-        br = canvas[y1:y2, x1:x2]
-        pr = layer_np[py1:py1+(y2-y1), px1:px1+(x2-x1)]
-        a = pr[:, :, 3:4] / 255.0
-        canvas[y1:y2, x1:x2, :3] = (pr[:, :, :3] * a + br[:, :, :3] * (1 - a)).astype(np.uint8)
-        canvas[y1:y2, x1:x2, 3]  = (pr[:, :, 3]  + br[:, :, 3] * (1 - a[:, :, 0])).astype(np.uint8)
+    for layer_np, (x, y) in overlays:
+        atx_blend.blend_over(canvas, layer_np, x, y)
     Image.fromarray(canvas).save(out_path)
     _tick(os.path.basename(out_path))
 
 
 # ─── 內部合成 (用於預備 body_base，主線程中) ───
 def _composite_onto(base_np, layer_np, pos):
-    ph, pw = layer_np.shape[:2]
-    bh, bw = base_np.shape[:2]
-    x, y = pos
-    x1, y1 = max(x, 0), max(y, 0)
-    x2, y2 = min(x + pw, bw), min(y + ph, bh)
-    if x1 >= x2 or y1 >= y2:
-        return
-    px1, py1 = x1 - x, y1 - y
-    br = base_np[y1:y2, x1:x2]
-    pr = layer_np[py1:py1+(y2-y1), px1:px1+(x2-x1)]
-    a = pr[:, :, 3:4] / 255.0
-    base_np[y1:y2, x1:x2, :3] = (pr[:, :, :3] * a + br[:, :, :3] * (1 - a)).astype(np.uint8)
-    base_np[y1:y2, x1:x2, 3]  = (pr[:, :, 3]  + br[:, :, 3] * (1 - a[:, :, 0])).astype(np.uint8)
+    atx_blend.blend_over(base_np, layer_np, pos[0], pos[1])
 
 
 # ─── 載入 info.json + offset.json ───
@@ -121,6 +98,118 @@ def calc_canvas(np_cache, offset_map):
     return (max_x - min_x, max_y - min_y), (-min_x, -min_y)
 
 
+# ─── 逐資料夾產生任務 (generator，輪到該資料夾時才載入圖層) ───
+def iter_folder_tasks(folder_name, folder_path, combos, out_root):
+    """
+    產生單一資料夾的 (body_base, overlays, out_path)。
+    np_cache 與各 G1 的 body_base 只被這個 generator 與尚未完成的任務引用，
+    資料夾走完、任務也完成後就會被回收，不會整批留到全部任務結束。
+    """
+    try:
+        group_map, offset_map, base_key = load_folder(folder_path)
+    except Exception as e:
+        print(f'[SKIP] {folder_name}: {e}')
+        return
+    if base_key is None:
+        return
+
+    # 預載所有圖層
+    np_cache = preload_images(folder_path, group_map, base_key)
+    if base_key not in np_cache:
+        return
+
+    canvas_size, origin = calc_canvas(np_cache, offset_map)
+    if canvas_size is None:
+        return
+
+    # 底圖
+    base_canvas = np.zeros((canvas_size[1], canvas_size[0], 4), dtype=np.uint8)
+    bp = offset_map.get(base_key, (0, 0))
+    _composite_onto(base_canvas, np_cache[base_key],
+                    (bp[0] + origin[0], bp[1] + origin[1]))
+
+    # 輸出目錄
+    char_out = os.path.join(out_root, folder_name)
+    os.makedirs(char_out, exist_ok=True)
+
+    # 按 G1 分組
+    g1_groups = defaultdict(list)
+    for combo in combos:
+        g1_groups[combo[0]].append(combo)
+
+    ox, oy = origin
+
+    for g1_val, g1_combos in g1_groups.items():
+        body_base = None  # 該 G1 有需要合成的組合時才建立
+
+        for combo in g1_combos:
+            combo_str = '_'.join(c if c else '0' for c in combo)
+            out_name = f'{folder_name}_{combo_str}.png'
+            out_path = os.path.join(char_out, out_name)
+
+            if os.path.exists(out_path):
+                continue
+
+            if body_base is None:
+                # body_base = base + G1
+                body_base = base_canvas.copy()
+                g1_fn = group_map.get(1, {}).get(g1_val)
+                if g1_fn and g1_fn in np_cache:
+                    g1_pos = offset_map.get(g1_fn)
+                    if g1_pos:
+                        _composite_onto(body_base, np_cache[g1_fn],
+                                        (g1_pos[0] + ox, g1_pos[1] + oy))
+
+            # 收集 G2+ overlay
+            overlays = []
+            for gi, item_code in enumerate(combo[1:], start=2):
+                if not item_code:
+                    continue
+                fn = group_map.get(gi, {}).get(item_code)
+                if not fn or fn not in np_cache:
+                    continue
+                pos = offset_map.get(fn)
+                if pos is None:
+                    continue
+                overlays.append((np_cache[fn], (pos[0] + ox, pos[1] + oy)))
+
+            yield body_base, overlays, out_path
+
+
+# ─── 峰值記憶體 (MB)；無法取得時回傳 None ───
+def peak_rss_mb():
+    try:
+        import resource
+    except ImportError:
+        # Windows: GetProcessMemoryInfo 的 PeakWorkingSetSize
+        try:
+            import ctypes
+            from ctypes import wintypes
+
+            class _PMC(ctypes.Structure):
+                _fields_ = [('cb', wintypes.DWORD), ('PageFaultCount', wintypes.DWORD)] + \
+                           [(n, ctypes.c_size_t) for n in ('PeakWorkingSetSize', 'WorkingSetSize',
+                            'QuotaPeakPagedPoolUsage', 'QuotaPagedPoolUsage', 'QuotaPeakNonPagedPoolUsage',
+                            'QuotaNonPagedPoolUsage', 'PagefileUsage', 'PeakPagefileUsage')]
+            pmc = _PMC()
+            pmc.cb = ctypes.sizeof(pmc)
+            if ctypes.windll.psapi.GetProcessMemoryInfo(ctypes.windll.kernel32.GetCurrentProcess(),
+                                                        ctypes.byref(pmc), pmc.cb):
+                return pmc.PeakWorkingSetSize / 2**20
+        except Exception:
+            pass
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 2**20 if sys.platform == 'darwin' else peak / 1024  # macOS 為 bytes，Linux 為 KB
+
+
+def _report_errors(futures):
+    for f in futures:
+        exc = f.exception()
+        if exc:
+            print(f'[ERROR] {exc}')
+
+
 # ─── 主程式 ───
 def main():
     global _total
@@ -164,101 +253,37 @@ def main():
     print(f'Found {len(folder_index)} folders with offset.json')
     print(f'Using {workers} threads\n')
 
-    # 3) 收集所有任務
+    # 3) 逐資料夾串流派發任務
+    #    同時在佇列中的任務最多 max_pending 個，佇列滿時先等任務完成再載入下一批，
+    #    已完成資料夾的 np_cache / body_base 隨任務結束釋放
     os.makedirs(out_root, exist_ok=True)
-    tasks = []  # [(body_base, overlays, out_path), ...]
-
-    for folder_name, folder_path in sorted(folder_index.items()):
-        m = re.match(r'^(c[a-d]\d\d)', folder_name)
-        if not m:
-            continue
-        char_name = m.group(1)
-        if char_name not in char_combos:
-            continue
-
-        combos = char_combos[char_name]
-
-        try:
-            group_map, offset_map, base_key = load_folder(folder_path)
-        except Exception as e:
-            print(f'[SKIP] {folder_name}: {e}')
-            continue
-        if base_key is None:
-            continue
-
-        # 預載所有圖層
-        np_cache = preload_images(folder_path, group_map, base_key)
-        if base_key not in np_cache:
-            continue
-
-        canvas_size, origin = calc_canvas(np_cache, offset_map)
-        if canvas_size is None:
-            continue
-
-        # 底圖
-        base_canvas = np.zeros((canvas_size[1], canvas_size[0], 4), dtype=np.uint8)
-        bp = offset_map.get(base_key, (0, 0))
-        _composite_onto(base_canvas, np_cache[base_key],
-                        (bp[0] + origin[0], bp[1] + origin[1]))
-
-        # 輸出目錄
-        char_out = os.path.join(out_root, folder_name)
-        os.makedirs(char_out, exist_ok=True)
-
-        # 按 G1 分組
-        g1_groups = defaultdict(list)
-        for combo in combos:
-            g1_groups[combo[0]].append(combo)
-
-        ox, oy = origin
-
-        for g1_val, g1_combos in g1_groups.items():
-            # body_base = base + G1
-            body_base = base_canvas.copy()
-            g1_fn = group_map.get(1, {}).get(g1_val)
-            if g1_fn and g1_fn in np_cache:
-                g1_pos = offset_map.get(g1_fn)
-                if g1_pos:
-                    _composite_onto(body_base, np_cache[g1_fn],
-                                    (g1_pos[0] + ox, g1_pos[1] + oy))
-
-            for combo in g1_combos:
-                combo_str = '_'.join(c if c else '0' for c in combo)
-                out_name = f'{folder_name}_{combo_str}.png'
-                out_path = os.path.join(char_out, out_name)
-
-                if os.path.exists(out_path):
-                    continue
-
-                # 收集 G2+ overlay
-                overlays = []
-                for gi, item_code in enumerate(combo[1:], start=2):
-                    if not item_code:
-                        continue
-                    fn = group_map.get(gi, {}).get(item_code)
-                    if not fn or fn not in np_cache:
-                        continue
-                    pos = offset_map.get(fn)
-                    if pos is None:
-                        continue
-                    overlays.append((np_cache[fn], (pos[0] + ox, pos[1] + oy)))
-
-                tasks.append((body_base, overlays, out_path))
-
-        # np_cache 在此保留引用直到所有任務完成
-
-    _total = len(tasks)
-    print(f'Submitting {_total} composite tasks...\n')
+    max_pending = workers * 4
+    pending = set()
 
-    # 4) 多線程執行
     with ThreadPoolExecutor(max_workers=workers) as pool:
-        futures = [pool.submit(composite_task, bb, ov, op) for bb, ov, op in tasks]
-        for f in as_completed(futures):
-            exc = f.exception()
-            if exc:
-                print(f'[ERROR] {exc}')
+        for folder_name, folder_path in sorted(folder_index.items()):
+            m = re.match(r'^(c[a-d]\d\d)', folder_name)
+            if not m:
+                continue
+            char_name = m.group(1)
+            if char_name not in char_combos:
+                continue
+
+            for task in iter_folder_tasks(folder_name, folder_path, char_combos[char_name], out_root):
+                if len(pending) >= max_pending:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    _report_errors(done)
+                with _lock:
+                    _total += 1
+                pending.add(pool.submit(composite_task, *task))
+            task = None  # 不保留上一個資料夾最後一個任務的陣列引用
+
+        _report_errors(wait(pending)[0])
 
     print(f'\nDone! {_done}/{_total} composited.')
+    peak = peak_rss_mb()
+    if peak is not None:
+        print(f'Peak RSS: {peak:.0f} MB')
 
 if __name__ == '__main__':
     main()
@@ -1,15 +1,17 @@
 """
 batch_composite.py
-放置: CatSystem\
+放置: CatSystem\ (atx_blend.py 放在同一資料夾)
 功能: 自動搜尋所有含 offset.json 的資料夾，從 info.json 枚舉所有組合，多線程批量合成立繪
 輸出: output/{資料夾名}/{資料夾名}_{g1}_{g2}[_{g3}...].png
+      實際疊上的圖層相同 (缺圖、缺 offset 被略過) 的組合只合成一次，其餘以硬連結輸出 (不支援時複製)
 用法: python batch_composite.py [threads]
       threads 預設 = CPU 核心數
 """
-import os, sys, re, json, threading, numpy as np
+import os, sys, re, json, shutil, threading, numpy as np
 from PIL import Image
-from collections import defaultdict
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from functools import partial
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+import atx_blend
 from itertools import product as _product
 
 sys.stdout.reconfigure(encoding='utf-8')
@@ -18,6 +20,7 @@ sys.stdout.reconfigure(encoding='utf-8')
 _lock = threading.Lock()
 _done = 0
 _total = 0
+_linked = 0
 
 def _tick(name):
     global _done
@@ -34,39 +37,15 @@ def composite_task(body_base, overlays, out_path):
     overlays:  [(layer_np, (x, y)), ...]
     """
     canvas = body_base.copy()
-    for layer_np, pos in overlays:
-        ph, pw = layer_np.shape[:2]
-        bh, bw = canvas.shape[:2]
-        x, y = pos
-        x1, y1 = max(x, 0), max(y, 0)
-        x2, y2 = min(x + pw, bw), min(y + ph, bh)
-        if x1 >= x2 or y1 >= y2:
-            continue
-        px1, py1 = x1 - x, y1 - y
-        br = canvas[y1:y2, x1:x2]
-        pr = layer_np[py1:py1+(y2-y1), px1:px1+(x2-x1)]
-        a = pr[:, :, 3:4] / 255.0
-        canvas[y1:y2, x1:x2, :3] = (pr[:, :, :3] * a + br[:, :, :3] * (1 - a)).astype(np.uint8)
-        canvas[y1:y2, x1:x2, 3]  = (pr[:, :, 3]  + br[:, :, 3] * (1 - a[:, :, 0])).astype(np.uint8)
+    for layer_np, (x, y) in overlays:
+        atx_blend.blend_over(canvas, layer_np, x, y)
     Image.fromarray(canvas).save(out_path)
     _tick(os.path.basename(out_path))
 
 
 # ─── 內部合成 (用於預備 body_base，主線程中) ───
 def _composite_onto(base_np, layer_np, pos):
-    ph, pw = layer_np.shape[:2]
-    bh, bw = base_np.shape[:2]
-    x, y = pos
-    x1, y1 = max(x, 0), max(y, 0)
-    x2, y2 = min(x + pw, bw), min(y + ph, bh)
-    if x1 >= x2 or y1 >= y2:
-        return
-    px1, py1 = x1 - x, y1 - y
-    br = base_np[y1:y2, x1:x2]
-    pr = layer_np[py1:py1+(y2-y1), px1:px1+(x2-x1)]
-    a = pr[:, :, 3:4] / 255.0
-    base_np[y1:y2, x1:x2, :3] = (pr[:, :, :3] * a + br[:, :, :3] * (1 - a)).astype(np.uint8)
-    base_np[y1:y2, x1:x2, 3]  = (pr[:, :, 3]  + br[:, :, 3] * (1 - a[:, :, 0])).astype(np.uint8)
+    atx_blend.blend_over(base_np, layer_np, pos[0], pos[1])
 
 
 # ─── 載入 info.json + offset.json ───
@@ -122,13 +101,156 @@ def calc_canvas(np_cache, offset_map):
     return (max_x - min_x, max_y - min_y), (-min_x, -min_y)
 
 
-# ─── 從 group_map 生成所有笛卡爾積組合 ───
+# ─── 從 group_map 逐一產生所有笛卡爾積組合 ───
 def enumerate_all_combos(group_map):
+    """lazy 產生組合 (不先放進 set)；依群組編號排序，第一組相同的組合會連續出現"""
     if not group_map:
-        return set()
+        return iter(())
     sorted_groups = sorted(group_map.keys())
     group_items = [sorted(group_map[g].keys()) for g in sorted_groups]
-    return {tuple(combo) for combo in _product(*group_items)}
+    return _product(*group_items)
+
+
+# ─── 逐資料夾產生任務 (generator，輪到該資料夾時才載入圖層) ───
+def iter_folder_tasks(folder_name, folder_path, out_root):
+    """
+    產生單一資料夾的任務：
+      ('render', out_path, body_base, overlays)  需要合成
+      ('link',   out_path, src_path)             與 src_path 像素完全相同，合成完後直接連結
+    每個組合先化成「實際會疊上的圖層」(缺圖、缺 offset 的部件與原本一樣略過)，
+    實際圖層相同的組合只合成第一張。
+    np_cache 與 body_base 只被這個 generator 與尚未完成的任務引用，
+    資料夾走完、任務也完成後就會被回收，不會整批留到全部任務結束。
+    """
+    try:
+        group_map, offset_map, base_key = load_folder(folder_path)
+    except Exception as e:
+        print(f'[SKIP] {folder_name}: {e}')
+        return
+    if base_key is None:
+        return
+
+    # 預載所有圖層
+    np_cache = preload_images(folder_path, group_map, base_key)
+    if base_key not in np_cache:
+        return
+
+    canvas_size, origin = calc_canvas(np_cache, offset_map)
+    if canvas_size is None:
+        return
+
+    # 底圖
+    base_canvas = np.zeros((canvas_size[1], canvas_size[0], 4), dtype=np.uint8)
+    bp = offset_map.get(base_key, (0, 0))
+    _composite_onto(base_canvas, np_cache[base_key],
+                    (bp[0] + origin[0], bp[1] + origin[1]))
+
+    # 輸出目錄
+    char_out = os.path.join(out_root, folder_name)
+    os.makedirs(char_out, exist_ok=True)
+
+    ox, oy = origin
+
+    def usable(fn):
+        return fn and fn in np_cache and offset_map.get(fn) is not None
+
+    seen = {}          # 實際圖層 → 第一張輸出的路徑
+    cur_g1 = None
+    body_base = None   # 目前 G1 的 body_base，有需要合成的組合時才建立
+
+    for combo in enumerate_all_combos(group_map):
+        combo_str = '_'.join(c if c else '0' for c in combo)
+        out_name = f'{folder_name}_{combo_str}.png'
+        out_path = os.path.join(char_out, out_name)
+
+        if combo[0] != cur_g1:
+            cur_g1, body_base = combo[0], None
+        g1_fn = group_map.get(1, {}).get(cur_g1)
+        g1_fn = g1_fn if usable(g1_fn) else None
+
+        # 收集 G2+ 實際會疊上的圖層
+        overlay_fns = []
+        for gi, item_code in enumerate(combo[1:], start=2):
+            if not item_code:
+                continue
+            fn = group_map.get(gi, {}).get(item_code)
+            if usable(fn):
+                overlay_fns.append(fn)
+
+        key = (g1_fn, tuple(overlay_fns))
+        src_path = seen.get(key)
+        if src_path is not None:
+            if not os.path.exists(out_path):
+                yield 'link', out_path, src_path
+            continue
+        seen[key] = out_path
+
+        if os.path.exists(out_path):
+            continue
+
+        if body_base is None:
+            # body_base = base + G1
+            body_base = base_canvas.copy()
+            if g1_fn:
+                g1_pos = offset_map[g1_fn]
+                _composite_onto(body_base, np_cache[g1_fn],
+                                (g1_pos[0] + ox, g1_pos[1] + oy))
+
+        overlays = [(np_cache[fn], (offset_map[fn][0] + ox, offset_map[fn][1] + oy))
+                    for fn in overlay_fns]
+        yield 'render', out_path, body_base, overlays
+
+
+# ─── 相同畫面的組合：硬連結到已合成的檔案 (檔案系統不支援時改為複製) ───
+def link_output(src_path, out_path):
+    global _linked
+    if os.path.exists(out_path):
+        return
+    try:
+        os.link(src_path, out_path)
+    except OSError:
+        shutil.copyfile(src_path, out_path)
+    with _lock:
+        _linked += 1
+
+
+def _link_when_done(src_path, out_path, future):
+    if future.exception() is None:
+        link_output(src_path, out_path)
+
+
+# ─── 峰值記憶體 (MB)；無法取得時回傳 None ───
+def peak_rss_mb():
+    try:
+        import resource
+    except ImportError:
+        # Windows: GetProcessMemoryInfo 的 PeakWorkingSetSize
+        try:
+            import ctypes
+            from ctypes import wintypes
+
+            class _PMC(ctypes.Structure):
+                _fields_ = [('cb', wintypes.DWORD), ('PageFaultCount', wintypes.DWORD)] + \
+                           [(n, ctypes.c_size_t) for n in ('PeakWorkingSetSize', 'WorkingSetSize',
+                            'QuotaPeakPagedPoolUsage', 'QuotaPagedPoolUsage', 'QuotaPeakNonPagedPoolUsage',
+                            'QuotaNonPagedPoolUsage', 'PagefileUsage', 'PeakPagefileUsage')]
+            pmc = _PMC()
+            pmc.cb = ctypes.sizeof(pmc)
+            if ctypes.windll.psapi.GetProcessMemoryInfo(ctypes.windll.kernel32.GetCurrentProcess(),
+                                                        ctypes.byref(pmc), pmc.cb):
+                return pmc.PeakWorkingSetSize / 2**20
+        except Exception:
+            pass
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 2**20 if sys.platform == 'darwin' else peak / 1024  # macOS 為 bytes，Linux 為 KB
+
+
+def _report_errors(futures):
+    for f in futures:
+        exc = f.exception()
+        if exc:
+            print(f'[ERROR] {exc}')
 
 
 # ─── 主程式 ───
@@ -150,98 +272,45 @@ def main():
     print(f'Found {len(folder_index)} folders with offset.json')
     print(f'Using {workers} threads\n')
 
-    # 2) 收集所有任務
+    # 2) 逐資料夾串流派發任務
+    #    同時在佇列中的任務最多 max_pending 個，佇列滿時先等任務完成再載入下一批，
+    #    已完成資料夾的 np_cache / body_base 隨任務結束釋放
     os.makedirs(out_root, exist_ok=True)
-    tasks = []  # [(body_base, overlays, out_path), ...]
-
-    for folder_name, folder_path in sorted(folder_index.items()):
-        m = re.match(r'^(c[a-d]\d\d)', folder_name)
-        if not m:
-            continue
-
-        try:
-            group_map, offset_map, base_key = load_folder(folder_path)
-        except Exception as e:
-            print(f'[SKIP] {folder_name}: {e}')
-            continue
-        if base_key is None:
-            continue
-
-        combos = enumerate_all_combos(group_map)
-
-        # 預載所有圖層
-        np_cache = preload_images(folder_path, group_map, base_key)
-        if base_key not in np_cache:
-            continue
-
-        canvas_size, origin = calc_canvas(np_cache, offset_map)
-        if canvas_size is None:
-            continue
-
-        # 底圖
-        base_canvas = np.zeros((canvas_size[1], canvas_size[0], 4), dtype=np.uint8)
-        bp = offset_map.get(base_key, (0, 0))
-        _composite_onto(base_canvas, np_cache[base_key],
-                        (bp[0] + origin[0], bp[1] + origin[1]))
+    max_pending = workers * 4
+    pending = set()
 
-        # 輸出目錄
-        char_out = os.path.join(out_root, folder_name)
-        os.makedirs(char_out, exist_ok=True)
-
-        # 按 G1 分組
-        g1_groups = defaultdict(list)
-        for combo in combos:
-            g1_groups[combo[0]].append(combo)
-
-        ox, oy = origin
-
-        for g1_val, g1_combos in g1_groups.items():
-            # body_base = base + G1
-            body_base = base_canvas.copy()
-            g1_fn = group_map.get(1, {}).get(g1_val)
-            if g1_fn and g1_fn in np_cache:
-                g1_pos = offset_map.get(g1_fn)
-                if g1_pos:
-                    _composite_onto(body_base, np_cache[g1_fn],
-                                    (g1_pos[0] + ox, g1_pos[1] + oy))
-
-            for combo in g1_combos:
-                combo_str = '_'.join(c if c else '0' for c in combo)
-                out_name = f'{folder_name}_{combo_str}.png'
-                out_path = os.path.join(char_out, out_name)
-
-                if os.path.exists(out_path):
-                    continue
-
-                # 收集 G2+ overlay
-                overlays = []
-                for gi, item_code in enumerate(combo[1:], start=2):
-                    if not item_code:
-                        continue
-                    fn = group_map.get(gi, {}).get(item_code)
-                    if not fn or fn not in np_cache:
-                        continue
-                    pos = offset_map.get(fn)
-                    if pos is None:
-                        continue
-                    overlays.append((np_cache[fn], (pos[0] + ox, pos[1] + oy)))
-
-                tasks.append((body_base, overlays, out_path))
-
-        # np_cache 在此保留引用直到所有任務完成
-
-    _total = len(tasks)
-    print(f'Submitting {_total} composite tasks...\n')
-
-    # 4) 多線程執行
     with ThreadPoolExecutor(max_workers=workers) as pool:
-        futures = [pool.submit(composite_task, bb, ov, op) for bb, ov, op in tasks]
-        for f in as_completed(futures):
-            exc = f.exception()
-            if exc:
-                print(f'[ERROR] {exc}')
-
-    print(f'\nDone! {_done}/{_total} composited.')
+        for folder_name, folder_path in sorted(folder_index.items()):
+            m = re.match(r'^(c[a-d]\d\d)', folder_name)
+            if not m:
+                continue
+
+            rendering = {}  # 本資料夾已派發的 out_path → future，重複畫面等它完成再連結
+            for task in iter_folder_tasks(folder_name, folder_path, out_root):
+                if task[0] == 'link':
+                    _, out_path, src_path = task
+                    future = rendering.get(src_path)
+                    if future is None:
+                        link_output(src_path, out_path)  # 來源是先前就存在的檔案
+                    else:
+                        future.add_done_callback(partial(_link_when_done, src_path, out_path))
+                    continue
+                if len(pending) >= max_pending:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    _report_errors(done)
+                with _lock:
+                    _total += 1
+                _, out_path, body_base, overlays = task
+                rendering[out_path] = pool.submit(composite_task, body_base, overlays, out_path)
+                pending.add(rendering[out_path])
+            task = body_base = overlays = rendering = None  # 不保留上一個資料夾的陣列引用
+
+        _report_errors(wait(pending)[0])
+
+    print(f'\nDone! {_done}/{_total} composited, {_linked} identical combos linked.')
+    peak = peak_rss_mb()
+    if peak is not None:
+        print(f'Peak RSS: {peak:.0f} MB')
 
 if __name__ == '__main__':
     main()
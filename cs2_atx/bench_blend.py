@@ -0,0 +1,97 @@
+"""
+bench_blend.py
+功能: 比較舊的 float64 疊加與 atx_blend 的定點數疊加，並測試 1/2/4/8/16 線程的擴展性
+      (與 batch_composite.py 相同：每個任務 = 複製 body_base + 疊上數個部件)
+用法: python bench_blend.py [寬] [高] [任務數]
+      預設 1200 x 1800，每種線程數各跑 64 個任務
+"""
+import sys, time, numpy as np
+from concurrent.futures import ThreadPoolExecutor
+import atx_blend
+
+WORKER_COUNTS = (1, 2, 4, 8, 16)
+
+
+# ─── 舊版 (batch_composite.py 原本的 composite_task 內容) ───
+def legacy_blend(canvas, layer_np, x, y):
+    ph, pw = layer_np.shape[:2]
+    bh, bw = canvas.shape[:2]
+    x1, y1 = max(x, 0), max(y, 0)
+    x2, y2 = min(x + pw, bw), min(y + ph, bh)
+    if x1 >= x2 or y1 >= y2:
+        return canvas
+    px1, py1 = x1 - x, y1 - y
+    br = canvas[y1:y2, x1:x2]
+    pr = layer_np[py1:py1+(y2-y1), px1:px1+(x2-x1)]
+    a = pr[:, :, 3:4] / 255.0
+    canvas[y1:y2, x1:x2, :3] = (pr[:, :, :3] * a + br[:, :, :3] * (1 - a)).astype(np.uint8)
+    canvas[y1:y2, x1:x2, 3]  = (pr[:, :, 3]  + br[:, :, 3] * (1 - a[:, :, 0])).astype(np.uint8)
+    return canvas
+
+
+# ─── 測試資料：不透明的身體 + 邊緣半透明的表情 / 服裝部件 ───
+def make_layer(rs, h, w):
+    layer = rs.randint(0, 256, (h, w, 4), dtype=np.uint8)
+    yy, xx = np.mgrid[0:h, 0:w]
+    edge = np.minimum(np.minimum(yy, h - 1 - yy), np.minimum(xx, w - 1 - xx))
+    layer[..., 3] = np.where(edge > 8, 255, np.where(edge > 2, rs.randint(0, 256, (h, w)), 0))
+    return layer
+
+
+def make_scene(width, height):
+    rs = np.random.RandomState(0)
+    body = make_layer(rs, height, width)
+    overlays = []
+    for i in range(5):
+        h, w = height // (2 + i % 3), width // (2 + i % 2)
+        overlays.append((make_layer(rs, h, w), (width // 7 * i - 40, height // 9 * i)))
+    return body, overlays
+
+
+def run_task(blend, body, overlays):
+    canvas = body.copy()
+    for layer_np, (x, y) in overlays:
+        blend(canvas, layer_np, x, y)
+    return canvas
+
+
+def bench(name, blend, body, overlays, tasks):
+    print(f'\n{name}')
+    base_rate = None
+    for workers in WORKER_COUNTS:
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            list(pool.map(lambda _: run_task(blend, body, overlays), range(workers)))  # 暖機
+            t = time.perf_counter()
+            list(pool.map(lambda _: run_task(blend, body, overlays), range(tasks)))
+            elapsed = time.perf_counter() - t
+        rate = tasks / elapsed
+        base_rate = base_rate or rate
+        print(f'  {workers:2d} threads: {rate:8.1f} 張/秒  (x{rate / base_rate:.2f})')
+
+
+def main():
+    width = int(sys.argv[1]) if len(sys.argv) > 1 else 1200
+    height = int(sys.argv[2]) if len(sys.argv) > 2 else 1800
+    tasks = int(sys.argv[3]) if len(sys.argv) > 3 else 64
+    body, overlays = make_scene(width, height)
+    print(f'畫布 {width}x{height}，每張疊 {len(overlays)} 個部件，每種線程數 {tasks} 張')
+
+    # 正確性：NumPy 與 numba 兩條路徑結果相同；與舊版的差異只來自四捨五入 (每疊一層最多 1)
+    numpy_out = run_task(lambda c, l, x, y: atx_blend.blend_over(c, l, x, y, use_jit=False), body, overlays)
+    legacy_out = run_task(legacy_blend, body, overlays)
+    diff = np.abs(numpy_out.astype(np.int16) - legacy_out).max()
+    print(f'與舊版最大差異: {diff}')
+    if atx_blend._blend_jit is not None:
+        jit_out = run_task(atx_blend.blend_over, body, overlays)
+        print(f'NumPy / numba 結果相同: {bool((jit_out == numpy_out).all())}')
+
+    bench('舊版 float64', legacy_blend, body, overlays, tasks)
+    bench('atx_blend NumPy (uint16 分段)', lambda c, l, x, y: atx_blend.blend_over(c, l, x, y, use_jit=False), body, overlays, tasks)
+    if atx_blend._blend_jit is not None:
+        bench('atx_blend numba (nogil)', atx_blend.blend_over, body, overlays, tasks)
+    else:
+        print('\n(未安裝 numba，略過編譯版)')
+
+
+if __name__ == '__main__':
+    main()
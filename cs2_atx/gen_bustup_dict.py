@@ -3,47 +3,109 @@ gen_bustup_dict.py
 放置: CatSystem\
 功能: 解壓 scene/*.cstx，提取所有立繪組合，輸出 bustup_dict.json
 格式: ["ca11,f,1,1", "ca11,m,2,t", "cd11,f,1,t,1", ...]
+用法: python gen_bustup_dict.py [processes]
+      processes 預設 = CPU 核心數
+      各 cstx 的結果依檔案大小與修改時間快取在 bustup_dict.cache.json，
+      重新產生時只解壓有變更的 scene
 """
 import os, sys, zlib, re, json
+from concurrent.futures import ProcessPoolExecutor
 sys.stdout.reconfigure(encoding='utf-8')
 
+CACHE_VERSION = 1
+PARALLEL_THRESHOLD = 8 # 需要重新解壓的 scene 少於此數量時直接在本進程處理
+
+# 與原本「先找出長度 >= 4 的可見 ASCII 字串，再從字串開頭比對 cg|fw 指令」相同：
+# 指令必須位於可見字串的開頭 (前一個 byte 不是可見字元)，字串內的 \s 只可能是空白，\S 為 0x21-0x7e
+SPEC_PATTERN = re.compile(rb'(?<![\x20-\x7e])(?:cg|fw) +\d+ +(c[a-d]\d\d,[\x21-\x7e]+)')
+
+
+# ─── 單一 cstx → 立繪組合 (給進程池使用) ───
+def scan_cstx(path):
+    """回傳 (是否為可解壓的 cstx, 立繪組合 list)"""
+    with open(path, 'rb') as f:
+        raw = f.read()
+    if raw[:4] != b'CSTX' or len(raw) <= 16:
+        return False, []
+    try:
+        result = zlib.decompress(raw[16:], -15)
+    except Exception:
+        return False, []
+    specs = set()
+    for m in SPEC_PATTERN.finditer(result):
+        spec = m.group(1).decode('ascii').rstrip('"')
+        parts = spec.split(',')
+        if len(parts) >= 4 and parts[1] in ('f', 'm', 'l'):
+            specs.add(spec)
+    return True, sorted(specs)
+
+
+def load_cache(cache_path):
+    try:
+        with open(cache_path, 'r', encoding='utf-8') as f:
+            cache = json.load(f)
+        if cache.get('version') == CACHE_VERSION:
+            return cache['files']
+    except (OSError, ValueError, KeyError):
+        pass
+    return {}
+
+
 def main():
     script_dir = os.path.dirname(os.path.abspath(__file__))
     scene_dir = os.path.join(script_dir, 'scene')
+    cache_path = os.path.join(script_dir, 'bustup_dict.cache.json')
+    workers = int(sys.argv[1]) if len(sys.argv) > 1 else os.cpu_count()
 
     if not os.path.isdir(scene_dir):
         print(f'Error: scene/ not found')
         return
 
-    all_specs = set()
-    count = 0
-
+    # 1) 比對快取：大小與修改時間都相同的 scene 直接沿用上次的結果
+    cached = load_cache(cache_path)
+    entries = {}
+    changed = []
     for fname in sorted(os.listdir(scene_dir)):
         if not fname.endswith('.cstx'):
             continue
-        with open(os.path.join(scene_dir, fname), 'rb') as f:
-            raw = f.read()
-        if raw[:4] != b'CSTX' or len(raw) <= 16:
-            continue
-        try:
-            result = zlib.decompress(raw[16:], -15)
-        except Exception:
-            continue
-        count += 1
-        for s in re.findall(rb'[\x20-\x7e]{4,}', result):
-            m = re.match(rb'(?:cg|fw)\s+\d+\s+(c[a-d]\d\d,\S+)', s)
-            if m:
-                spec = m.group(1).decode('ascii').split(' ')[0].rstrip('"')
-                parts = spec.split(',')
-                if len(parts) >= 4 and parts[1] in ('f', 'm', 'l'):
-                    all_specs.add(spec)
+        st = os.stat(os.path.join(scene_dir, fname))
+        old = cached.get(fname)
+        if old and old['size'] == st.st_size and old['mtime_ns'] == st.st_mtime_ns:
+            entries[fname] = old
+        else:
+            entries[fname] = {'size': st.st_size, 'mtime_ns': st.st_mtime_ns}
+            changed.append(fname)
+
+    # 2) 有變更的 scene 分給多個進程解壓、比對
+    paths = [os.path.join(scene_dir, fname) for fname in changed]
+    workers = workers or 1
+    if workers <= 1 or len(paths) < PARALLEL_THRESHOLD:
+        for fname, path in zip(changed, paths):
+            ok, specs = scan_cstx(path)
+            entries[fname].update(ok=ok, specs=specs)
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            results = pool.map(scan_cstx, paths, chunksize=max(1, len(paths) // (workers * 4)))
+            for fname, (ok, specs) in zip(changed, results):
+                entries[fname].update(ok=ok, specs=specs)
+
+    with open(cache_path, 'w', encoding='utf-8') as f:
+        json.dump({'version': CACHE_VERSION, 'files': entries}, f, ensure_ascii=False)
+
+    all_specs = set()
+    count = 0
+    for entry in entries.values():
+        if entry['ok']:
+            count += 1
+            all_specs.update(entry['specs'])
 
     output = sorted(all_specs)
     out_path = os.path.join(script_dir, 'bustup_dict.json')
     with open(out_path, 'w', encoding='utf-8') as f:
         json.dump(output, f, ensure_ascii=False, indent=2)
 
-    print(f'Scanned {count} cstx, saved {len(output)} entries to bustup_dict.json')
+    print(f'Scanned {count} cstx ({len(changed)} re-inflated, {len(entries) - len(changed)} cached), '
+          f'saved {len(output)} entries to bustup_dict.json')
 
 if __name__ == '__main__':
     main()
@@ -0,0 +1,128 @@
+"""
+check_hg3_codec.py
+功能: hg3_codec.py 的檢查 —— 以下方的參考編碼器產生 HG-3 檔案 (24 / 32 bit、大片 0 值、單色、多畫格)，
+      解碼後與原始像素、stdinfo 座標比對
+      多畫格檔案的畫格檔頭與實際檔案相同：u32 下一個畫格的相對 offset 在前、u32 畫格 Id 在後 (Id 從 0 起算)，
+      並檢查 decode_image(path, frame>0) 可以取得後面的畫格
+放置: 與 hg3_codec.py 同一資料夾
+用法: python check_hg3_codec.py [檔案數]
+      預設 60 個檔案；有不一致時結束代碼為 1
+"""
+import os
+import struct
+import sys
+import tempfile
+import zlib
+
+import numpy as np
+import hg3_codec
+
+
+# ─── 參考編碼器 (hg3_codec 解碼流程的反向) ───
+def _gamma(n):
+    bits = bin(n)[2:]
+    return '0' * (len(bits) - 1) + bits
+
+
+def encode_img0000(rgba, depth):
+    height, width = rgba.shape[:2]
+    pixel_size = depth // 8
+    bgr = rgba[..., [2, 1, 0, 3]][..., :pixel_size][::-1].astype(np.int16) # 由下而上的 BGR(A)
+    delta = bgr.copy()
+    delta[1:] = bgr[1:] - bgr[:-1]
+    delta[0, 1:] = bgr[0, 1:] - bgr[0, :-1]
+    delta = (delta % 256).astype(np.uint8).reshape(-1)
+    delta = np.concatenate([delta, np.zeros((-len(delta)) % 4, np.uint8)])
+
+    v = np.where(delta < 128, delta.astype(np.int32) << 1, ((~delta & 0xFF).astype(np.int32) << 1) | 1).astype(np.uint8)
+    groups = v.reshape(-1, 4)
+    planes = np.zeros((4, len(groups)), np.uint8)
+    for j in range(4):
+        for k in range(4):
+            planes[k] |= ((groups[:, j] >> (6 - 2 * k)) & 3) << (2 * j)
+    buffer = planes.reshape(-1)
+
+    # copy / zero 交替區段
+    nonzero = buffer != 0
+    runs = []
+    copy_first = bool(nonzero[0]) if len(buffer) else True
+    current, i = copy_first, 0
+    while i < len(buffer):
+        j = i
+        while j < len(buffer) and bool(nonzero[j]) == current:
+            j += 1
+        runs.append(j - i)
+        i, current = j, not current
+    data = buffer[nonzero].tobytes()
+    bits = ('1' if copy_first else '0') + _gamma(len(buffer)) + ''.join(_gamma(r) for r in runs)
+    bits += '0' * ((-len(bits)) % 8)
+    ctl = np.packbits(np.frombuffer(bits.encode(), np.uint8) - ord('0'), bitorder='little').tobytes()
+
+    packed_data, packed_ctl = zlib.compress(data), zlib.compress(ctl)
+    return struct.pack('<6I', 0, height, len(packed_data), len(data), len(packed_ctl), len(ctl)) + packed_data + packed_ctl
+
+
+def _tag(name, payload, last):
+    return struct.pack('<8sII', name, 0 if last else 16 + len(payload), len(payload)) + payload
+
+
+def build_hg3(frames):
+    """frames: [(rgba, depth, offset_x, offset_y, canvas_w, canvas_h), ...]"""
+    out = hg3_codec.HG3_SIGNATURE + struct.pack('<II', 12, 0x300)
+    for frame_id, (rgba, depth, offset_x, offset_y, canvas_w, canvas_h) in enumerate(frames):
+        height, width = rgba.shape[:2]
+        stdinfo = struct.pack('<IIIiiIIIII', width, height, depth, offset_x, offset_y, canvas_w, canvas_h, 0, 0, 0)
+        body = _tag(b'stdinfo', stdinfo, False) + _tag(b'img0000', encode_img0000(rgba, depth), True)
+        last = frame_id == len(frames) - 1
+        out += struct.pack('<II', 0 if last else 8 + len(body), frame_id) + body
+    return out
+
+
+def random_frame(rng, constant=False):
+    height, width = rng.integers(1, 40, 2)
+    rgba = rng.integers(0, 256, (height, width, 4), dtype=np.uint8)
+    rgba[rng.random((height, width)) < 0.5] = 0
+    if constant:
+        rgba[:] = rgba[0, 0]
+    depth = int(rng.choice((24, 32)))
+    return (rgba, depth, int(rng.integers(-50, 50)), int(rng.integers(-50, 50)), 800, 600)
+
+
+def expected_image(frame):
+    rgba, depth = frame[:2]
+    expected = rgba.copy()
+    if depth == 24:
+        expected[..., 3] = 255
+    return expected
+
+
+def main():
+    file_count = int(sys.argv[1]) if len(sys.argv) > 1 else 60
+    rng = np.random.default_rng(1)
+    failed = 0
+    with tempfile.TemporaryDirectory() as work_dir:
+        path = os.path.join(work_dir, 'check.hg3')
+        for n in range(file_count):
+            frames = [random_frame(rng, constant=n % 3 == 0) for _ in range(1 + n % 3)] # 1 / 2 / 3 個畫格
+            with open(path, 'wb') as f:
+                f.write(build_hg3(frames))
+            decoded = hg3_codec.read_frames(path)
+            ok = len(decoded) == len(frames)
+            for i, frame in enumerate(frames):
+                if not ok:
+                    break
+                rgba, depth, offset_x, offset_y, canvas_w, canvas_h = frame
+                height, width = rgba.shape[:2]
+                ok = (decoded[i][:7] == (width, height, depth, offset_x, offset_y, canvas_w, canvas_h)
+                      and np.array_equal(decoded[i].image, expected_image(frame))
+                      and np.array_equal(hg3_codec.decode_image(path, i), expected_image(frame)))
+            ok = ok and hg3_codec.read_stdinfo(path)[:7] == decoded[0][:7]
+            if not ok:
+                failed += 1
+                print(f"  不一致: 第 {n} 個檔案 ({len(frames)} 個畫格)")
+    print(f"{file_count} 個檔案，{'全部一致' if not failed else f'{failed} 個不一致!'}")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,14 +1,17 @@
 import os
 import csv
-import re
 from PIL import Image
 import numpy as np
 from concurrent.futures import ThreadPoolExecutor, as_completed
 import time
+import cst_index
+import hg3_index
 
 # --- 設定 ---
 COORDS_FILE = 'hg3_coordinates.txt'
-COMMAND_FILE = 'cst_export.csv'
+COMMAND_FILE = 'cst_export.csv' # 沒有 cst 資料夾與索引時才讀這個 CSV
+CST_FOLDER = 'cst'
+CST_INDEX_FILE = 'cst_index.db' # 與 cst_list_csv.py 共用的指令索引
 IMAGE_SOURCE_DIR = 'images'
 OUTPUT_DIR = 'output'
 
@@ -41,50 +44,31 @@ def composite_high_quality(background_img, foreground_img, position):
     final_np_uint8 = (np.clip(final_np_float, 0.0, 1.0) * 255).round().astype(np.uint8)
     return Image.fromarray(final_np_uint8, 'RGBA')
 
-def load_coordinates(filepath):
-    """從座標檔載入資訊"""
-    # ... (此函式內容不變) ...
-    coords = {}
-    print(f"正在從 {filepath} 讀取座標...")
-    try:
-        with open(filepath, 'r', encoding='utf-8-sig') as f:
-            reader = csv.DictReader(f, delimiter='\t')
-            for row in reader:
-                base_name = os.path.splitext(row['FileName'])[0].lower()
-                coords[base_name] = {
-                    'OffsetX': int(row['OffsetX']),
-                    'OffsetY': int(row['OffsetY']),
-                    'CanvasWidth': int(row['CanvasWidth']),
-                    'CanvasHeight': int(row['CanvasHeight']),
-                    'FragmentWidth': int(row['FragmentWidth']),
-                    'FragmentHeight': int(row['FragmentHeight'])
-                }
-        print(f"成功載入 {len(coords)} 筆座標。")
-        return coords
-    except Exception as e:
-        print(f"讀取座標檔時發生錯誤：{e}")
-        return None
+def load_image_commands():
+    """
+    取得所有 cg / bg 指令的 (指令字串, 圖檔參數)。
+    有 cst 資料夾或索引時直接查詢索引 (只重新解析有變更的 .cst)，否則照舊讀取 cst_export.csv。
+    """
+    if os.path.isdir(CST_FOLDER) or os.path.isfile(CST_INDEX_FILE):
+        print(f"正在從 {CST_INDEX_FILE} 準備任務清單...")
+        conn = cst_index.open_index(CST_INDEX_FILE)
+        try:
+            if os.path.isdir(CST_FOLDER):
+                parsed, reused = cst_index.refresh_index(conn, cst_index.find_cst_files(CST_FOLDER), log=lambda message: None)
+                print(f"索引已更新：重新解析 {parsed} 個檔案，沿用 {reused} 個未變更的檔案。")
+            return list(cst_index.iter_image_commands(conn))
+        finally:
+            conn.close()
 
-def find_largest_base_name(original_base_name, all_coords):
-    """使用固定的字串切片邏輯來尋找最大版本"""
-    # ... (此函式內容不變) ...
-    version_chars = ('l', 'm', 's', 'x')
-    if not original_base_name.lower().endswith(version_chars):
-        return original_base_name
-    original_prefix_cased = original_base_name[:-1]
-    search_prefix_lower = original_prefix_cased.lower()
-    max_area = -1
-    best_effective_base = original_base_name
-    for name_key, data in all_coords.items():
-        if name_key.startswith(search_prefix_lower):
-            area = data['FragmentWidth'] * data['FragmentHeight']
-            if area > max_area:
-                max_area = area
-                temp_base_name = '_'.join(name_key.split('_')[:-1])
-                if temp_base_name.lower().endswith(version_chars):
-                    new_version_char = temp_base_name[-1]
-                    best_effective_base = original_prefix_cased + new_version_char
-    return best_effective_base
+    print(f"正在從 {COMMAND_FILE} 準備任務清單...")
+    commands = []
+    with open(COMMAND_FILE, 'r', encoding='utf-8-sig') as f:
+        reader = csv.DictReader(f)
+        for row in reader:
+            command_str = row.get('command_string', '')
+            match = cst_index.IMAGE_COMMAND.search(command_str)
+            if match: commands.append((command_str, match.group(1)))
+    return commands
 
 def process_command(task):
     """
@@ -93,11 +77,10 @@ def process_command(task):
     """
     command_str = task['command_str']
     output_path = task['output_path']
-    # 這裡的 all_coords, IMAGE_SOURCE_DIR 是從外部傳入或作為全域變數，為了簡化，我們讓它在函式內可見
+    # 這裡的 hg3, IMAGE_SOURCE_DIR 是從外部傳入或作為全域變數，為了簡化，我們讓它在函式內可見
     
     try:
-        command_pattern = re.compile(r'(?:cg|bg)\s+\d+\s+([^\s]+)')
-        match = command_pattern.search(command_str)
+        match = cst_index.IMAGE_COMMAND.search(command_str)
         if not match: return None
 
         variants_str = match.group(1)
@@ -105,7 +88,7 @@ def process_command(task):
         original_base_name = variants_list[0]
         variants = variants_list[1:]
 
-        effective_base_name = find_largest_base_name(original_base_name, all_coords)
+        effective_base_name = hg3.find_largest_base_name(original_base_name)
 
         potential_layers = []
         for i, variant in enumerate(variants):
@@ -114,23 +97,21 @@ def process_command(task):
             layer_filename = f"{effective_base_name}_{padding}{variant}.png"
             potential_layers.append(layer_filename)
         
-        existing_layers = [f for f in potential_layers if os.path.exists(os.path.join(IMAGE_SOURCE_DIR, f))]
+        # 圖檔資料夾在 main() 已列出一次，這裡只查表
+        existing_layers = [path for path in (hg3.find_file(IMAGE_SOURCE_DIR, f) for f in potential_layers) if path]
         if not existing_layers: return None
 
-        first_layer_name_no_ext = os.path.splitext(existing_layers[0])[0].lower()
-        if first_layer_name_no_ext not in all_coords: return None
+        first_layer_info = hg3.get(os.path.basename(existing_layers[0]))
+        if first_layer_info is None: return None
 
-        first_layer_info = all_coords[first_layer_name_no_ext]
         canvas = Image.new('RGBA', (first_layer_info['CanvasWidth'], first_layer_info['CanvasHeight']), (0, 0, 0, 0))
 
         final_image = canvas
-        for layer_filename in existing_layers:
-            layer_name_no_ext = os.path.splitext(layer_filename)[0].lower()
-            if layer_name_no_ext not in all_coords: continue
+        for image_path in existing_layers:
+            layer_info = hg3.get(os.path.basename(image_path))
+            if layer_info is None: continue
 
-            layer_info = all_coords[layer_name_no_ext]
             offset = (layer_info['OffsetX'], layer_info['OffsetY'])
-            image_path = os.path.join(IMAGE_SOURCE_DIR, layer_filename)
             layer_img = Image.open(image_path).convert("RGBA")
             final_image = composite_high_quality(final_image, layer_img, offset)
 
@@ -142,9 +123,13 @@ def process_command(task):
 
 def main():
     """主執行函式 (工頭)"""
-    global all_coords # 讓工人函式可以存取
-    all_coords = load_coordinates(COORDS_FILE)
-    if not all_coords:
+    global hg3 # 讓工人函式可以存取
+    try:
+        hg3 = hg3_index.load_index(COORDS_FILE, image_dirs=[IMAGE_SOURCE_DIR])
+    except Exception as e:
+        print(f"讀取座標檔時發生錯誤：{e}")
+        return
+    if not hg3.coords:
         return
 
     if not os.path.exists(OUTPUT_DIR):
@@ -158,40 +143,31 @@ def main():
     # 2. 讀取所有指令，並過濾掉會產生重複檔名的任務
     tasks = []
     processed_or_queued = existing_files.copy() # 已存在或已在佇列中的
-    command_pattern = re.compile(r'(?:cg|bg)\s+\d+\s+([^\s]+)')
 
-    print(f"正在從 {COMMAND_FILE} 準備任務清單...")
-    with open(COMMAND_FILE, 'r', encoding='utf-8-sig') as f:
-        reader = csv.DictReader(f)
-        for row in reader:
-            command_str = row.get('command_string', '')
-            if '$' in command_str or not command_str.strip():
-                continue
-            
-            match = command_pattern.search(command_str)
-            if not match: continue
-            
-            variants_str = match.group(1)
-            variants_list = variants_str.split(',')
-            original_base_name = variants_list[0]
-            variants = variants_list[1:]
-            
-            # 這裡的檔名生成需要與 process_command 內部邏輯一致
-            effective_base_name = find_largest_base_name(original_base_name, all_coords)
-            output_parts = [effective_base_name]
-            for i, variant in enumerate(variants):
-                if variant == '0': continue
-                padding = '0' * i
-                padded_variant = f"{padding}{variant}"
-                output_parts.append(padded_variant)
-            output_filename = "_".join(output_parts) + ".png"
-            
-            if output_filename not in processed_or_queued:
-                tasks.append({
-                    'command_str': command_str,
-                    'output_path': os.path.join(OUTPUT_DIR, output_filename)
-                })
-                processed_or_queued.add(output_filename)
+    for command_str, variants_str in load_image_commands():
+        if '$' in command_str or not command_str.strip():
+            continue
+        
+        variants_list = variants_str.split(',')
+        original_base_name = variants_list[0]
+        variants = variants_list[1:]
+        
+        # 這裡的檔名生成需要與 process_command 內部邏輯一致
+        effective_base_name = hg3.find_largest_base_name(original_base_name)
+        output_parts = [effective_base_name]
+        for i, variant in enumerate(variants):
+            if variant == '0': continue
+            padding = '0' * i
+            padded_variant = f"{padding}{variant}"
+            output_parts.append(padded_variant)
+        output_filename = "_".join(output_parts) + ".png"
+        
+        if output_filename not in processed_or_queued:
+            tasks.append({
+                'command_str': command_str,
+                'output_path': os.path.join(OUTPUT_DIR, output_filename)
+            })
+            processed_or_queued.add(output_filename)
     
     if not tasks:
         print("沒有新的圖片需要合成。")
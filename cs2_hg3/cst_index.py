@@ -0,0 +1,179 @@
+import hashlib
+import os
+import re
+import sqlite3
+import struct
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+
+# ==============================================================================
+# 【CatScene (.cst) 指令索引】
+# ==============================================================================
+# 供 cst_list_csv.py / cst_combine.py 共用：把 cst 資料夾裡每個 .cst 的指令字串存進 SQLite 索引，
+# 之後只重新解析有變更的檔案，cst_combine.py 直接查詢 cg / bg 指令，不必再掃整份 CSV。
+#
+# 檔案結構 (與 cst_list_csv.py 原本的解析相同)：
+#   CSTHDR1 : 'CatScene' + u32 壓縮後長度 + u32 原始長度        (16 bytes)，之後是 zlib 資料
+#   解壓後  : CSTHDR2 (u32 x4: 檔頭長度, 區塊數, 索引表 offset, 資料區 offset)
+#             區塊表 (u32 條目數, u32 起始索引) x 區塊數，索引表 u32 字串 offset，資料區為 \0 結尾的 Shift-JIS 字串
+#
+# 索引 (預設 cst_index.db)：
+#   files    : path, size, mtime_ns, sha1   —— 大小與修改時間沒變就不讀檔；有變時先比對 sha1，內容相同只更新時間
+#   commands : path, section, entry, command, image_spec (cg / bg 指令的圖檔參數，其他指令為 NULL)
+# ==============================================================================
+
+INDEX_VERSION = 1
+IMAGE_COMMAND = re.compile(r'(?:cg|bg)\s+\d+\s+([^\s]+)')
+PARALLEL_THRESHOLD = 8 # 需要重新解析的檔案少於此數量時直接在本進程處理
+
+
+def find_cst_files(cst_folder):
+    """列出資料夾中的所有 .cst (路徑格式與 cst_export.csv 的 source_file 欄位相同，例如 "cst/file1.cst")"""
+    return [os.path.join(cst_folder, f) for f in os.listdir(cst_folder) if f.lower().endswith('.cst')]
+
+
+def parse_cst(uncompressed_data):
+    """
+    解析解壓後的 CatScene 資料，回傳 ([(區塊索引, 條目索引, 指令字串), ...], 錯誤)。
+    字串直接用 bytes.find 從 offset 找 \0，只複製字串本身，不再每次切出剩下的整段資料。
+    資料損壞時保留已解析的部分並回傳例外。
+    """
+    rows = []
+    try:
+        _, entry_count, table2_offset, data_offset = struct.unpack_from('<IIII', uncompressed_data, 0)
+        sections_start = 16
+        entries_start = 16 + table2_offset
+        data_start = 16 + data_offset
+        data_len = len(uncompressed_data)
+        for j in range(entry_count):
+            s_entry_count, s_start_index = struct.unpack_from('<II', uncompressed_data, sections_start + j * 8)
+            for k in range(s_entry_count):
+                str_offset, = struct.unpack_from('<I', uncompressed_data, entries_start + (s_start_index + k) * 4)
+                start = data_start + str_offset
+                end = uncompressed_data.find(b'\x00', start)
+                if end == -1:
+                    end = data_len - 1 # 與原本 full_str_bytes[:-1] 相同：找不到結尾時捨棄最後一個 byte
+                command_string = uncompressed_data[start:end].decode('sjis', errors='ignore')
+                rows.append((j, k, command_string))
+    except Exception as e:
+        return rows, e
+    return rows, None
+
+
+def read_cst(filepath, known_sha1=None):
+    """
+    (工人函式) 讀取單一 .cst。內容的 sha1 與 known_sha1 相同時不解壓，rows 回傳 None。
+    回傳 (filepath, sha1, rows, 訊息 list)；rows 為 [(區塊索引, 條目索引, 指令字串, image_spec), ...]
+    """
+    messages = [f"正在讀取檔案: {filepath}..."]
+    try:
+        with open(filepath, 'rb') as f:
+            raw = f.read()
+    except OSError:
+        messages.append(f"  -> 錯誤: 找不到檔案 {filepath}")
+        return filepath, None, [], messages
+    sha1 = hashlib.sha1(raw).hexdigest()
+    if sha1 == known_sha1:
+        return filepath, sha1, None, []
+
+    if len(raw) < 16:
+        messages.append(f"  -> 錯誤: 檔案 {filepath} 太小，無法讀取檔頭。")
+        return filepath, sha1, [], messages
+    sig, length, original_length = struct.unpack_from('<8sII', raw, 0)
+    if sig != b'CatScene':
+        messages.append(f"  -> 錯誤: {filepath} 不是有效的 CatScene 檔案。")
+        return filepath, sha1, [], messages
+    try:
+        uncompressed_data = zlib.decompress(raw[16:16 + length])
+    except zlib.error as e:
+        messages.append(f"  -> 錯誤: 解壓縮 {filepath} 失敗: {e}")
+        return filepath, sha1, [], messages
+    if len(uncompressed_data) != original_length:
+        messages.append(f"  -> 警告: {filepath} 解壓縮後長度與檔頭不符。")
+
+    rows, error = parse_cst(uncompressed_data)
+    if error is not None:
+        messages.append(f"  -> 處理檔案 {filepath} 時發生未知錯誤: {error}")
+    rows = [(j, k, s, _image_spec(s)) for j, k, s in rows]
+    return filepath, sha1, rows, messages
+
+
+def _image_spec(command_string):
+    match = IMAGE_COMMAND.search(command_string)
+    return match.group(1) if match else None
+
+
+def _read_cst_job(job):
+    return read_cst(*job)
+
+
+def open_index(index_path):
+    """開啟 (或建立) 索引資料庫；版本不符時清空重建"""
+    conn = sqlite3.connect(index_path)
+    if conn.execute('PRAGMA user_version').fetchone()[0] != INDEX_VERSION:
+        conn.executescript('DROP TABLE IF EXISTS files; DROP TABLE IF EXISTS commands;')
+    conn.executescript(f'''
+        CREATE TABLE IF NOT EXISTS files (path TEXT PRIMARY KEY, size INTEGER, mtime_ns INTEGER, sha1 TEXT);
+        CREATE TABLE IF NOT EXISTS commands (path TEXT, section INTEGER, entry INTEGER, command TEXT, image_spec TEXT);
+        CREATE INDEX IF NOT EXISTS commands_path ON commands (path, section, entry);
+        CREATE INDEX IF NOT EXISTS commands_image ON commands (image_spec) WHERE image_spec IS NOT NULL;
+        PRAGMA user_version = {INDEX_VERSION};
+    ''')
+    return conn
+
+
+def refresh_index(conn, cst_files, workers=None, log=print):
+    """
+    讓索引與 cst_files 同步：新增或有變更的檔案以多進程重新解析，已不存在的檔案從索引移除。
+    回傳 (重新解析的檔案數, 沿用索引的檔案數)。
+    """
+    known = {path: (size, mtime_ns, sha1) for path, size, mtime_ns, sha1 in conn.execute('SELECT path, size, mtime_ns, sha1 FROM files')}
+    stats = {}
+    jobs = []
+    for path in cst_files:
+        st = os.stat(path)
+        stats[path] = (st.st_size, st.st_mtime_ns)
+        old = known.get(path)
+        if old is None or old[:2] != stats[path]:
+            jobs.append((path, old[2] if old else None))
+
+    removed = [path for path in known if path not in stats]
+    with conn:
+        conn.executemany('DELETE FROM commands WHERE path = ?', ((p,) for p in removed))
+        conn.executemany('DELETE FROM files WHERE path = ?', ((p,) for p in removed))
+
+    workers = workers or os.cpu_count() or 1
+    if workers <= 1 or len(jobs) < PARALLEL_THRESHOLD:
+        results = map(_read_cst_job, jobs)
+        executor = None
+    else:
+        executor = ProcessPoolExecutor(max_workers=workers)
+        results = executor.map(_read_cst_job, jobs, chunksize=max(1, len(jobs) // (workers * 4)))
+
+    parsed = 0
+    try:
+        for path, sha1, rows, messages in results:
+            for message in messages:
+                log(message)
+            size, mtime_ns = stats[path]
+            with conn:
+                if rows is not None:
+                    conn.execute('DELETE FROM commands WHERE path = ?', (path,))
+                    conn.executemany('INSERT INTO commands VALUES (?, ?, ?, ?, ?)', ((path,) + row for row in rows))
+                    parsed += 1
+                conn.execute('INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?)', (path, size, mtime_ns, sha1))
+    finally:
+        if executor is not None:
+            executor.shutdown()
+    return parsed, len(cst_files) - parsed
+
+
+def iter_commands(conn, cst_files):
+    """依 cst_files 的順序回傳 (source_file, section_index, entry_index_in_section, command_string)"""
+    for path in cst_files:
+        yield from conn.execute('SELECT path, section, entry, command FROM commands WHERE path = ? ORDER BY section, entry', (path,))
+
+
+def iter_image_commands(conn):
+    """回傳所有 cg / bg 指令的 (指令字串, 圖檔參數)"""
+    return conn.execute('SELECT command, image_spec FROM commands WHERE image_spec IS NOT NULL ORDER BY rowid')
@@ -5,6 +5,8 @@ import os
 import re
 import glob
 import shutil
+import hg3_codec
+import hg3_index
 
 # --- 步驟 1: 專業級合成函式 (未變更) ---
 def composite_high_quality(background_img, foreground_img, position):
@@ -48,6 +50,7 @@ def composite_high_quality(background_img, foreground_img, position):
 
 # --- 步驟 2: 建立資料夾和路徑 (未變更) ---
 PNG_DIR = 'png'
+COORDS_FILE = 'hg3_coordinates.txt'
 OUTPUT_DIR = 'output'
 os.makedirs(OUTPUT_DIR, exist_ok=True)
 
@@ -55,15 +58,26 @@ os.makedirs(OUTPUT_DIR, exist_ok=True)
 def get_priority_paths(part_name):
     """
     檢查是否存在 _l 版本的檔案，如果存在則優先回傳其路徑。
-    返回一個元組: (要使用的PNG路徑, 要使用的HG3座標檔名)
+    同名的 PNG 優先，沒有 PNG 時改用同資料夾內的原始 .hg3 直接解碼。
+    返回一個元組: (要使用的圖片路徑, 要使用的HG3座標檔名)
+    png 資料夾只在載入索引時列出一次，這裡只查表，不再逐一 os.path.exists。
     """
-    large_png_path = os.path.join(PNG_DIR, f"{part_name}_l.png")
-    if os.path.exists(large_png_path):
-        return (large_png_path, f"{part_name}_l.hg3")
+    for ext in ('.png', '.hg3'):
+        for suffix in ('_l', ''):
+            path = hg3.find_file(PNG_DIR, f"{part_name}{suffix}{ext}")
+            if path:
+                return (path, f"{part_name}{suffix}.hg3")
     
     standard_png_path = os.path.join(PNG_DIR, f"{part_name}.png")
     return (standard_png_path, f"{part_name}.hg3")
 
+def get_coords(hg3_key):
+    """以 HG3 檔名 (忽略大小寫) 取得座標，找不到時丟出 KeyError"""
+    info = hg3.get(hg3_key)
+    if info is None:
+        raise KeyError(hg3_key.lower())
+    return info
+
 # --- 步驟 4: **完全修正**的檔名解析函式 ---
 def get_parts_from_string(frame_string):
     """
@@ -86,11 +100,8 @@ def get_parts_from_string(frame_string):
 
 # --- 主要流程 ---
 try:
-    print("正在讀取 hg3_coordinates.txt...")
-    coords_df = pd.read_csv('hg3_coordinates.txt', sep='\t')
-    coords_df.set_index('FileName', inplace=True)
-    # **修正：將索引全部轉為小寫，以忽略大小寫**
-    coords_df.index = coords_df.index.str.lower()
+    # 座標與 png 資料夾清單都放在共用索引 (快取於 hg3_coordinates.index.pickle)，檔名查詢忽略大小寫
+    hg3 = hg3_index.load_index(COORDS_FILE, image_dirs=[PNG_DIR])
     print("座標資料讀取成功。")
 except FileNotFoundError as e:
     print(f"致命錯誤：找不到座標檔 - {e.filename}。程式無法繼續。")
@@ -143,7 +154,11 @@ for csv_file in all_csv_files:
                 part_name = all_parts[0]
                 source_png_path, _ = get_priority_paths(part_name)
                 
-                if os.path.exists(source_png_path):
+                if os.path.exists(source_png_path) and source_png_path.lower().endswith('.hg3'):
+                    hg3_codec.open_image(source_png_path).save(output_path)
+                    print(f"  -> 偵測到單一圖片，已直接解碼 '{os.path.basename(source_png_path)}'。")
+                    print(f"  -> ✅ 成功儲存至 {output_path}")
+                elif os.path.exists(source_png_path):
                     shutil.copy(source_png_path, output_path)
                     print(f"  -> 偵測到單一圖片，已直接複製 '{os.path.basename(source_png_path)}'。")
                     print(f"  -> ✅ 成功儲存至 {output_path}")
@@ -156,7 +171,7 @@ for csv_file in all_csv_files:
             _, base_hg3_key = get_priority_paths(base_name)
             
             print(f"  -> 偵測到複雜模式。使用 '{base_hg3_key}' (忽略大小寫) 作為基底。")
-            base_coords = coords_df.loc[base_hg3_key.lower()]
+            base_coords = get_coords(base_hg3_key)
             base_x = int(base_coords['OffsetX'])
             base_y = int(base_coords['OffsetY'])
 
@@ -168,8 +183,8 @@ for csv_file in all_csv_files:
             for part_name in all_parts:
                 part_png_path, part_hg3_key = get_priority_paths(part_name)
                 
-                part_img = Image.open(part_png_path).convert('RGBA')
-                part_coords = coords_df.loc[part_hg3_key.lower()]
+                part_img = hg3_codec.open_image(part_png_path).convert('RGBA')
+                part_coords = get_coords(part_hg3_key)
                 part_x = int(part_coords['OffsetX'])
                 part_y = int(part_coords['OffsetY'])
                 
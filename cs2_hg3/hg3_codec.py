@@ -0,0 +1,210 @@
+import os
+import struct
+import zlib
+from typing import List, NamedTuple, Optional
+
+import numpy as np
+from PIL import Image
+
+# ==============================================================================
+# 【HG-3 直接解碼】
+# ==============================================================================
+# 供 hg3fuku.py / hg3fuku_all.py / hg3立繪.py / hg3_cg_combine.py 共用，
+# 不需要先用外部工具把 .hg3 轉成 PNG 再讀回來。
+#
+# 檔案結構 (與 hg3totxt.py 走訪的 tag 鏈相同)：
+#   0x00  'HG-3' + header_size + version                      (12 bytes)
+#   每個畫格: u32 下一個畫格的相對 offset (0 = 最後), u32 畫格 Id (8 bytes)
+#             之後是 tag 鏈: name[8], u32 下一個 tag 的相對 offset (0 = 最後), u32 length
+#   stdinfo : width, height, depth, offset_x, offset_y, canvas_w, canvas_h, ...
+#   img0000 : u32 unknown, u32 height, packed/unpacked data 大小, packed/unpacked ctl 大小,
+#             接著 zlib(data) 與 zlib(ctl)
+#
+# img0000 解碼流程：
+#   1. ctl 為 LSB 優先的位元流：第一個 bit 表示從 copy 或 zero 開始，
+#      之後是 Elias-gamma 編碼的輸出大小與交替的 copy / zero 長度 (zero 區段直接保留 0)
+#   2. 輸出分成 4 個 plane，每個 plane byte 的 2 bit 組成一個輸出 byte (bit-plane 交錯)，
+#      再以最低位元決定是否反相 (v >> 1) ^ (0xFF if v & 1 else 0)
+#   3. 第一列水平 delta，其餘各列加上正上方一列 (垂直 delta)
+#   4. 資料為由下而上的 BGR(A)，翻轉後轉成 RGBA
+# ==============================================================================
+
+HG3_SIGNATURE = b'HG-3'
+FRAME_START = 0x0C
+
+
+class Hg3Frame(NamedTuple):
+    width: int
+    height: int
+    depth: int
+    offset_x: int
+    offset_y: int
+    canvas_width: int
+    canvas_height: int
+    image: Optional[np.ndarray] # (高, 寬, 4) RGBA；沒有 img0000 或未要求解碼時為 None
+
+
+def is_image_file(filename):
+    """合成腳本可直接使用的圖片：已轉出的 .png 或原始 .hg3"""
+    return filename.endswith('.png') or filename.lower().endswith('.hg3')
+
+
+def prefer_png(paths):
+    """同一資料夾同名的 .png 與 .hg3 同時存在時 (例如已轉出過 PNG)，只保留 .png，維持原本的讀取結果"""
+    existing = {os.path.splitext(p)[0] for p in paths if p.endswith('.png')}
+    return [p for p in paths if p.endswith('.png') or os.path.splitext(p)[0] not in existing]
+
+
+def _iter_tags(data, frame_pos):
+    """走訪一個畫格的 tag 鏈，回傳 (tag 名稱, 資料起點, 資料長度)"""
+    tag_pos = frame_pos + 8
+    while tag_pos + 16 <= len(data):
+        name, offset_next, length = struct.unpack_from('<8sII', data, tag_pos)
+        yield name.rstrip(b'\0'), tag_pos + 16, length
+        if offset_next == 0:
+            break
+        tag_pos += offset_next
+
+
+def _read_gamma_runs(ctl):
+    """解析 ctl 位元流，回傳 (是否從 copy 開始, 輸出大小, 各區段長度 list)"""
+    # 展開成 '0' / '1' 字串後，以 bytes.index 找每個 gamma code 的前導 1，再用 int(..., 2) 一次讀出數值
+    bits = np.unpackbits(np.frombuffer(ctl, dtype=np.uint8), bitorder='little').tobytes()
+    bits = bits.translate(bytes.maketrans(b'\x00\x01', b'01'))
+
+    pos = 1
+    def next_count():
+        nonlocal pos
+        one = bits.index(b'1', pos)
+        n = one - pos
+        if n >= 0x20:
+            raise ValueError("HG-3 ctl 位元流的 gamma code 溢位")
+        value = int(bits[one:one + n + 1], 2)
+        pos = one + n + 1
+        return value
+
+    copy = bits[:1] == b'1'
+    output_size = next_count()
+    runs = []
+    total = 0
+    while total < output_size:
+        count = next_count()
+        runs.append(count)
+        total += count
+    return copy, output_size, runs
+
+
+def _unpack_rle(data, ctl):
+    """依 ctl 的 copy / zero 交替區段展開 data"""
+    copy, output_size, runs = _read_gamma_runs(ctl)
+    src_data = np.frombuffer(data, dtype=np.uint8)
+    output = np.zeros(output_size, dtype=np.uint8)
+    src = dst = 0
+    for count in runs:
+        if copy:
+            output[dst:dst + count] = src_data[src:src + count]
+            src += count
+        dst += count
+        copy = not copy
+    return output
+
+
+def _apply_delta(buffer, width, height, pixel_size):
+    """bit-plane 重組 + 反相 + 水平/垂直 delta 還原，回傳 (列數, 寬, pixel_size) 的陣列 (由下而上)"""
+    plane_size = len(buffer) // 4
+    planes = buffer[:plane_size * 4].reshape(4, plane_size)
+
+    merged = np.empty((plane_size, 4), dtype=np.uint8)
+    for j in range(4):
+        shift = 2 * j
+        v = (((planes[0] >> shift) & 3) << 6) | (((planes[1] >> shift) & 3) << 4) \
+            | (((planes[2] >> shift) & 3) << 2) | ((planes[3] >> shift) & 3)
+        merged[:, j] = (v >> 1) ^ ((v & 1) * 0xFF)
+
+    stride = width * pixel_size
+    rows = min(height, merged.size // stride) if stride else 0
+    pixels = merged.reshape(-1)[:rows * stride].reshape(rows, width, pixel_size)
+    if rows == 0:
+        return pixels
+    # 第一列：每個通道沿水平方向累加；之後每列加上前一列 (uint8 自動 mod 256)
+    np.add.accumulate(pixels[0], axis=0, dtype=np.uint8, out=pixels[0])
+    np.add.accumulate(pixels, axis=0, dtype=np.uint8, out=pixels)
+    return pixels
+
+
+def _decode_img0000(data, pos, width, depth):
+    _unknown, height, data_packed, data_unpacked, ctl_packed, ctl_unpacked = struct.unpack_from('<6I', data, pos)
+    pos += 24
+    packed = zlib.decompress(data[pos:pos + data_packed])
+    ctl = zlib.decompress(data[pos + data_packed:pos + data_packed + ctl_packed])
+
+    pixel_size = depth // 8
+    pixels = _apply_delta(_unpack_rle(packed, ctl), width, height, pixel_size)[::-1] # 由下而上 -> 由上而下
+
+    rgba = np.empty(pixels.shape[:2] + (4,), dtype=np.uint8)
+    rgba[..., 0] = pixels[..., 2]
+    rgba[..., 1] = pixels[..., 1]
+    rgba[..., 2] = pixels[..., 0]
+    rgba[..., 3] = pixels[..., 3] if pixel_size == 4 else 255
+    return rgba
+
+
+def read_frames(filepath, decode=True) -> List[Hg3Frame]:
+    """讀取 .hg3 的所有畫格 (stdinfo 座標 + 解碼後的 RGBA 陣列)；decode=False 時只讀座標"""
+    with open(filepath, 'rb') as f:
+        data = f.read()
+    if data[:4] != HG3_SIGNATURE:
+        raise ValueError(f"{os.path.basename(filepath)} 不是 HG-3 檔案")
+
+    frames = []
+    frame_pos = FRAME_START
+    while frame_pos + 8 <= len(data):
+        frame_next, _frame_id = struct.unpack_from('<II', data, frame_pos)
+        info = None
+        image = None
+        for name, pos, _length in _iter_tags(data, frame_pos):
+            if name == b'stdinfo':
+                info = struct.unpack_from('<IIIiiII', data, pos)
+            elif name == b'img0000' and decode and info is not None:
+                image = _decode_img0000(data, pos, info[0], info[2])
+        if info is not None:
+            frames.append(Hg3Frame(*info, image))
+        if frame_next == 0:
+            break
+        frame_pos += frame_next
+    return frames
+
+
+def read_stdinfo(filepath) -> Optional[Hg3Frame]:
+    """只讀第一個畫格的 stdinfo (不解碼像素)"""
+    frames = read_frames(filepath, decode=False)
+    return frames[0] if frames else None
+
+
+def decode_image(filepath, frame=0) -> np.ndarray:
+    """解碼指定畫格，回傳 (高, 寬, 4) RGBA 陣列"""
+    frames = read_frames(filepath)
+    if frame >= len(frames) or frames[frame].image is None:
+        raise ValueError(f"{os.path.basename(filepath)} 的第 {frame} 個畫格沒有可解碼的 img0000 影像")
+    return frames[frame].image
+
+
+def open_image(filepath):
+    """開啟合成用的部件圖：.hg3 直接解碼成 RGBA 圖片，其他格式照舊用 Image.open"""
+    if filepath.lower().endswith('.hg3'):
+        return Image.fromarray(decode_image(filepath))
+    return Image.open(filepath)
+
+
+def coords_row(filepath):
+    """把 .hg3 的 stdinfo 轉成與 hg3_coordinates.txt 相同欄位的 dict，座標檔缺少該圖層時使用"""
+    info = read_stdinfo(filepath)
+    if info is None:
+        return None
+    return {
+        'FileName': os.path.basename(filepath),
+        'FragmentWidth': info.width, 'FragmentHeight': info.height,
+        'OffsetX': info.offset_x, 'OffsetY': info.offset_y,
+        'CanvasWidth': info.canvas_width, 'CanvasHeight': info.canvas_height,
+        'ColorDepth': info.depth,
+    }
@@ -0,0 +1,165 @@
+import bisect
+import csv
+import os
+import pickle
+
+# ==============================================================================
+# 【HG3 素材索引】
+# ==============================================================================
+# 供 cst_combine.py / hg3_cg_combine.py 共用：
+#   - 把 hg3_coordinates.txt 載入成 {小寫檔名(不含副檔名): 座標} 與排序過的檔名 list，
+#     前綴查詢以 bisect 找出範圍，不再對每個指令掃一次全部座標
+#   - 預先算好每個立繪的「最大版本」(l / m / s / x 中面積最大者)，查詢時直接取用
+#   - 圖檔資料夾只列一次 (以資料夾的修改時間判斷是否需要重新列出)，取代每個圖層的 os.path.exists
+# 以上結果以 pickle 存在座標檔旁 (hg3_coordinates.txt -> hg3_coordinates.index.pickle)，
+# 座標檔的大小與修改時間沒變就直接讀取，不必重新解析。
+# ==============================================================================
+
+INDEX_VERSION = 1
+VERSION_CHARS = ('l', 'm', 's', 'x')
+COORD_FIELDS = ('OffsetX', 'OffsetY', 'CanvasWidth', 'CanvasHeight', 'FragmentWidth', 'FragmentHeight')
+
+
+def cache_path_for(coords_path):
+    return os.path.splitext(coords_path)[0] + '.index.pickle'
+
+
+def _stamp(path):
+    st = os.stat(path)
+    return st.st_size, st.st_mtime_ns
+
+
+def _variant_char(name_key):
+    """座標檔名 "xxxl_0001" -> 'l'；去掉最後一個 _ 段後不是以版本字元結尾時回傳 None"""
+    temp_base_name = '_'.join(name_key.split('_')[:-1])
+    return temp_base_name[-1] if temp_base_name.endswith(VERSION_CHARS) else None
+
+
+class HG3Index:
+    """
+    coords     : {小寫檔名: {'OffsetX': ..., ...}}，順序與座標檔相同 (同名多列時取最後一列，與原本的 dict 相同)
+    names      : 排序過的小寫檔名，供前綴查詢
+    largest    : {前綴: 版本字元或 None}，預先算好的最大版本
+    """
+
+    def __init__(self, coords):
+        self.coords = coords
+        self.names = sorted(coords)
+        self._order = {name: i for i, name in enumerate(coords)}
+        self._file_lists = {}
+        self.largest = {}
+        # 實際會被查詢的前綴 = 各個立繪去掉版本字元後的名稱 (例如 "ev01al_0001" -> "ev01a")
+        for name_key in coords:
+            temp_base_name = '_'.join(name_key.split('_')[:-1])
+            if temp_base_name.endswith(VERSION_CHARS):
+                prefix = temp_base_name[:-1]
+                if prefix not in self.largest:
+                    self.largest[prefix] = self._scan_largest(prefix)
+
+    # --- 座標 ---
+    def prefix_range(self, prefix):
+        """回傳所有以 prefix (小寫) 開頭的檔名 (已排序)"""
+        lo = bisect.bisect_left(self.names, prefix)
+        hi = bisect.bisect_left(self.names, prefix + '\U0010ffff', lo)
+        return self.names[lo:hi]
+
+    def _scan_largest(self, prefix):
+        # 與原本的 find_largest_base_name 相同：依座標檔順序找面積最大者 (同面積取先出現的)，
+        # 只有最大者的名稱帶版本字元時才更新結果
+        max_area = -1
+        best_char = None
+        for name_key in sorted(self.prefix_range(prefix), key=self._order.__getitem__):
+            data = self.coords[name_key]
+            area = data['FragmentWidth'] * data['FragmentHeight']
+            if area > max_area:
+                max_area = area
+                best_char = _variant_char(name_key) or best_char
+        return best_char
+
+    def find_largest_base_name(self, original_base_name):
+        """立繪名稱以 l / m / s / x 結尾時，換成面積最大的版本 (例如 "ev01as" -> "ev01al")"""
+        if not original_base_name.lower().endswith(VERSION_CHARS):
+            return original_base_name
+        original_prefix_cased = original_base_name[:-1]
+        prefix = original_prefix_cased.lower()
+        if prefix not in self.largest:
+            self.largest[prefix] = self._scan_largest(prefix)
+        best_char = self.largest[prefix]
+        return original_base_name if best_char is None else original_prefix_cased + best_char
+
+    def get(self, file_name):
+        """以檔名 (可含副檔名，不分大小寫) 取得座標；找不到時回傳 None"""
+        return self.coords.get(os.path.splitext(file_name)[0].lower())
+
+    # --- 圖檔資料夾 ---
+    def refresh_files(self, folder):
+        """列出資料夾內的檔案；資料夾的修改時間沒變時沿用上次的清單。回傳清單是否有更新。"""
+        key = os.path.abspath(folder)
+        try:
+            mtime_ns = os.stat(folder).st_mtime_ns
+        except OSError:
+            mtime_ns = None
+        cached = self._file_lists.get(key)
+        if cached is not None and cached[0] == mtime_ns:
+            return False
+        names = {f.lower(): f for f in os.listdir(folder)} if mtime_ns is not None else {}
+        self._file_lists[key] = (mtime_ns, names)
+        return True
+
+    def files(self, folder):
+        """資料夾內的檔案 {小寫檔名: 實際檔名} (第一次使用時才列出，之後不再存取檔案系統)"""
+        key = os.path.abspath(folder)
+        if key not in self._file_lists:
+            self.refresh_files(folder)
+        return self._file_lists[key][1]
+
+    def find_file(self, folder, file_name):
+        """資料夾內有 file_name (不分大小寫) 時回傳完整路徑，否則回傳 None"""
+        actual = self.files(folder).get(file_name.lower())
+        return os.path.join(folder, actual) if actual is not None else None
+
+
+def read_coordinates(coords_path):
+    coords = {}
+    with open(coords_path, 'r', encoding='utf-8-sig') as f:
+        for row in csv.DictReader(f, delimiter='\t'):
+            base_name = os.path.splitext(row['FileName'])[0].lower()
+            coords[base_name] = {field: int(row[field]) for field in COORD_FIELDS}
+    return coords
+
+
+def load_index(coords_path, image_dirs=(), log=print):
+    """
+    讀取 (或建立) 座標檔的索引，並預先列出 image_dirs 內的檔案。
+    快取仍有效時直接讀 pickle；否則重新解析座標檔。資料夾清單有更新時寫回快取。
+    """
+    cache_path = cache_path_for(coords_path)
+    stamp = _stamp(coords_path)
+    index = None
+    try:
+        with open(cache_path, 'rb') as f:
+            cached = pickle.load(f)
+        if cached.get('version') == INDEX_VERSION and cached.get('stamp') == stamp:
+            index = cached['index']
+            log(f"從 {cache_path} 載入 {len(index.coords)} 筆座標索引。")
+    except Exception: # 快取不存在或損壞時重新建立
+        index = None
+
+    dirty = index is None
+    if index is None:
+        log(f"正在從 {coords_path} 讀取座標...")
+        index = HG3Index(read_coordinates(coords_path))
+        log(f"成功載入 {len(index.coords)} 筆座標。")
+
+    for folder in image_dirs:
+        dirty = index.refresh_files(folder) or dirty
+
+    if dirty:
+        tmp_path = cache_path + '.tmp'
+        try:
+            with open(tmp_path, 'wb') as f:
+                pickle.dump({'version': INDEX_VERSION, 'stamp': stamp, 'index': index}, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, cache_path)
+        except OSError as e:
+            log(f"無法寫入索引快取 {cache_path}: {e}")
+    return index
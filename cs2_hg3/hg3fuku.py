@@ -3,6 +3,7 @@ import csv
 import re # 引入 re 模組來輔助字串分解
 from PIL import Image
 import numpy as np
+import hg3_codec
 
 # --- 基礎設定 ---
 IMAGES_BASE_DIR = "images"
@@ -61,13 +62,17 @@ def load_hg3_coordinates(file_path):
 def get_image_info(file_path, coords_data):
     key = os.path.splitext(os.path.basename(file_path))[0].lower()
     info = coords_data.get(key)
+    if not info and file_path.lower().endswith('.hg3'):
+        # 座標檔沒有這個圖層時，直接使用 .hg3 內的 stdinfo
+        info = hg3_codec.coords_row(file_path)
+        if info: coords_data[key] = info
     if not info:
         print(f"警告：在 {COORDS_FILENAME} 中找不到鍵 '{key}' 的座標資訊。")
     return info
 
 def get_png_files_from_dir(dir_path):
     if not os.path.isdir(dir_path): return []
-    return sorted([os.path.join(dir_path, f) for f in os.listdir(dir_path) if f.endswith('.png')])
+    return sorted(hg3_codec.prefer_png([os.path.join(dir_path, f) for f in os.listdir(dir_path) if hg3_codec.is_image_file(f)]))
 
 def get_all_png_files(dir_path):
     if not os.path.isdir(dir_path): return []
@@ -76,9 +81,9 @@ def get_all_png_files(dir_path):
         item_path = os.path.join(dir_path, item)
         if os.path.isdir(item_path):
             all_files.extend(get_all_png_files(item_path))
-        elif item.endswith('.png'):
+        elif hg3_codec.is_image_file(item):
             all_files.append(item_path)
-    return sorted(all_files)
+    return sorted(hg3_codec.prefer_png(all_files))
 
 def composite_numpy(base_np, part_img, part_pos):
     """使用 NumPy 進行高效的 Alpha 合成。"""
@@ -193,7 +198,7 @@ def process_character(char_dir_path, coords_data):
         for path in fuku_group_files:
             info = get_image_info(path, coords_data)
             if not info: continue
-            with Image.open(path) as p_img:
+            with hg3_codec.open_image(path) as p_img:
                 base_np = composite_numpy(base_np, p_img.convert("RGBA"), (info['OffsetX'], info['OffsetY']))
         fuku_base_img = Image.fromarray(base_np)
 
@@ -202,7 +207,7 @@ def process_character(char_dir_path, coords_data):
             for kami_path in kami_files:
                 info_k = get_image_info(kami_path, coords_data)
                 if not info_k: continue
-                with Image.open(kami_path) as p_img:
+                with hg3_codec.open_image(kami_path) as p_img:
                     body_np = composite_numpy(np.array(fuku_base_img), p_img.convert("RGBA"), (info_k['OffsetX'], info_k['OffsetY']))
                 body_name = f"{char_name}_{fuku_base_name}_{get_short_name(kami_path)}"
                 body_bases[body_name] = Image.fromarray(body_np)
@@ -218,14 +223,14 @@ def process_character(char_dir_path, coords_data):
                 base_np_a = np.array(body_img)
                 info = get_image_info(kao_path, coords_data)
                 if not info: continue
-                with Image.open(kao_path) as p_img:
+                with hg3_codec.open_image(kao_path) as p_img:
                     base_np_a = composite_numpy(base_np_a, p_img.convert("RGBA"), (info['OffsetX'], info['OffsetY']))
                 name_parts = [body_name, get_short_name(kao_path)]
                 if kuchi_files:
                     for kuchi_path in kuchi_files:
                         info_k = get_image_info(kuchi_path, coords_data)
                         if not info_k: continue
-                        with Image.open(kuchi_path) as p_img:
+                        with hg3_codec.open_image(kuchi_path) as p_img:
                             final_np = composite_numpy(base_np_a.copy(), p_img.convert("RGBA"), (info_k['OffsetX'], info_k['OffsetY']))
                         final_img = Image.fromarray(final_np)
                         final_name = "_".join(name_parts + [get_short_name(kuchi_path)]) + ".png"
@@ -253,7 +258,7 @@ def process_character(char_dir_path, coords_data):
                     final_name = f"{os.path.splitext(face_name)[0]}_{get_short_name(effect_path)}.png"
                     output_path = os.path.join(fuku_face_effect_dir, final_name)
                     if not os.path.exists(output_path):
-                        with Image.open(effect_path) as p_img:
+                        with hg3_codec.open_image(effect_path) as p_img:
                             final_np = composite_numpy(np.array(face_img), p_img.convert("RGBA"), (info_e['OffsetX'], info_e['OffsetY']))
                         Image.fromarray(final_np).save(output_path)
                         count += 1
@@ -267,19 +272,19 @@ def process_character(char_dir_path, coords_data):
                 for hoho_path in hoho_files:
                     info_h = get_image_info(hoho_path, coords_data)
                     if not info_h: continue
-                    with Image.open(hoho_path) as p_img:
+                    with hg3_codec.open_image(hoho_path) as p_img:
                         base_np_b = composite_numpy(np.array(body_img), p_img.convert("RGBA"), (info_h['OffsetX'], info_h['OffsetY']))
                     for kao_path in kao_files:
                         info_k = get_image_info(kao_path, coords_data)
                         if not info_k: continue
-                        with Image.open(kao_path) as p_img:
+                        with hg3_codec.open_image(kao_path) as p_img:
                             kao_np = composite_numpy(base_np_b.copy(), p_img.convert("RGBA"), (info_k['OffsetX'], info_k['OffsetY']))
                         name_parts = [body_name, get_short_name(hoho_path), get_short_name(kao_path)]
                         if kuchi_files:
                             for kuchi_path in kuchi_files:
                                 info_ku = get_image_info(kuchi_path, coords_data)
                                 if not info_ku: continue
-                                with Image.open(kuchi_path) as p_img:
+                                with hg3_codec.open_image(kuchi_path) as p_img:
                                     final_np = composite_numpy(kao_np.copy(), p_img.convert("RGBA"), (info_ku['OffsetX'], info_ku['OffsetY']))
                                 final_img = Image.fromarray(final_np)
                                 final_name = "_".join(name_parts + [get_short_name(kuchi_path)]) + ".png"
@@ -307,7 +312,7 @@ def process_character(char_dir_path, coords_data):
                         final_name = f"{os.path.splitext(face_name)[0]}_{get_short_name(effect_path)}.png"
                         output_path = os.path.join(fuku_face_hoho_effect_dir, final_name)
                         if not os.path.exists(output_path):
-                            with Image.open(effect_path) as p_img:
+                            with hg3_codec.open_image(effect_path) as p_img:
                                 final_np = composite_numpy(np.array(face_img), p_img.convert("RGBA"), (info_e['OffsetX'], info_e['OffsetY']))
                             Image.fromarray(final_np).save(output_path)
                             count += 1
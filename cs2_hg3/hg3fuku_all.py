@@ -5,6 +5,7 @@ import itertools
 import re
 import numpy as np
 from multiprocessing import Pool, cpu_count
+import hg3_codec
 
 # --- 核心輔助函式 ---
 def ensure_dir(dir_path):
@@ -12,7 +13,7 @@ def ensure_dir(dir_path):
 
 def get_files_safely(dir_path):
     if not os.path.isdir(dir_path): return []
-    return [os.path.join(dir_path, f) for f in os.listdir(dir_path) if f.endswith('.png')]
+    return hg3_codec.prefer_png([os.path.join(dir_path, f) for f in os.listdir(dir_path) if hg3_codec.is_image_file(f)])
 
 def get_last_suffix(file_path):
     if not file_path: return ""
@@ -72,6 +73,10 @@ def find_coords_info(png_path, coords_data):
     match = re.match(r'^(.*)([-_]\d+)$', base_name)
     if match and match.group(1) in coords_data: return coords_data[match.group(1)]
     if base_name in coords_data: return coords_data[base_name]
+    if png_path.lower().endswith('.hg3'):
+        # 座標檔沒有這個圖層時，直接使用 .hg3 內的 stdinfo
+        row = hg3_codec.coords_row(png_path)
+        if row: return (row['OffsetX'], row['OffsetY'], row['CanvasWidth'], row['CanvasHeight'])
     print(f"    - 警告：在座標檔中找不到與 '{os.path.basename(png_path)}' 對應的座標。")
     return None
 
@@ -97,7 +102,7 @@ def process_task(args):
         part_info = find_coords_info(part_path, coords_data)
         if part_info:
             try:
-                part_image = Image.open(part_path).convert("RGBA")
+                part_image = hg3_codec.open_image(part_path).convert("RGBA")
                 canvas = composite_high_quality(canvas, part_image, (part_info[0], part_info[1]))
             except FileNotFoundError:
                 print(f"      - 錯誤：檔案不存在 '{part_path}'")
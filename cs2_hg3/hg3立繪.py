@@ -10,6 +10,7 @@ import gc
 from numba import jit
 import concurrent.futures
 from tqdm import tqdm
+import hg3_codec
 
 
 # --- 主要設定 ---
@@ -38,6 +39,12 @@ def load_image_from_disk(layer_key):
                 with Image.open(img_path) as img:
                     return np.array(img.convert("RGBA"))
             except Exception: return None
+        # 沒有轉出的 PNG 時，直接解碼原始的 .hg3
+        hg3_path = os.path.join(IMAGES_DIR, f"{original_filename}.hg3")
+        if os.path.exists(hg3_path):
+            try:
+                return hg3_codec.decode_image(hg3_path)
+            except Exception: return None
     return None
 
 def init_worker():
@@ -0,0 +1,49 @@
+import numpy as np
+from PIL import Image
+
+# 256x256 查找表：UNPREMULTIPLY_LUT[a, c] = 反預乘後的顏色值
+# 與原本逐像素公式相同：a 為 0 或 255 時不變，其餘為 (c * 255) // a，超過 255 時截為 255 (與 PIL 寫入像素時的行為一致)
+_alpha = np.arange(256, dtype=np.uint32)[:, None]
+_color = np.arange(256, dtype=np.uint32)[None, :]
+UNPREMULTIPLY_LUT = np.where(
+    (_alpha == 0) | (_alpha == 255),
+    _color,
+    np.minimum(_color * 255 // np.maximum(_alpha, 1), 255),
+).astype(np.uint8)
+del _alpha, _color
+
+
+def un_premultiply_alpha(image: Image.Image) -> Image.Image:
+    """對 PIL.Image 物件進行 Alpha Un-premultiplication 處理 (整張圖一次查表)。"""
+    if image.mode != 'RGBA':
+        return image
+
+    pixels = np.array(image)
+    alpha = pixels[..., 3:4]
+    pixels[..., :3] = UNPREMULTIPLY_LUT[alpha, pixels[..., :3]]
+    return Image.fromarray(pixels)
+
+
+def _un_premultiply_alpha_reference(image: Image.Image) -> Image.Image:
+    """原本的逐像素版本，只用於下方的正確性檢查。"""
+    image = image.copy()
+    pixels = image.load()
+    width, height = image.size
+    for x in range(width):
+        for y in range(height):
+            r, g, b, a = pixels[x, y]
+            if a != 0 and a != 255:
+                pixels[x, y] = ((r * 255) // a, (g * 255) // a, (b * 255) // a, a)
+    return image
+
+
+if __name__ == '__main__':
+    # 正確性檢查：每個 (alpha, 顏色) 組合都出現一次，再加一張隨機圖，結果需與逐像素公式完全一致
+    a, c = np.meshgrid(np.arange(256, dtype=np.uint8), np.arange(256, dtype=np.uint8), indexing='ij')
+    every_pair = np.stack([c, np.roll(c, 1, axis=1), np.roll(c, 2, axis=1), a], axis=-1)
+    random_image = np.random.default_rng(0).integers(0, 256, size=(123, 77, 4), dtype=np.uint8)
+
+    for name, arr in (('全組合 256x256', every_pair), ('隨機 77x123', random_image)):
+        img = Image.fromarray(arr)
+        ok = un_premultiply_alpha(img).tobytes() == _un_premultiply_alpha_reference(img).tobytes()
+        print(f"{name}: {'一致' if ok else '不一致!'}")
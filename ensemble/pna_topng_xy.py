@@ -2,25 +2,7 @@ import os
 import struct
 import io
 from PIL import Image
-
-def un_premultiply_alpha(image: Image.Image) -> Image.Image:
-    """對 PIL.Image 物件進行 Alpha Un-premultiplication 處理。"""
-    if image.mode != 'RGBA':
-        return image
-
-    pixels = image.load()
-    width, height = image.size
-
-    for x in range(width):
-        for y in range(height):
-            r, g, b, a = pixels[x, y]
-            if a != 0 and a != 255:
-                r = (r * 255) // a
-                g = (g * 255) // a
-                b = (b * 255) // a
-                pixels[x, y] = (r, g, b, a)
-                
-    return image
+from pna_alpha import un_premultiply_alpha
 
 def extract_pna_data(pna_filepath: str, image_output_dir: str):
     """
@@ -12,6 +12,7 @@ from datetime import datetime
 import itertools 
 import concurrent.futures
 import threading
+import layer_blend
 
 # ==============================================================================
 # --- 使用者設定區 ---
@@ -161,27 +162,21 @@ def create_composite_task(layers_to_draw, base_info, output_path, log_file, comb
         
         canvas_width = max_x - min_x
         canvas_height = max_y - min_y
-        master_canvas = Image.new("RGBA", (canvas_width, canvas_height), (0, 0, 0, 0))
+        # 單一預先配置的 RGBA 畫布，每個部件只在自己的矩形範圍內原地疊加 (layer_blend)
+        master_canvas = layer_blend.new_canvas(canvas_width, canvas_height)
 
         for part_info in layers_to_draw:
             part_img_path = os.path.join(char_base_name, f"{char_base_name}_{part_info['layer_id']}.png")
             try:
-                part_img = Image.open(part_img_path).convert("RGBA")
+                with Image.open(part_img_path) as src:
+                    part_img = layer_blend.image_to_array(src)
             except FileNotFoundError: continue
 
-            part_opacity = part_info.get('opacity', 255)
-            if part_opacity < 255:
-                alpha = part_img.getchannel('A').point(lambda p: p * (part_opacity / 255.0))
-                part_img.putalpha(alpha)
-
             paste_x = (part_info['left'] - base_x) - min_x
             paste_y = (part_info['top'] - base_y) - min_y
-            
-            layer_canvas = Image.new("RGBA", (canvas_width, canvas_height), (0, 0, 0, 0))
-            layer_canvas.paste(part_img, (paste_x, paste_y))
-            master_canvas = Image.alpha_composite(master_canvas, layer_canvas)
+            layer_blend.blend_region(master_canvas, part_img, paste_x, paste_y, part_info.get('opacity', 255))
 
-        master_canvas.save(output_path)
+        layer_blend.array_to_image(master_canvas).save(output_path)
         with log_lock:
             log_file.write(f"[成功生成] {combination_context}: '{os.path.basename(output_path)}'\n")
             
@@ -24,6 +24,9 @@ import itertools
 import concurrent.futures
 import threading
 import re
+import bisect
+from collections import OrderedDict
+import layer_blend
 
 # ==============================================================================
 # --- 使用者設定區 ---
@@ -39,11 +42,77 @@ MISSING_IMG_POLICY = 1
 # 【邊緣不透明雜訊過濾閾值】
 # 範圍 0 ~ 255。如果合出來的立繪邊緣有肉眼不可見的微弱毛邊，導致無法裁切，請保持此值 (推薦 3 到 8)
 ALPHA_THRESHOLD = 5  
+
+# 【圖層解碼快取記憶體上限】(MB)
+# 所有工作線程共用同一份已解碼圖層，超過上限時淘汰最久未使用的圖層 (LRU)。設為 0 即關閉快取
+LAYER_CACHE_MB = 2048
 # ==============================================================================
 
 log_lock = threading.Lock()
 set_lock = threading.Lock()
 
+# --- 0. 全域共用圖層快取 (LRU) ---
+class LayerImageCache:
+    """執行緒安全的已解碼圖層快取：以 (資料夾, 圖層ID) 為鍵存放 RGBA 陣列，依位元組數控管記憶體並以 LRU 淘汰"""
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            img = self._items.get(key)
+            if img is None:
+                return None
+            self._items.move_to_end(key)
+            self.hits += 1
+            return img
+
+    def put(self, key, img):
+        size = img.nbytes
+        with self._lock:
+            self.misses += 1
+            if size > self.max_bytes or key in self._items:
+                return
+            self._items[key] = img
+            self.current_bytes += size
+            while self.current_bytes > self.max_bytes:
+                _, old_img = self._items.popitem(last=False)
+                self.current_bytes -= old_img.nbytes
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+            self.current_bytes = 0
+            self.hits = 0
+            self.misses = 0
+
+layer_cache = LayerImageCache(LAYER_CACHE_MB * 1024 * 1024)
+
+def load_layer_image(img_folders, lid, lname):
+    """依資料夾優先序找出圖層實體圖片並解碼為 RGBA 陣列；命中快取時直接共用 (唯讀)，不再重複 open/convert"""
+    for folder in img_folders:
+        cached = layer_cache.get((folder, lid))
+        if cached is not None:
+            return cached
+
+    for folder in img_folders:
+        possible_paths = [os.path.join(folder, f"{folder}_{lid}.png"), os.path.join(folder, f"{lid}.png")]
+        if lname:
+            possible_paths.append(os.path.join(folder, f"{folder}_{lname}.png"))
+            possible_paths.append(os.path.join(folder, f"{lname}.png"))
+            possible_paths.append(os.path.join(folder, f"{folder}_{normalize_path_string(lname)}.png"))
+        for img_p in possible_paths:
+            if os.path.exists(img_p):
+                with Image.open(img_p) as src:
+                    part_img = layer_blend.image_to_array(src)
+                layer_cache.put((folder, lid), part_img)
+                return part_img
+    return None
+
 # --- 1. 智慧型多重編碼與啟發式特徵校驗核心 ---
 def read_file_with_smart_encoding(filepath):
     """智慧型編碼探測鏈：依序碰撞最可能的文字編碼，並進行啟發式特徵校驗，防止偽解碼攔截"""
@@ -143,9 +212,61 @@ def normalize_path_string(path_str):
     """將路徑底線化、移除任何空白，確保跨平台查找 100% 精確"""
     return path_str.replace('/', '_').replace(' ', '').replace('　', '')
 
-def find_layer_id(p, path_to_id, layer_df):
+class LayerPathIndex:
+    """每個 pbd 只建立一次的路徑索引，取代逐列 iterrows 掃描：
+    - path_to_id：完整路徑 / 底線路徑 / 圖層名稱 → 圖層 ID（與舊版建表順序相同）
+    - 後綴表：所有路徑的每個後綴 → 總表順序中第一個以此結尾的圖層 ID，endswith 查詢只需一次雜湊
+    - 排序鍵表：path_to_id 的鍵依字典序排序，* 通配字首以 bisect 取出區間
+    """
+    def __init__(self, layer_df):
+        self.path_to_id = {}
+        self.layer_diff_map = {}
+        self.slash_suffix_to_id = {}
+        self.underscore_suffix_to_id = {}
+        self.id_positions = defaultdict(list)
+
+        columns = zip(layer_df['layer_id'], layer_df['name'], layer_df['full_path_slash'], layer_df['full_path_underscore'], layer_df['diff_id'])
+        for pos, (layer_id, name, path_slash, path_underscore, diff_id) in enumerate(columns):
+            self.path_to_id[path_slash] = layer_id
+            self.path_to_id[path_underscore] = layer_id
+            self.path_to_id[normalize_path_string(path_slash)] = layer_id
+            self.path_to_id[name] = layer_id
+            self.path_to_id[normalize_path_string(name)] = layer_id
+            if diff_id:
+                self.layer_diff_map[layer_id] = int(diff_id)
+            self.id_positions[layer_id].append(pos)
+
+            for i in range(len(path_slash) + 1):
+                self.slash_suffix_to_id.setdefault(path_slash[i:], layer_id)
+            for i in range(len(path_underscore) + 1):
+                self.underscore_suffix_to_id.setdefault(path_underscore[i:], layer_id)
+
+        # (鍵, 插入順序, 圖層ID)：字首區間查詢後依插入順序還原，與直接走訪 path_to_id.items() 結果一致
+        self.sorted_keys = sorted((key, order, lid) for order, (key, lid) in enumerate(self.path_to_id.items()))
+        self._sorted_key_strs = [k for k, _, _ in self.sorted_keys]
+
+    def _prefix_range(self, prefix):
+        start = bisect.bisect_left(self._sorted_key_strs, prefix)
+        end = start
+        while end < len(self._sorted_key_strs) and self._sorted_key_strs[end].startswith(prefix):
+            end += 1
+        return self.sorted_keys[start:end]
+
+    def find_by_prefixes(self, prefix_slash, prefix_underscore):
+        """回傳所有以任一字首開頭的鍵對應的圖層 ID，順序與重複次數同 path_to_id 走訪結果"""
+        matched = {order: lid for _, order, lid in self._prefix_range(prefix_slash)}
+        matched.update((order, lid) for _, order, lid in self._prefix_range(prefix_underscore))
+        return [matched[order] for order in sorted(matched)]
+
+    def order_ids(self, active_ids):
+        """依總表先天順序排列啟用圖層 (正序)，等同 [lid for lid in layer_df['layer_id'] if lid in active_ids]"""
+        positioned = sorted((pos, lid) for lid in active_ids for pos in self.id_positions.get(lid, ()))
+        return [lid for _, lid in positioned]
+
+def find_layer_id(p, path_index):
     """智慧型多層級路徑匹配器：支持精確對齊與局部後綴相容，完美杜絕『同名圖層』指鹿為馬"""
     if not p or p.lower() == 'dummy': return None
+    path_to_id = path_index.path_to_id
     
     if p in path_to_id: return path_to_id[p]
     norm_p = normalize_path_string(p)
@@ -155,12 +276,10 @@ def find_layer_id(p, path_to_id, layer_df):
         p_clean = p.strip('/')
         norm_p_clean = normalize_path_string(p_clean)
         
-        for _, row in layer_df.iterrows():
-            if row['full_path_slash'].endswith(p_clean):
-                return row['layer_id']
-        for _, row in layer_df.iterrows():
-            if row['full_path_underscore'].endswith(norm_p_clean):
-                return row['layer_id']
+        if p_clean in path_index.slash_suffix_to_id:
+            return path_index.slash_suffix_to_id[p_clean]
+        if norm_p_clean in path_index.underscore_suffix_to_id:
+            return path_index.underscore_suffix_to_id[norm_p_clean]
                 
     last_part = p.split('/')[-1]
     if last_part in path_to_id: return path_to_id[last_part]
@@ -177,7 +296,7 @@ def load_layer_data_with_paths(filepath):
     print(f"[INFO] '{filepath}' 經特徵校驗確定編碼為: {detected_enc}")
     
     try:
-        if len(lines) < 2: return None
+        if len(lines) < 2: return None, None
         reader = csv.reader(lines[2:], delimiter='\t')
         for row in reader:
             if len(row) >= 10 and row[9].strip().isdigit():
@@ -213,10 +332,10 @@ def load_layer_data_with_paths(filepath):
             
         df['full_path_slash'] = df['layer_id'].map(paths_slash).fillna(df['name'])
         df['full_path_underscore'] = df['layer_id'].map(paths_underscore).fillna(df['name'].apply(normalize_path_string))
-        return df
+        return df, LayerPathIndex(df)
     except Exception as e:
         print(f"[錯誤] 處理配置總表 '{filepath}' 時發生問題: {e}")
-        return None
+        return None, None
 
 def load_sinfo_data_manual(filepath):
     print(f"[INFO] 正在解析規則定義 '{filepath}'...")
@@ -249,92 +368,113 @@ def load_sinfo_data_manual(filepath):
         return []
 
 # --- 4. 影像合成核心 (工作線程) ---
-def create_composite_task(layers_to_draw, output_path, log_file, combination_context, img_folders, dress_id_set):
-    if not layers_to_draw: return
+def get_parts_bounds(valid_parts):
+    """計算一組有效部件的聯集外框 (min_x, min_y, max_x, max_y)"""
+    first_part = valid_parts[0]
+    min_x = first_part['left']
+    min_y = first_part['top']
+    max_x = min_x + first_part['width']
+    max_y = min_y + first_part['height']
+
+    for part_info in valid_parts[1:]:
+        lx, ty = part_info['left'], part_info['top']
+        min_x, min_y = min(min_x, lx), min(min_y, ty)
+        max_x, max_y = max(max_x, lx + part_info['width']), max(max_y, ty + part_info['height'])
+    return min_x, min_y, max_x, max_y
+
+def save_cropped_canvas(master_canvas, output_path, log_file, combination_context):
+    # 智慧抗噪主動清空核心
+    alpha_channel = master_canvas.getchannel('A')
+    binary_alpha = alpha_channel.point(lambda p: 255 if p > ALPHA_THRESHOLD else 0)
+    bbox = binary_alpha.getbbox()
+    if bbox:
+        master_canvas = master_canvas.crop(bbox)
+
+    master_canvas.save(output_path)
+    with log_lock:
+        log_file.write(f"[成功生成] {combination_context}: '{os.path.basename(output_path)}'\n")
+
+def create_composite_tree_task(jobs, log_file, img_folders, dress_id_set):
+    """前綴共用合成引擎：同一組 dress/diff 的所有表情組合依 Z-Order 圖層序列建成前綴樹 (trie)，
+    共同前綴（通常是整套服裝/身體）只疊加一次，只在差異圖層處分岔，輸出與逐張從空白畫布重疊完全一致。
+
+    jobs: [(layers_to_draw, output_path, combination_context), ...]
+    """
     try:
-        valid_parts = [p for p in layers_to_draw if p['width'] > 0 and p['height'] > 0]
-        if not valid_parts: return
-        
-        first_part = valid_parts[0]
-        min_x = first_part['left']
-        min_y = first_part['top']
-        max_x = min_x + first_part['width']
-        max_y = min_y + first_part['height']
-
-        for part_info in valid_parts[1:]:
-            lx, ty = part_info['left'], part_info['top']
-            min_x, min_y = min(min_x, lx), min(min_y, ty)
-            max_x, max_y = max(max_x, lx + part_info['width']), max(max_y, ty + part_info['height'])
-        
-        canvas_width, canvas_height = max_x - min_x, max_y - min_y
-        master_canvas = Image.new("RGBA", (canvas_width, canvas_height), (0, 0, 0, 0))
-        
-        missing_dress = False
-        missing_face = False
-        loaded_layers = [] 
-        
-        for part_info in valid_parts:
-            lid = part_info['layer_id']
-            lname = part_info.get('name', '')
-                
-            part_img = None
-            possible_paths = []
-            for folder in img_folders:
-                possible_paths.append(os.path.join(folder, f"{folder}_{lid}.png"))
-                possible_paths.append(os.path.join(folder, f"{lid}.png"))
-                if lname:
-                    possible_paths.append(os.path.join(folder, f"{folder}_{lname}.png"))
-                    possible_paths.append(os.path.join(folder, f"{lname}.png"))
-                    possible_paths.append(os.path.join(folder, f"{folder}_{normalize_path_string(lname)}.png"))
-            
-            for img_p in possible_paths:
-                if os.path.exists(img_p):
-                    part_img = Image.open(img_p).convert("RGBA")
-                    break
-                    
-            if part_img is None: 
-                if lid in dress_id_set: missing_dress = True
-                else: missing_face = True
-                with log_lock:
-                    log_file.write(f"[圖層缺失] {combination_context}: 找不到圖層 ID {lid} ({lname}) 的實體圖片。\n")
-            else:
-                loaded_layers.append((part_info, part_img))
-
-        if MISSING_IMG_POLICY == 1 and missing_dress:
-            with log_lock: log_file.write(f"[原則跳過] {combination_context}: 衣服/身體圖層有缺，依控管策略(1)阻斷合成。\n")
-            return
-        elif MISSING_IMG_POLICY == 2 and (missing_dress or missing_face):
-            with log_lock: log_file.write(f"[原則跳過] {combination_context}: 組合中存有缺件，依控管策略(2)阻斷合成。\n")
-            return
-
-        if not loaded_layers: return
-
-        for part_info, part_img in loaded_layers:
-            part_opacity = part_info.get('opacity', 255)
-            if part_opacity < 255:
-                alpha = part_img.getchannel('A').point(lambda p: p * (part_opacity / 255.0))
-                part_img.putalpha(alpha)
-
-            paste_x = part_info['left'] - min_x
-            paste_y = part_info['top'] - min_y
-            
-            layer_canvas = Image.new("RGBA", (canvas_width, canvas_height), (0, 0, 0, 0))
-            layer_canvas.paste(part_img, (paste_x, paste_y))
-            master_canvas = Image.alpha_composite(master_canvas, layer_canvas)
-
-        # 智慧抗噪主動清空核心
-        alpha_channel = master_canvas.getchannel('A')
-        binary_alpha = alpha_channel.point(lambda p: 255 if p > ALPHA_THRESHOLD else 0)
-        bbox = binary_alpha.getbbox()
-        if bbox:
-            master_canvas = master_canvas.crop(bbox)
-
-        master_canvas.save(output_path)
-        with log_lock:
-            log_file.write(f"[成功生成] {combination_context}: '{os.path.basename(output_path)}'\n")
+        layer_images = {}
+        planned = []
+        for layers_to_draw, output_path, combination_context in jobs:
+            valid_parts = [p for p in layers_to_draw if p['width'] > 0 and p['height'] > 0]
+            if not valid_parts: continue
+
+            missing_dress = False
+            missing_face = False
+            loaded_ids = []
+            for part_info in valid_parts:
+                lid = part_info['layer_id']
+                lname = part_info.get('name', '')
+                if lid not in layer_images:
+                    part_img = load_layer_image(img_folders, lid, lname)
+                    # 快取中的陣列為共用唯讀物件，apply_opacity 只在 opacity < 255 時另外複製
+                    layer_images[lid] = (part_info, layer_blend.apply_opacity(part_img, part_info.get('opacity', 255))) if part_img is not None else None
+                if layer_images[lid] is None:
+                    if lid in dress_id_set: missing_dress = True
+                    else: missing_face = True
+                    with log_lock:
+                        log_file.write(f"[圖層缺失] {combination_context}: 找不到圖層 ID {lid} ({lname}) 的實體圖片。\n")
+                else:
+                    loaded_ids.append(lid)
+
+            if MISSING_IMG_POLICY == 1 and missing_dress:
+                with log_lock: log_file.write(f"[原則跳過] {combination_context}: 衣服/身體圖層有缺，依控管策略(1)阻斷合成。\n")
+                continue
+            elif MISSING_IMG_POLICY == 2 and (missing_dress or missing_face):
+                with log_lock: log_file.write(f"[原則跳過] {combination_context}: 組合中存有缺件，依控管策略(2)阻斷合成。\n")
+                continue
+
+            if not loaded_ids: continue
+            planned.append((loaded_ids, get_parts_bounds(valid_parts), output_path, combination_context))
+
+        if not planned: return
+
+        # 所有組合共用同一個座標系（聯集外框），輸出時再裁回各組合原本的畫布範圍
+        origin_x = min(b[0] for _, b, _, _ in planned)
+        origin_y = min(b[1] for _, b, _, _ in planned)
+        frame_size = (max(b[2] for _, b, _, _ in planned) - origin_x, max(b[3] for _, b, _, _ in planned) - origin_y)
+
+        # 建立前綴樹：節點 = {'children': {layer_id: 子節點}, 'jobs': [在此節點結束的組合]}
+        root = {'children': {}, 'jobs': []}
+        for loaded_ids, bounds, output_path, combination_context in planned:
+            node = root
+            for lid in loaded_ids:
+                node = node['children'].setdefault(lid, {'children': {}, 'jobs': []})
+            node['jobs'].append((bounds, output_path, combination_context))
+
+        def emit_jobs(node, canvas):
+            for (min_x, min_y, max_x, max_y), output_path, combination_context in node['jobs']:
+                job_canvas = canvas[min_y - origin_y:max_y - origin_y, min_x - origin_x:max_x - origin_x]
+                save_cropped_canvas(layer_blend.array_to_image(job_canvas), output_path, log_file, combination_context)
+
+        def blend_node(canvas, lid):
+            part_info, part_img = layer_images[lid]
+            return layer_blend.blend_region(canvas, part_img, part_info['left'] - origin_x, part_info['top'] - origin_y)
+
+        def walk(node, canvas):
+            # 單一路徑直接在同一張畫布上原地往下疊；只有分岔點才複製畫布給其他分支，最後一個分支沿用原畫布
+            while True:
+                emit_jobs(node, canvas)
+                if len(node['children']) != 1: break
+                (lid, node), = node['children'].items()
+                blend_node(canvas, lid)
+            children = list(node['children'].items())
+            for i, (lid, child) in enumerate(children):
+                branch_canvas = canvas if i == len(children) - 1 else canvas.copy()
+                walk(child, blend_node(branch_canvas, lid))
+
+        walk(root, layer_blend.new_canvas(*frame_size))
     except Exception as e:
         with log_lock:
-            print(f"  ❌ [錯誤] {os.path.basename(output_path)}: {e}")
+            print(f"  ❌ [錯誤] {jobs[0][2] if jobs else ''}: {e}")
             log_file.write(f"合成圖片錯誤: {e}\n")
 
 # --- 5. 邏輯控制中心 ---
@@ -351,9 +491,12 @@ def process_character(pbd_txt_path, sinfo_path, log_file):
     log_file.write(f"\n===== 開始檢查立繪配置: {pbd_base_name} =====\n")
     print(f"\n{'='*20} 開始處理: {pbd_base_name} {'='*20}")
 
-    layer_df = load_layer_data_with_paths(pbd_txt_path)
+    layer_df, path_index = load_layer_data_with_paths(pbd_txt_path)
     if layer_df is None: return
 
+    # 每個角色使用獨立的圖層集合，換角色時清空快取與命中統計
+    layer_cache.clear()
+
     sinfo_rules = load_sinfo_data_manual(sinfo_path)
     if not sinfo_rules: return
 
@@ -363,16 +506,7 @@ def process_character(pbd_txt_path, sinfo_path, log_file):
         existing_files = glob.glob(os.path.join(char_output_folder, '*.png'))
         generated_filenames_set.update(os.path.basename(f) for f in existing_files)
 
-    path_to_id = {}
-    layer_diff_map = {} 
-    for _, r in layer_df.iterrows():
-        path_to_id[r['full_path_slash']] = r['layer_id']
-        path_to_id[r['full_path_underscore']] = r['layer_id']
-        path_to_id[normalize_path_string(r['full_path_slash'])] = r['layer_id']
-        path_to_id[r['name']] = r['layer_id']
-        path_to_id[normalize_path_string(r['name'])] = r['layer_id']
-        if r['diff_id']:
-            layer_diff_map[r['layer_id']] = int(r['diff_id'])
+    layer_diff_map = path_index.layer_diff_map
 
     img_folders = [pbd_base_name, stripped_base_name]
 
@@ -489,10 +623,10 @@ def process_character(pbd_txt_path, sinfo_path, log_file):
                 
                 dress_layers_ids = []
                 for p in dress_paths:
-                    lid = find_layer_id(p, path_to_id, layer_df)
+                    lid = find_layer_id(p, path_index)
                     if lid is None and '/' in p:
                         last_part = p.split('/')[-1]
-                        lid = find_layer_id(last_part, path_to_id, layer_df)
+                        lid = find_layer_id(last_part, path_index)
                         
                     if lid is not None:
                         dress_layers_ids.append(lid)
@@ -517,13 +651,17 @@ def process_character(pbd_txt_path, sinfo_path, log_file):
                 current_ff = face_folders[dress_name].get(diff_id, None)
                 
                 # 💡 完美修正：將全域已知的服裝與姿勢快取名單傳入，修復 NameError
-                submit_face_combinations(executor, futures, active_face_rules, dress_layers_ids, path_to_id, layer_df, pbd_base_name, dress_name, diff_id, generated_filenames_set, log_file, output_folder, img_folders, current_ff, layer_diff_map, all_dresses, all_poses)
+                submit_face_combinations(executor, futures, active_face_rules, dress_layers_ids, path_index, layer_df, pbd_base_name, dress_name, diff_id, generated_filenames_set, log_file, output_folder, img_folders, current_ff, layer_diff_map, all_dresses, all_poses)
         
         concurrent.futures.wait(futures)
+
+    with log_lock:
+        log_file.write(f"[圖層快取] {pbd_base_name}: 命中 {layer_cache.hits} 次 / 未命中 {layer_cache.misses} 次，"
+                       f"目前佔用 {layer_cache.current_bytes / (1024 * 1024):.1f} MB\n")
     print(f"『{pbd_base_name}』全局 Z-Order 智慧版合成工作順利完工！")
 
 # --- 6. 核心排序與組合發送引擎 ---
-def submit_face_combinations(executor, futures, face_rule_dict, dress_layers_ids, path_to_id, layer_df, pbd_base_name, dress_name, diff_id, generated_filenames_set, log_file, output_folder, img_folders, face_folder, layer_diff_map, all_dresses, all_poses):
+def submit_face_combinations(executor, futures, face_rule_dict, dress_layers_ids, path_index, layer_df, pbd_base_name, dress_name, diff_id, generated_filenames_set, log_file, output_folder, img_folders, face_folder, layer_diff_map, all_dresses, all_poses):
     
     dress_id_set = set(dress_layers_ids)
     all_needed_ids_set = dress_id_set.copy()
@@ -535,18 +673,17 @@ def submit_face_combinations(executor, futures, face_rule_dict, dress_layers_ids
                  prefix_slash = p.replace('*', '')
                  if face_folder: prefix_slash = f"{face_folder}/{prefix_slash}"
                  prefix_underscore = normalize_path_string(prefix_slash)
-                 for full_path, lid in path_to_id.items():
-                     if full_path.startswith(prefix_slash) or full_path.startswith(prefix_underscore):
-                         all_needed_ids_set.add(lid)
+                 all_needed_ids_set.update(path_index.find_by_prefixes(prefix_slash, prefix_underscore))
              else:
-                 lid = find_layer_id(p, path_to_id, layer_df)
+                 lid = find_layer_id(p, path_index)
                  if face_folder and lid is None:
-                     lid = find_layer_id(f"{face_folder}/{p}", path_to_id, layer_df)
+                     lid = find_layer_id(f"{face_folder}/{p}", path_index)
                  if lid: 
                      all_needed_ids_set.add(lid)
 
     filtered_df = layer_df[layer_df['layer_id'].isin(all_needed_ids_set)].copy()
     layer_info_map = filtered_df.set_index('layer_id').to_dict('index')
+    composite_jobs = []
 
     for face_name, face_paths in face_rule_dict.items():
         combination_context = f"組合 '{dress_name}_{diff_id} + {face_name}'"
@@ -588,15 +725,15 @@ def submit_face_combinations(executor, futures, face_rule_dict, dress_layers_ids
                 prefix_slash = p.replace('*', '')
                 if face_folder: prefix_slash = f"{face_folder}/{prefix_slash}"
                 prefix_underscore = normalize_path_string(prefix_slash)
-                matched_lids = [lid for full_path, lid in path_to_id.items() if full_path.startswith(prefix_slash) or full_path.startswith(prefix_underscore)]
+                matched_lids = path_index.find_by_prefixes(prefix_slash, prefix_underscore)
                 if matched_lids: face_layers_ids.extend(matched_lids)
                 else: all_paths_found = False
             else:
                 lid = None
                 if face_folder:
-                    lid = find_layer_id(f"{face_folder}/{p}", path_to_id, layer_df)
+                    lid = find_layer_id(f"{face_folder}/{p}", path_index)
                 if lid is None:
-                    lid = find_layer_id(p, path_to_id, layer_df)
+                    lid = find_layer_id(p, path_index)
                     
                 if lid is None: all_paths_found = False
                 else: face_layers_ids.append(lid)
@@ -612,7 +749,7 @@ def submit_face_combinations(executor, futures, face_rule_dict, dress_layers_ids
                 additional_linked_ids.add(layer_diff_map[active_id])
         current_active_set.update(additional_linked_ids)
         
-        ordered_ids = [int(lid) for lid in layer_df['layer_id'].values if lid in current_active_set][::-1]
+        ordered_ids = [int(lid) for lid in path_index.order_ids(current_active_set)][::-1]
         # ====================================================================================
         
         layers_to_draw = []
@@ -668,7 +805,11 @@ def submit_face_combinations(executor, futures, face_rule_dict, dress_layers_ids
         if not os.path.exists(char_output_folder): os.makedirs(char_output_folder)
         output_path = os.path.join(char_output_folder, output_filename)
         
-        futures.append(executor.submit(create_composite_task, layers_to_draw, output_path, log_file, combination_context, img_folders, dress_id_set))
+        composite_jobs.append((layers_to_draw, output_path, combination_context))
+
+    # 同一組 dress/diff 的所有表情組合交給同一個工作線程，以前綴樹共用服裝部分的疊加結果
+    if composite_jobs:
+        futures.append(executor.submit(create_composite_tree_task, composite_jobs, log_file, img_folders, dress_id_set))
 
 # --- 7. 程式主入口 ---
 if __name__ == '__main__':
@@ -716,4 +857,4 @@ if __name__ == '__main__':
                 print(f"[警告] 找不到與 '{layout_file}' 相匹配的規則母檔，已跳過。")
                 log_file.write(f"[警告] 找不到 '{layout_file}' 的相匹配規則母檔，已跳過。\n")
                 
-    print(f"\n所有任務全面竣工！請查閱 output 資料夾與 {LOG_FILENAME} 檔案。")
\ No newline at end of file
+    print(f"\n所有任務全面竣工！請查閱 output 資料夾與 {LOG_FILENAME} 檔案。")
\ No newline at end of file
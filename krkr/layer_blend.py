@@ -0,0 +1,93 @@
+# ==============================================================================
+# 【區域限定整數 Alpha 疊加核心】
+# ==============================================================================
+# 供 krkr立繪_多工.py 與 Purpure立繪alpha_composite多工.py 共用：
+# 1. 畫布為單一預先配置的 uint8 RGBA 陣列 (高, 寬, 4)，所有部件直接原地寫入。
+# 2. 每個部件只處理自己與畫布相交的矩形範圍，不再建立整張透明 layer_canvas。
+# 3. 完全使用整數運算，公式與 Pillow Image.alpha_composite 相同，輸出逐像素一致。
+# 4. 支援圖層 opacity 欄位（與原本 point(lambda p: p * (opacity / 255.0)) 結果相同）。
+# ==============================================================================
+
+import numpy as np
+from PIL import Image
+
+# Pillow AlphaComposite.c 使用的定點精度
+PRECISION_BITS = 7
+
+
+def new_canvas(width, height):
+    """建立全透明的 RGBA 畫布陣列"""
+    return np.zeros((height, width, 4), dtype=np.uint8)
+
+
+def image_to_array(img):
+    """將 PIL 圖片轉為 (高, 寬, 4) 的 uint8 RGBA 陣列"""
+    if img.mode != "RGBA":
+        img = img.convert("RGBA")
+    return np.asarray(img)
+
+
+def array_to_image(canvas):
+    """將畫布陣列轉回 PIL RGBA 圖片 (會複製資料，之後可繼續改寫畫布)"""
+    return Image.fromarray(np.ascontiguousarray(canvas), "RGBA")
+
+
+def opacity_lut(opacity):
+    """opacity 對應的 Alpha 查找表：round(a * opacity / 255)，以整數四捨五入計算"""
+    a = np.arange(256, dtype=np.uint32)
+    return ((a * opacity * 2 + 255) // 510).astype(np.uint8)
+
+
+def apply_opacity(part, opacity):
+    """回傳套用 opacity 後的部件陣列；opacity >= 255 時直接回傳原陣列 (不複製)"""
+    if opacity >= 255:
+        return part
+    out = part.copy()
+    out[..., 3] = opacity_lut(max(opacity, 0))[part[..., 3]]
+    return out
+
+
+def _shift_div255(a):
+    return ((a >> 8) + a) >> 8
+
+
+def blend_region(canvas, part, x, y, opacity=255):
+    """將部件以左上角 (x, y) 原地疊加到畫布上，只運算兩者相交的矩形範圍。
+
+    canvas: (H, W, 4) uint8 畫布，會被直接改寫
+    part:   (h, w, 4) uint8 部件
+    """
+    canvas_h, canvas_w = canvas.shape[:2]
+    part_h, part_w = part.shape[:2]
+
+    x0, y0 = max(x, 0), max(y, 0)
+    x1, y1 = min(x + part_w, canvas_w), min(y + part_h, canvas_h)
+    if x0 >= x1 or y0 >= y1:
+        return canvas
+
+    src = part[y0 - y:y1 - y, x0 - x:x1 - x]
+    dst = canvas[y0:y1, x0:x1]
+
+    src_a = src[..., 3]
+    if opacity < 255:
+        src_a = opacity_lut(max(opacity, 0))[src_a]
+
+    mask = src_a != 0
+    if not mask.any():
+        return canvas
+
+    sa = src_a.astype(np.uint32)
+    da = dst[..., 3].astype(np.uint32)
+    outa255 = sa * 255 + da * (255 - sa)
+    coef1 = sa * (255 * 255 * (1 << PRECISION_BITS)) // np.maximum(outa255, 1)
+    coef2 = 255 * (1 << PRECISION_BITS) - coef1
+
+    out = np.empty(src.shape, dtype=np.uint32)
+    np.multiply(src[..., :3], coef1[..., None], out=out[..., :3], dtype=np.uint32)
+    out[..., :3] += dst[..., :3] * coef2[..., None]
+    out[..., :3] += 0x80 << PRECISION_BITS
+    out[..., :3] = _shift_div255(out[..., :3]) >> PRECISION_BITS
+    out[..., 3] = _shift_div255(outa255 + 0x80)
+
+    np.copyto(dst, out.astype(np.uint8), where=mask[..., None])
+    return canvas
@@ -1,8 +1,7 @@
 import argparse
-import sqlite3
+import sys
 import os
 import glob
-import struct
 import re
 import csv
 from PIL import Image, ImageChops
@@ -10,27 +9,20 @@ import numpy as np
 from dataclasses import dataclass, field
 from typing import List, Dict, Any, Optional
 from concurrent.futures import ProcessPoolExecutor, as_completed # <--- 匯入多進程處理模組
-import functools # <--- 用於輔助傳遞參數
+from collections import OrderedDict
+try:
+    import lsf_reader, escude_blend, escude_mdb
+except ImportError:
+    # 未把 lsf_reader.py / escude_blend.py / escude_mdb.py 複製到同一資料夾時，從 repo 內的 lsf/ 目錄載入
+    sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'lsf'))
+    import lsf_reader, escude_blend, escude_mdb
+from lsf_reader import LsfData
 
 # ===========================================================================
 # 1. 資料結構定義 (與之前相同)
 # ===========================================================================
 # ... (為了簡潔，此處省略與上一版完全相同的 dataclass 定義) ...
-@dataclass
-class LsfFileHeader:
-    revision: int = 0; bg: int = 0; id: int = 0; layer_count: int = 0; width: int = 0; height: int = 0; bx: int = 0; by: int = 0
-@dataclass
-class Rect:
-    left: int = 0; top: int = 0; right: int = 0; bottom: int = 0
-@dataclass
-class LsfLayerInfo:
-    name: str = ""; text: str = ""; rect: Rect = field(default_factory=Rect); cx: int = 0; cy: int = 0; index: int = 0; state: int = 0; mode: int = 0; opacity: int = 0; fill: int = 0; value: int = 0; skip: bool = False
-@dataclass
-class LsfImageData:
-    file_path: str = ""; width: int = 0; height: int = 0
-@dataclass
-class LsfData:
-    filepath: str; lsf_name: str; header: LsfFileHeader = field(default_factory=LsfFileHeader); layers_info: List[LsfLayerInfo] = field(default_factory=list); images: List[LsfImageData] = field(default_factory=list)
+# LsfFileHeader / Rect / LsfLayerInfo / LsfImageData / LsfData 由共用的 lsf_reader.py 提供
 @dataclass
 class StTable:
     name: str; file: str; option: List[str]; face: int; order: int
@@ -45,33 +37,25 @@ class EvTable:
 # 2. 核心邏輯實作 (與之前相同)
 # ===========================================================================
 # ... (為了簡潔，此處省略 LsfManager, TableManager, ImageManager 等與上一版完全相同的 class) ...
-def decode_str(b: bytes) -> str:
-    return b.decode('cp932', errors='ignore').strip('\x00')
 class LsfManager:
-    def __init__(self): self._lsf_lookup = {}
+    def __init__(self): self._lsf_lookup = {}; self._lsf_paths = {}
+    def index_lsf(self, paths: List[str]):
+        """只記錄 名稱 -> 路徑，第一次 find_lsf_data_by_name 時才解析 (工人程序只載入自己用到的 LSF)。"""
+        for path in paths: self._lsf_paths[os.path.splitext(os.path.basename(path))[0].lower()] = path
     def load_lsf(self, path: str):
-        if not os.path.isfile(path): return
-        lsf_name = os.path.splitext(os.path.basename(path))[0].lower()
-        lsf_dir = os.path.dirname(path)
-        with open(path, 'rb') as f:
-            header_bytes = f.read(28)
-            if len(header_bytes) < 28: return
-            sig, rev, bg, id, l_count, w, h, bx, by = struct.unpack('<IHHHHiiii', header_bytes)
-            if sig != 0x46534C: return
-            header = LsfFileHeader(rev, bg, id, l_count, w, h, bx, by)
-            lsf_data = LsfData(filepath=path, lsf_name=lsf_name, header=header)
-            for _ in range(header.layer_count):
-                layer_bytes = f.read(164)
-                if len(layer_bytes) < 164: continue
-                name_b, text_b, r_l, r_t, r_r, r_b, cx, cy, idx, state, mode, op, fill, val = struct.unpack('<64s64siiiiiiBBBBII', layer_bytes)
-                layer_info = LsfLayerInfo(name=decode_str(name_b), text=decode_str(text_b), rect=Rect(r_l, r_t, r_r, r_b), cx=cx, cy=cy, index=idx, state=state, mode=mode, opacity=op, fill=fill, value=val)
-                if name_b.startswith(b'\x00ul\x00'): layer_info.skip = True
-                lsf_data.layers_info.append(layer_info)
-                img = LsfImageData()
-                if not layer_info.skip: img.file_path = os.path.join(lsf_dir, layer_info.name + ".png")
-                lsf_data.images.append(img)
-        self._lsf_lookup[lsf_name] = lsf_data
-    def find_lsf_data_by_name(self, name: str) -> LsfData: return self._lsf_lookup.get(name.lower())
+        lsf_data = lsf_reader.read_lsf(path)
+        if lsf_data is not None: self._lsf_lookup[lsf_data.lsf_name] = lsf_data
+        return lsf_data
+    def load_many(self, paths: List[str], workers: Optional[int] = None) -> List[Optional[LsfData]]:
+        """以 lsf_reader 的進程池批次解析，回傳與 paths 同順序的結果 (失敗為 None)。"""
+        results = lsf_reader.read_lsf_files(paths, workers)
+        for lsf_data in results:
+            if lsf_data is not None: self._lsf_lookup[lsf_data.lsf_name] = lsf_data
+        return results
+    def find_lsf_data_by_name(self, name: str) -> LsfData:
+        key = name.lower()
+        if key not in self._lsf_lookup and key in self._lsf_paths: self.load_lsf(self._lsf_paths.pop(key))
+        return self._lsf_lookup.get(key)
 class TableManager:
     @staticmethod
     def parse_options(lsf_data: LsfData, option_str: str) -> list:
@@ -93,43 +77,98 @@ class TableManager:
         zipped = sorted(zip(layer_indices, layer_filenames), key=lambda x: get_sort_key(x[1]))
         return [item[0] for item in zipped]
 class ImageManager:
+    # 每個進程各自的小型 LRU 快取：(lsf_name, layer_index) -> 解碼後的 RGBA 陣列 (找不到圖片時為 None)
+    # 同一筆 ST 記錄的各個表情 / 臉紅變化會重複使用身體、衣服等圖層，不必每次重新解碼 PNG
+    # 以陣列的總 bytes 限制大小 (全身大小的身體圖層一張就有十幾 MB，不能只限制張數)
+    LAYER_CACHE_BYTES = 128 * 1024 * 1024
+    _layer_cache = OrderedDict()
+    _layer_cache_bytes = 0
     @staticmethod
-    def composite(base_img: Image.Image, lsf_data: LsfData, layer_index: int) -> Image.Image:
-        layer_info = lsf_data.layers_info[layer_index]; image_info = lsf_data.images[layer_index]
-        if not image_info.file_path or not os.path.exists(image_info.file_path): return base_img
-        with Image.open(image_info.file_path) as part_img:
-            part_img = part_img.convert("RGBA"); base_np = np.array(base_img, dtype=np.float64) / 255.0; part_np = np.array(part_img, dtype=np.float64) / 255.0
-            fg_layer = np.zeros_like(base_np); dx, dy = layer_info.rect.left, layer_info.rect.top; part_h, part_w = part_np.shape[:2]; base_h, base_w = base_np.shape[:2]
-            x1, y1 = max(dx, 0), max(dy, 0); x2, y2 = min(dx + part_w, base_w), min(dy + part_h, base_h)
-            part_x1, part_y1 = x1 - dx, y1 - dy; part_x2, part_y2 = x2 - dx, y2 - dy
-            if x1 < x2 and y1 < y2: fg_layer[y1:y2, x1:x2] = part_np[part_y1:part_y2, part_x1:part_x2]
-            bg_rgb, bg_a = base_np[:,:,:3], base_np[:,:,3:4]; fg_rgb, fg_a = fg_layer[:,:,:3], fg_layer[:,:,3:4]
-            mode = layer_info.mode; out_a = fg_a + bg_a * (1.0 - fg_a); mask = out_a > 1e-6
-            if mode == 3: out_rgb_blend = fg_rgb * bg_rgb
-            elif mode == 10: out_rgb_blend = fg_rgb + bg_rgb
-            else: out_rgb_blend = fg_rgb
-            numerator = out_rgb_blend * fg_a + bg_rgb * bg_a * (1.0 - fg_a); out_rgb = np.zeros_like(bg_rgb)
-            np.divide(numerator, out_a, where=mask, out=out_rgb)
-            final_np_float = np.concatenate([out_rgb, out_a], axis=2); final_np_float = np.clip(final_np_float, 0.0, 1.0) 
-            final_np_uint8 = (final_np_float * 255).round().astype(np.uint8)
-            return Image.fromarray(final_np_uint8, 'RGBA')
+    def load_layer(lsf_data: LsfData, layer_index: int) -> Optional[np.ndarray]:
+        cache = ImageManager._layer_cache; key = (lsf_data.lsf_name, layer_index)
+        if key in cache:
+            cache.move_to_end(key); return cache[key]
+        image_info = lsf_data.images[layer_index]; part_np = None
+        if image_info.file_path and os.path.exists(image_info.file_path):
+            with Image.open(image_info.file_path) as part_img:
+                part_np = np.asarray(part_img.convert("RGBA"))
+        cache[key] = part_np
+        if part_np is not None: ImageManager._layer_cache_bytes += part_np.nbytes
+        # 超過上限時從最久未使用的開始移除 (至少保留剛載入的這一張)
+        while ImageManager._layer_cache_bytes > ImageManager.LAYER_CACHE_BYTES and len(cache) > 1:
+            _, evicted = cache.popitem(last=False)
+            if evicted is not None: ImageManager._layer_cache_bytes -= evicted.nbytes
+        return part_np
+    @staticmethod
+    def composite(canvas: np.ndarray, lsf_data: LsfData, layer_index: int) -> np.ndarray:
+        """把一個圖層混合進 (高, 寬, 4) uint8 畫布 (原地修改)，只計算部件與畫布重疊的矩形。"""
+        layer_info = lsf_data.layers_info[layer_index]
+        part_np = ImageManager.load_layer(lsf_data, layer_index)
+        if part_np is None: return canvas
+        return escude_blend.blend_into(canvas, part_np, layer_info.rect.left, layer_info.rect.top, layer_info.mode, layer_info.opacity)
 
 # ===========================================================================
 # 3. 任務函式 (給多進程使用)
 # ===========================================================================
 
+# --- 工人程序內部使用的全域變數 ---
+# 由 init_worker 在每個工人程序啟動時建立一次；派發的任務只帶記錄 id，
+# 不再把 LsfManager / LsfData 隨每個任務重新 pickle 一次
+worker_lsf_manager = None
+worker_context = None
+
+def init_worker(lsf_paths: List[str], context: dict):
+    """工人初始化：建立 LSF 索引 (延遲解析) 並保存所有任務共用的參數 (記錄列表、輸出目錄等)。"""
+    global worker_lsf_manager, worker_context
+    worker_lsf_manager = LsfManager(); worker_lsf_manager.index_lsf(lsf_paths)
+    worker_context = context
+
+def run_tasks(task_func, task_ids: list, lsf_paths: List[str], context: dict, jobs: Optional[int] = None):
+    """以 init_worker 建立進程池，逐一派發 task_func(id)，並依完成順序即時回傳 (id, 結果或例外)。"""
+    with ProcessPoolExecutor(max_workers=jobs, initializer=init_worker, initargs=(lsf_paths, context)) as executor:
+        futures = {executor.submit(task_func, task_id): task_id for task_id in task_ids}
+        for future in as_completed(futures):
+            try: yield futures[future], future.result()
+            except Exception as exc: yield futures[future], exc
+
 def process_and_save(lsf_data: LsfData, layer_indices: list, output_path: str):
     """
     單一圖片的合成與儲存任務 (無變化)。
     """
     header = lsf_data.header
-    canvas = Image.new('RGBA', (header.width, header.height), (0, 0, 0, 0))
+    canvas = escude_blend.new_canvas(header.width, header.height)
     for index in layer_indices:
-        canvas = ImageManager.composite(canvas, lsf_data, index)
-    canvas.save(output_path, 'PNG')
+        ImageManager.composite(canvas, lsf_data, index)
+    Image.fromarray(canvas, 'RGBA').save(output_path, 'PNG')
     # 在子進程中，我們回傳檔名以供主進程顯示
     return os.path.basename(output_path)
 
+def render_variants(lsf_data: LsfData, plans: list) -> list:
+    """
+    合成同一個 LSF 的多張圖片，plans 為 [(排序後的圖層列表, 輸出路徑), ...]。
+    將所有圖層列表建成前綴樹：共用的前綴只合成一次，只有在圖層開始不同的地方才複製畫布分支，
+    結果與每張圖各自呼叫 process_and_save 相同。回傳輸出的檔名列表。
+    分支在從堆疊取出時才複製畫布，同時存在的畫布數量只與樹的深度有關，與分支數無關。
+    """
+    root = {'children': {}, 'outputs': []}
+    for layers, output_path in plans:
+        node = root
+        for index in layers: node = node['children'].setdefault(index, {'children': {}, 'outputs': []})
+        node['outputs'].append(output_path)
+    header = lsf_data.header; saved = []
+    # 堆疊項目：(節點, 上一層的畫布, 此節點的圖層, 是否需要複製畫布)
+    stack = [(root, escude_blend.new_canvas(header.width, header.height), None, False)]
+    while stack:
+        node, canvas, index, needs_copy = stack.pop()
+        if needs_copy: canvas = canvas.copy()
+        if index is not None: ImageManager.composite(canvas, lsf_data, index)
+        for output_path in node['outputs']:
+            Image.fromarray(canvas, 'RGBA').save(output_path, 'PNG'); saved.append(os.path.basename(output_path))
+        # 第一個分支最先放入、最後取出，直接沿用這張畫布；其餘分支取出時 (畫布尚未被改動) 才各自複製一份
+        for i, (index, child) in enumerate(node['children'].items()):
+            stack.append((child, canvas, index, i > 0))
+    return saved
+
 def process_st_record(st: StTable, lsf_manager: LsfManager, face_groups: dict, output_dir: str, blush_mode: Optional[int]):
     """
     處理單一 ST 記錄的完整任務，包含生成多種變化版本。
@@ -141,7 +180,7 @@ def process_st_record(st: StTable, lsf_manager: LsfManager, face_groups: dict, o
     face_data = face_groups.get(st.face, Face())
     if not face_data.face_options: return f"[資訊] {st.name}: 無額外表情選項"
 
-    generated_files = []
+    plans = []
     for n, face_opt in enumerate(face_data.face_options):
         base_options = st.option + [face_opt]
         no_blush_options = [opt for opt in base_options if not opt.startswith('p2:')]
@@ -169,13 +208,36 @@ def process_st_record(st: StTable, lsf_manager: LsfManager, face_groups: dict, o
             if not all_layers: continue
             ordered_list = TableManager.order_layer(all_layers, all_filenames)
             output_path = os.path.join(output_dir, f"{st.name}_{n}{suffix}.png")
-            
-            # 實際執行合成
-            process_and_save(lsf_data, ordered_list, output_path)
-            generated_files.append(os.path.basename(output_path))
-            
+            plans.append((ordered_list, output_path))
+
+    # 實際執行合成：所有表情與臉紅變化一起規劃，共用的圖層前綴只合成一次
+    generated_files = render_variants(lsf_data, plans)
     return f"[成功] {st.name}: 已生成 {len(generated_files)} 個檔案"
 
+def st_record_task(record_id: int):
+    """工人任務：依 id 從 worker_context 取出 ST 記錄並處理。"""
+    ctx = worker_context
+    return process_st_record(ctx['records'][record_id], worker_lsf_manager, ctx['face_groups'], ctx['output_dir'], ctx['blush_mode'])
+
+def ev_record_task(record_id: int):
+    """工人任務：依 id 從 worker_context 取出 EV 記錄，計算圖層順序並合成。"""
+    evt = worker_context['records'][record_id]
+    lsf_data = worker_lsf_manager.find_lsf_data_by_name(evt.file)
+    if not lsf_data: return f"[警告] 找不到 LSF 檔案: {evt.file}.lsf，跳過。"
+    base_name = evt.name; cg_order = evt.order
+    match = re.search(r'[@#]', base_name)
+    new_name = f"{base_name[:match.start()]}_{cg_order}{base_name[match.start():]}" if match else f"{base_name}_{cg_order}"
+    output_path = os.path.join(worker_context['output_dir'], f"{new_name}.png")
+    pending_list, pending_list_fn = [], []
+    for opt in evt.option:
+        if not opt: continue
+        layer_indices = TableManager.parse_options(lsf_data, opt)
+        pending_list.extend(layer_indices)
+        for i in layer_indices: pending_list_fn.append(lsf_data.layers_info[i].name)
+    ordered_list = TableManager.order_layer(pending_list, pending_list_fn)
+    if not ordered_list or ordered_list[0] != 0: ordered_list.insert(0, 0)
+    return f"已完成: {process_and_save(lsf_data, ordered_list, output_path)}"
+
 # ===========================================================================
 # 4. 主功能函式 (重構成使用多進程)
 # ===========================================================================
@@ -188,20 +250,19 @@ def compose_st_images(image_dir: str, db_path: str, blush_mode: Optional[int] =
     print(f"\n--- {title} ---")
     if not os.path.isdir(image_dir) or not os.path.isfile(db_path): print(f"[錯誤] 請檢查提供的路徑是否有效。"); return
     
-    print("[*] 正在載入所有 LSF 檔案...")
-    lm = LsfManager(); [lm.load_lsf(p) for p in glob.glob(os.path.join(image_dir, '**', '*.lsf'), recursive=True)]
+    print("[*] 正在建立 LSF 檔案索引...")
+    lsf_paths = lsf_reader.find_lsf_files(image_dir)
     
     print("[*] 正在讀取資料庫...")
-    conn = sqlite3.connect(db_path); conn.row_factory = sqlite3.Row; cursor = conn.cursor()
-    all_tables = [row[0] for row in cursor.execute("SELECT name FROM sqlite_master WHERE type='table'")]
+    tables = escude_mdb.open_tables(db_path)  # db_path 可以是 -d 轉出的 .db，也可以直接是遊戲的 .bin
+    all_tables = tables.table_names()
     st_table_name = next((name for name in all_tables if name.startswith("立ち")), None)
     face_table_name = next((name for name in all_tables if name.startswith("表情")), None)
-    if not st_table_name or not face_table_name: print(f"[錯誤] 找不到 '立ち' 或 '表情' 資料表。"); conn.close(); return
-    st_records = [StTable(name=r['ID_44'], file=r['ファイル_44'], option=(r['オプション_44'] or "").split(' '), face=r['表情_14'], order=r['CG鑑賞_14']) for r in cursor.execute(f"SELECT * FROM [{st_table_name}]")]
+    if not st_table_name or not face_table_name: print(f"[錯誤] 找不到 '立ち' 或 '表情' 資料表。"); tables.close(); return
+    st_records = [StTable(name=r['ID_44'], file=r['ファイル_44'], option=(r['オプション_44'] or "").split(' '), face=r['表情_14'], order=r['CG鑑賞_14']) for r in tables.rows(st_table_name)]
     face_groups = {}
-    face_table_info = cursor.execute(f"PRAGMA table_info([{face_table_name}])").fetchall(); face_table_columns = [info['name'] for info in face_table_info]
-    face_records = cursor.execute(f"SELECT * FROM [{face_table_name}]").fetchall()
-    for r in face_records:
+    face_table_columns = tables.columns(face_table_name)
+    for r in tables.rows(face_table_name):
         option_value = r['オプション_44']
         if not option_value: continue
         for i, col_name in enumerate(face_table_columns[2:], 2):
@@ -209,7 +270,7 @@ def compose_st_images(image_dir: str, db_path: str, blush_mode: Optional[int] =
             if r[col_name] == 1:
                 if face_id not in face_groups: face_groups[face_id] = Face()
                 face_groups[face_id].face_options.append(option_value)
-    conn.close()
+    tables.close()
     print(f"[*] 資料庫讀取完畢，共 {len(st_records)} 筆立繪記錄，{len(face_groups)} 個表情組。")
     
     output_dir = os.path.join(os.path.dirname(image_dir) or ".", "Output_ST_Py"); os.makedirs(output_dir, exist_ok=True)
@@ -217,21 +278,14 @@ def compose_st_images(image_dir: str, db_path: str, blush_mode: Optional[int] =
     print("[*] 開始派發合成任務到 CPU 核心...")
 
     # <<<< 這裡是新的多進程處理核心 >>>>
-    tasks_to_run = [rec for rec in st_records if rec.order != 0]
-    with ProcessPoolExecutor() as executor:
-        # 使用 functools.partial 來「預填」那些在所有任務中都相同的參數
-        task_func = functools.partial(process_st_record, 
-                                      lsf_manager=lm, 
-                                      face_groups=face_groups, 
-                                      output_dir=output_dir,
-                                      blush_mode=blush_mode)
-        
-        # 將所有任務提交到進程池，並在完成時獲取結果
-        results = list(executor.map(task_func, tasks_to_run))
-
-    print("[*] 所有任務已完成。結果摘要：")
-    for res in results:
+    # 記錄列表與共用參數只在工人初始化時傳一次，任務本身只帶記錄 id，結果依完成順序即時顯示
+    task_ids = [i for i, rec in enumerate(st_records) if rec.order != 0]
+    context = {'records': st_records, 'face_groups': face_groups, 'output_dir': output_dir, 'blush_mode': blush_mode}
+    for record_id, res in run_tasks(st_record_task, task_ids, lsf_paths, context):
+        if isinstance(res, Exception): res = f"[錯誤] {st_records[record_id].name}: {res}"
         print(f"  - {res}")
+
+    print("[*] 所有任務已完成。")
         
     print("\n--- ST 圖片處理完成 ---")
 
@@ -245,47 +299,21 @@ def convert_bin_to_db(bin_dir: str):
     for filepath in bin_files:
         print(f"[*] 正在處理檔案: {filepath}")
         output_db_path = os.path.join(output_dir, os.path.basename(filepath).replace('.bin', '.db'))
-        if os.path.exists(output_db_path): os.remove(output_db_path)
-        conn = sqlite3.connect(output_db_path); cursor = conn.cursor()
-        with open(filepath, 'rb') as f:
-            if f.read(4) != b'mdb\x00': print("[!] 檔案簽名無效。"); continue
-            sheet_index = 0
-            while True:
-                size_bytes = f.read(4)
-                if not size_bytes or size_bytes == b'\x00\x00\x00\x00': print("  [-] 已到達檔案結尾標記。"); break
-                try:
-                    schema_size = struct.unpack('<I', size_bytes)[0]; schema_block = f.read(schema_size)
-                    data_size = struct.unpack('<I', f.read(4))[0]; data_block = f.read(data_size)
-                    text_size = struct.unpack('<I', f.read(4))[0]; text_pool = f.read(text_size)
-                    sheet_data = process_sheet_for_db(schema_block, data_block, text_pool)
-                    if sheet_data and sheet_data['columns']:
-                        table_name = f"{sheet_data['name']}_{sheet_index:02d}"
-                        print(f"    - 正在寫入資料表: [{table_name}]")
-                        cols_defs = [f"[{col['name']}] {'TEXT' if col['type'] == 4 else 'INTEGER'}" for col in sheet_data['columns']]
-                        cursor.execute(f"CREATE TABLE IF NOT EXISTS [{table_name}] ({', '.join(cols_defs)})")
-                        if sheet_data['records']:
-                            col_names = [f"[{col['name']}]" for col in sheet_data['columns']]
-                            placeholders = ', '.join(['?'] * len(col_names))
-                            insert_sql = f"INSERT INTO [{table_name}] ({', '.join(col_names)}) VALUES ({placeholders})"
-                            data_to_insert = [tuple(rec[col['name']] for col in sheet_data['columns']) for rec in sheet_data['records']]
-                            cursor.executemany(insert_sql, data_to_insert)
-                    sheet_index += 1
-                except Exception as e:
-                    print(f"  [!!!] 處理過程中發生意外錯誤: {e}"); break
-        conn.commit(); conn.close()
-        print(f"[+] 成功轉換並儲存到 '{output_db_path}'\n")
+        # 轉出的 .db 會記錄 .bin 的大小與修改時間，.bin 沒變時直接沿用上次的結果
+        try:
+            if escude_mdb.export_sqlite(filepath, output_db_path): print(f"[+] 成功轉換並儲存到 '{output_db_path}'\n")
+        except ValueError as e: print(f"[!] {e}")
+        except Exception as e: print(f"  [!!!] 處理過程中發生意外錯誤: {e}")
     print("--- .bin 轉換完成 ---")
 def export_lsf_to_csv(image_dir: str):
     print("\n--- 開始匯出 LSF 圖層資訊到 CSV ---")
     if not os.path.isdir(image_dir): print(f"[錯誤] LSF 檔案目錄不存在: {image_dir}"); return
     lm = LsfManager()
-    lsf_files = glob.glob(os.path.join(image_dir, '**', '*.lsf'), recursive=True)
+    lsf_files = lsf_reader.find_lsf_files(image_dir)
     if not lsf_files: print(f"[資訊] 在 '{image_dir}' 中找不到任何 .lsf 檔案。"); return
     output_dir = os.path.join(os.path.dirname(image_dir) or ".", "LSF_Export_Py"); os.makedirs(output_dir, exist_ok=True)
     print(f"[*] CSV 檔案將儲存到: {output_dir}")
-    for lsf_path in lsf_files:
-        lm.load_lsf(lsf_path)
-        lsf_data = lm.find_lsf_data_by_name(os.path.splitext(os.path.basename(lsf_path))[0])
+    for lsf_path, lsf_data in zip(lsf_files, lm.load_many(lsf_files)):
         if not lsf_data: print(f"  [警告] 無法載入 LSF 檔案: {lsf_path}"); continue
         csv_filename = f"{lsf_data.lsf_name}.csv"; csv_filepath = os.path.join(output_dir, csv_filename)
         header = ['Layer_Index', 'PNG_Filename', 'X_Offset', 'Y_Offset', 'Width', 'Height', 'Blend_Mode', 'Opacity', 'Game_Logic_Index', 'Game_Logic_State']
@@ -298,44 +326,23 @@ def export_lsf_to_csv(image_dir: str):
 def compose_ev_images(image_dir: str, db_path: str):
     print("\n--- 開始合成事件 (EV) 圖片 (多進程加速) ---")
     if not os.path.isdir(image_dir) or not os.path.isfile(db_path): print(f"[錯誤] 請檢查提供的路徑是否有效。"); return
-    print("[*] 正在載入所有 LSF 檔案...")
-    lm = LsfManager(); [lm.load_lsf(p) for p in glob.glob(os.path.join(image_dir, '**', '*.lsf'), recursive=True)]
+    print("[*] 正在建立 LSF 檔案索引...")
+    lsf_paths = lsf_reader.find_lsf_files(image_dir)
     print("[*] 正在讀取資料庫...")
-    conn = sqlite3.connect(db_path); conn.row_factory = sqlite3.Row; cursor = conn.cursor()
-    event_table_name = next((row[0] for row in cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name LIKE 'イベント%';")), None)
-    if not event_table_name: print("[錯誤] 在資料庫中找不到 'イベント' 資料表。"); conn.close(); return
-    event_records = [EvTable(name=r['ID_44'], file=r['ファイル_44'], option=(r['オプション_44'] or "").split(' '), order=r['CG鑑賞_14']) for r in cursor.execute(f"SELECT * FROM [{event_table_name}]")]
-    conn.close()
+    tables = escude_mdb.open_tables(db_path)
+    event_table_name = next((name for name in tables.table_names() if name.startswith("イベント")), None)
+    if not event_table_name: print("[錯誤] 在資料庫中找不到 'イベント' 資料表。"); tables.close(); return
+    event_records = [EvTable(name=r['ID_44'], file=r['ファイル_44'], option=(r['オプション_44'] or "").split(' '), order=r['CG鑑賞_14']) for r in tables.rows(event_table_name)]
+    tables.close()
     output_dir = os.path.join(os.path.dirname(image_dir) or ".", "Output_EV_Py"); os.makedirs(output_dir, exist_ok=True)
     print(f"[*] 資料庫讀取完畢，共 {len(event_records)} 筆事件記錄。")
     print(f"[*] 輸出目錄: {output_dir}")
     print("[*] 開始派發合成任務到 CPU 核心...")
-    tasks = []
-    for evt in event_records:
-        if evt.order == 0: continue
-        lsf_data = lm.find_lsf_data_by_name(evt.file)
-        if not lsf_data: print(f"  [警告] 找不到 LSF 檔案: {evt.file}.lsf，跳過。"); continue
-        base_name = evt.name; cg_order = evt.order
-        match = re.search(r'[@#]', base_name)
-        new_name = f"{base_name[:match.start()]}_{cg_order}{base_name[match.start():]}" if match else f"{base_name}_{cg_order}"
-        output_path = os.path.join(output_dir, f"{new_name}.png")
-        pending_list, pending_list_fn = [], []
-        for opt in evt.option:
-            if not opt: continue
-            layer_indices = TableManager.parse_options(lsf_data, opt)
-            pending_list.extend(layer_indices)
-            for i in layer_indices: pending_list_fn.append(lsf_data.layers_info[i].name)
-        ordered_list = TableManager.order_layer(pending_list, pending_list_fn)
-        if not ordered_list or ordered_list[0] != 0: ordered_list.insert(0, 0)
-        tasks.append({'lsf_data': lsf_data, 'layers': ordered_list, 'out_path': output_path})
-    with ProcessPoolExecutor() as executor:
-        futures = [executor.submit(process_and_save, t['lsf_data'], t['layers'], t['out_path']) for t in tasks]
-        for future in as_completed(futures):
-            try:
-                result = future.result()
-                print(f"  [+] 已完成: {result}")
-            except Exception as exc:
-                print(f'  [!] 一個任務產生錯誤: {exc}')
+    task_ids = [i for i, evt in enumerate(event_records) if evt.order != 0]
+    context = {'records': event_records, 'output_dir': output_dir}
+    for record_id, result in run_tasks(ev_record_task, task_ids, lsf_paths, context):
+        if isinstance(result, Exception): print(f'  [!] 任務 {event_records[record_id].name} 產生錯誤: {result}')
+        else: print(f"  {result}" if result.startswith('[') else f"  [+] {result}")
     print("\n--- EV 圖片處理完成 ---")
 
 # ===========================================================================
@@ -344,8 +351,8 @@ def compose_ev_images(image_dir: str, db_path: str):
 def main():
     parser = argparse.ArgumentParser(description="一個用於處理 Escude 遊戲引擎資源的 Python 整合工具。", formatter_class=argparse.RawTextHelpFormatter)
     parser.add_argument("-d", nargs=1, metavar='<bin_dir>', help="[解包] 將指定目錄下的所有 .bin 檔案轉換為 .db 資料庫。")
-    parser.add_argument("-c", nargs=2, metavar=('<EvPath>', '<db_path>'), help="[合成] 合成事件 (EV) 圖片 (檔名會包含CG鑑賞ID)。")
-    parser.add_argument("-s", nargs=2, metavar=('<StPath>', '<db_path>'), help="[合成] 合成角色立繪 (ST) 圖片 (可搭配-b選項)。")
+    parser.add_argument("-c", nargs=2, metavar=('<EvPath>', '<db_path>'), help="[合成] 合成事件 (EV) 圖片 (檔名會包含CG鑑賞ID)。\n         <db_path> 可用 -d 轉出的 .db，或直接指定 db_graphics.bin。")
+    parser.add_argument("-s", nargs=2, metavar=('<StPath>', '<db_path>'), help="[合成] 合成角色立繪 (ST) 圖片 (可搭配-b選項)。\n         <db_path> 可用 -d 轉出的 .db，或直接指定 db_graphics.bin。")
     parser.add_argument("-b", type=int, choices=[0, 1, 2], metavar='<mode>', help="[用於 -s] 指定臉紅模式:\n  0=無臉紅, 1=原始定義, 2=臉紅B")
     parser.add_argument("-export_lsf", nargs=1, metavar='<LsfPath>', help="[匯出] 匯出 LSF 圖層資訊到 CSV。")
     args = parser.parse_args()
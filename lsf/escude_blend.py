@@ -0,0 +1,123 @@
+# -*- coding: utf-8 -*-
+"""
+エスクード (Escude) 立繪 / CG 合成用的共用混合函式。
+
+lsf(new)/escude_tools_1.py、escude_tools_2.py 與 lsf/escude_combine_fuku.py 共用。
+畫布是一張持續使用的 (高, 寬, 4) uint8 RGBA 陣列，每個部件只在「部件與畫布重疊的矩形」內以 float32 計算，
+算完直接寫回畫布的這一塊，不再為每個圖層建立整張畫布大小的 float64 暫存陣列。
+
+支援的 LSF 混合模式：
+  0 (其他)  一般疊加
+  3         Multiply (正片疊底)
+  10        Add (相加)
+opacity 為 LSF 圖層的不透明度 (0-255)；0 與 255 都視為完全不透明 (與先前忽略此欄位時的結果相同)。
+"""
+import numpy as np
+from PIL import Image
+
+MODE_MULTIPLY = 3
+MODE_ADD = 10
+
+
+def new_canvas(width: int, height: int) -> np.ndarray:
+    """建立全透明的 (高, 寬, 4) uint8 畫布。"""
+    return np.zeros((height, width, 4), dtype=np.uint8)
+
+
+def _clip_region(canvas: np.ndarray, part: np.ndarray, x: int, y: int):
+    """回傳 (畫布上的重疊區 view, 部件上對應的區域)；沒有重疊時回傳 None。"""
+    ch, cw = canvas.shape[:2]
+    ph, pw = part.shape[:2]
+    x1, y1 = max(x, 0), max(y, 0)
+    x2, y2 = min(x + pw, cw), min(y + ph, ch)
+    if x1 >= x2 or y1 >= y2:
+        return None
+    return canvas[y1:y2, x1:x2], part[y1 - y:y2 - y, x1 - x:x2 - x]
+
+
+def _layer_alpha(fg: np.ndarray, opacity: int) -> np.ndarray:
+    fg_a = np.divide(fg[..., 3:4], 255.0, dtype=np.float32)
+    if 0 < opacity < 255:
+        fg_a *= np.float32(opacity / 255.0)
+    return fg_a
+
+
+def _layer_alpha_int(fg: np.ndarray, opacity: int) -> np.ndarray:
+    """套用 opacity 後的 Alpha (0-255 整數，int32)。"""
+    fg_a = fg[..., 3:4].astype(np.int32)
+    if 0 < opacity < 255:
+        fg_a = (fg_a * opacity + 127) // 255
+    return fg_a
+
+
+def _to_uint8(values: np.ndarray, out: np.ndarray):
+    np.clip(values, 0.0, 1.0, out=values)
+    values *= 255.0
+    np.rint(values, out=values)
+    out[...] = values
+
+
+def blend_into(canvas: np.ndarray, part: np.ndarray, x: int, y: int, mode: int = 0, opacity: int = 0) -> np.ndarray:
+    """
+    將 RGBA 部件 part 以 (x, y) 為左上角混合進 canvas (原地修改，回傳 canvas)。
+    結果 Alpha = fg_a + bg_a * (1 - fg_a)，顏色依模式混合後再除以結果 Alpha (非預乘)；
+    Multiply 為 fg * bg，Add 為 fg + bg (超過 1.0 截斷)。
+    """
+    region = _clip_region(canvas, part, x, y)
+    if region is None:
+        return canvas
+    bg, fg = region
+
+    bg_f = np.divide(bg, 255.0, dtype=np.float32)
+    fg_rgb = np.divide(fg[..., :3], 255.0, dtype=np.float32)
+    bg_rgb, bg_a = bg_f[..., :3], bg_f[..., 3:4]
+    fg_a = _layer_alpha(fg, opacity)
+
+    inv_a = 1.0 - fg_a
+    out_a = fg_a + bg_a * inv_a
+    if mode == MODE_MULTIPLY: fg_rgb *= bg_rgb
+    elif mode == MODE_ADD: fg_rgb += bg_rgb
+
+    # numerator = blend * fg_a + bg_rgb * bg_a * (1 - fg_a)，原地計算以減少暫存陣列
+    fg_rgb *= fg_a
+    bg_rgb *= bg_a * inv_a
+    fg_rgb += bg_rgb
+    out_rgb = np.zeros_like(fg_rgb)
+    np.divide(fg_rgb, out_a, where=out_a > 1e-6, out=out_rgb)
+
+    _to_uint8(out_rgb, bg[..., :3])
+    _to_uint8(out_a, bg[..., 3:4])
+    return canvas
+
+
+def blend_into_keep_alpha(canvas: np.ndarray, part: np.ndarray, x: int, y: int, mode: int = 0, opacity: int = 0) -> np.ndarray:
+    """
+    escude_tools_2.py 的混合規則 (原地修改，回傳 canvas)：
+    Multiply / Add 只改變 RGB、保留底圖原本的 Alpha (不會把背景變透明或變灰)；
+      Multiply: bg * (1 - fg_a + fg * fg_a)，Add: bg + fg * fg_a，結果無條件捨去成整數
+    一般模式則與 Image.alpha_composite 相同 (只在重疊區內呼叫)，避免一般疊加的黑邊。
+    """
+    region = _clip_region(canvas, part, x, y)
+    if region is None:
+        return canvas
+    bg, fg = region
+
+    if mode not in (MODE_MULTIPLY, MODE_ADD):
+        if 0 < opacity < 255:
+            fg = fg.copy()
+            fg[..., 3:4] = _layer_alpha_int(fg, opacity)
+        bg[...] = np.asarray(Image.alpha_composite(Image.fromarray(bg), Image.fromarray(np.ascontiguousarray(fg))))
+        return canvas
+
+    # 以整數計算 (分子分母同乘 255 * 255)，結果等於精確值取整數部分
+    bg_rgb = bg[..., :3].astype(np.int32)
+    fg_rgb = fg[..., :3].astype(np.int32)
+    fg_a = _layer_alpha_int(fg, opacity)
+    if mode == MODE_MULTIPLY:
+        bg_rgb *= 255 * 255 - 255 * fg_a + fg_rgb * fg_a
+        bg_rgb //= 255 * 255
+    else:
+        bg_rgb += fg_rgb * fg_a // 255
+        np.minimum(bg_rgb, 255, out=bg_rgb)
+    bg[..., :3] = bg_rgb
+    return canvas
@@ -5,6 +5,7 @@ import re
 import csv
 import itertools
 import numpy as np
+import escude_blend
 
 # --- 核心輔助函式 (無變動) ---
 
@@ -31,7 +32,8 @@ def load_offset_coords(filepath):
                 try:
                     info_dict[png_filename] = {
                         'coords': (int(row[3]), int(row[4])),
-                        'blend_mode': int(row[7])
+                        'blend_mode': int(row[7]),
+                        'opacity': int(row[8]) if len(row) > 8 and row[8].strip() else 0
                     }
                     processed_keys.add(png_filename)
                 except (ValueError, IndexError):
@@ -43,7 +45,7 @@ def load_offset_coords(filepath):
     return info_dict
 
 def find_part_info(part_base_name, all_info_dict):
-    default_info = {'coords': (0, 0), 'blend_mode': 0}
+    default_info = {'coords': (0, 0), 'blend_mode': 0, 'opacity': 0}
     if part_base_name in all_info_dict:
         return all_info_dict[part_base_name]
     return default_info
@@ -64,9 +66,8 @@ def compose_final_image(parts_in_order, scene_ref_coords, output_path, all_info_
         part_base = os.path.splitext(os.path.basename(part_path))[0]
         info = find_part_info(part_base, all_info_dict)
         try:
-            img = Image.open(part_path).convert('RGBA')
-            info['img'] = img
-            part_data.append(info)
+            with Image.open(part_path) as img:
+                part_data.append(dict(info, img=np.asarray(img.convert('RGBA'))))
         except FileNotFoundError:
             print(f"警告：找不到部件檔案 {part_path}，已跳過。")
             return
@@ -75,33 +76,18 @@ def compose_final_image(parts_in_order, scene_ref_coords, output_path, all_info_
         part['rel_pos'] = (part['coords'][0] - scene_ref_coords[0], part['coords'][1] - scene_ref_coords[1])
     min_x, min_y, max_x, max_y = float('inf'), float('inf'), float('-inf'), float('-inf')
     for part in part_data:
-        x, y = part['rel_pos']; w, h = part['img'].size
+        x, y = part['rel_pos']; h, w = part['img'].shape[:2]
         min_x, min_y = min(min_x, x), min(min_y, y)
         max_x, max_y = max(max_x, x + w), max(max_y, y + h)
     canvas_width, canvas_height = max_x - min_x, max_y - min_y
     if canvas_width <= 0 or canvas_height <= 0: return
-    final_canvas = Image.new('RGBA', (canvas_width, canvas_height), (0, 0, 0, 0))
+    # 持續使用同一張 uint8 畫布，每個部件只在自己的矩形範圍內混合
+    final_canvas = escude_blend.new_canvas(canvas_width, canvas_height)
     for part in part_data:
-        fg_layer_img = Image.new('RGBA', final_canvas.size, (0, 0, 0, 0))
         paste_x, paste_y = part['rel_pos'][0] - min_x, part['rel_pos'][1] - min_y
-        fg_layer_img.paste(part['img'], (paste_x, paste_y))
-        base_np, fg_np = np.array(final_canvas, dtype=np.float64)/255.0, np.array(fg_layer_img, dtype=np.float64)/255.0
-        bg_rgb, bg_a, fg_rgb, fg_a = base_np[:,:,:3], base_np[:,:,3:4], fg_np[:,:,:3], fg_np[:,:,3:4]
-        mode = part['blend_mode']
-        if mode == 3: out_rgb_blend = fg_rgb * bg_rgb
-        elif mode == 10: out_rgb_blend = fg_rgb + bg_rgb
-        else: out_rgb_blend = fg_rgb
-        out_a = fg_a + bg_a * (1.0 - fg_a)
-        mask = out_a > 1e-6
-        numerator = out_rgb_blend * fg_a + bg_rgb * bg_a * (1.0 - fg_a)
-        out_rgb = np.zeros_like(bg_rgb)
-        np.divide(numerator, out_a, where=mask, out=out_rgb)
-        final_np_float = np.concatenate([out_rgb, out_a], axis=2)
-        final_np_float = np.clip(final_np_float, 0.0, 1.0) 
-        final_np_uint8 = (final_np_float * 255).round().astype(np.uint8)
-        final_canvas = Image.fromarray(final_np_uint8, 'RGBA')
+        escude_blend.blend_into(final_canvas, part['img'], paste_x, paste_y, part['blend_mode'], part.get('opacity', 0))
     ensure_dir(os.path.dirname(output_path))
-    final_canvas.save(output_path)
+    Image.fromarray(final_canvas, 'RGBA').save(output_path)
 
 def layering_sort_key_advanced(filename):
     base_name = os.path.splitext(filename)[0].upper().replace('Ａ', 'A').replace('Ｂ', 'B').replace('Ｃ', 'C').replace('Ｄ', 'D').replace('Ｅ', 'E')
@@ -0,0 +1,247 @@
+# -*- coding: utf-8 -*-
+"""
+エスクード (Escude) mdb 資料庫 (.bin，例如 db_graphics.bin) 的延遲讀取模組。
+
+lsf(new)/escude_tools_*.py 的合成功能可以直接讀 .bin，不必先用 -d 轉成 SQLite：
+  - 開檔時以 mmap 只掃描每個 sheet 的區塊位置 (schema / data / text pool 的大小)
+  - 第一次用到某個 sheet 時才解析 schema；資料列在迭代時才逐列解碼
+  - 表名與欄名和 -d 轉出的 SQLite 相同 (表名 "{sheet 名稱}_{序號:02d}"，欄名 "{欄名}_{type}{size}")
+
+檔案結構：
+  'mdb\\0'，之後重複 [u32 schema_size, schema, u32 data_size, data, u32 text_size, text_pool]，
+  以 schema_size == 0 (或檔案結尾) 結束。
+  schema: u32 sheet 名稱 offset, u32 欄位數, 每欄 (u16 type, u16 size, u32 欄名 offset)
+  data  : 固定長度的資料列；type 4 為字串 (text pool 的 offset)，其餘為整數 (size 1/2/4) 或原始 bytes
+
+export_sqlite() 提供可選的 SQLite 快取：只有 .bin 的大小或修改時間改變時才重新轉換。
+"""
+import mmap
+import os
+import sqlite3
+import struct
+from typing import Dict, Iterator, List, Optional
+
+MDB_SIGNATURE = b'mdb\x00'
+SOURCE_TABLE = '__mdb_source__'  # SQLite 快取中記錄來源 .bin 狀態的資料表
+
+
+def read_string_from_pool(text_pool, offset: int, encoding='cp932') -> str:
+    if offset >= len(text_pool): return f"<Invalid Offset: {offset}>"
+    end_index = text_pool.find(b'\x00', offset)
+    if end_index == -1: end_index = len(text_pool)
+    string_bytes = bytes(text_pool[offset:end_index])
+    try: return string_bytes.decode(encoding)
+    except Exception: return string_bytes.decode('utf-8', errors='ignore')
+
+
+class MdbSheet:
+    """一個 sheet (資料表)。schema 在第一次存取 name / columns 時才解析，區塊內容此時才從 mmap 讀出。"""
+
+    def __init__(self, data, index: int, schema: slice, records: slice, text: slice):
+        self._data = data
+        self.index = index
+        self._schema, self._records, self._text = schema, records, text
+        self._name = None
+        self._columns = None
+        self._text_pool = None
+
+    @property
+    def text_pool(self) -> bytes:
+        if self._text_pool is None: self._text_pool = self._data[self._text]
+        return self._text_pool
+
+    def _parse_schema(self):
+        schema = self._data[self._schema]; text_pool = self.text_pool
+        self._name = read_string_from_pool(text_pool, struct.unpack_from('<I', schema, 0)[0])
+        column_count = struct.unpack_from('<I', schema, 4)[0]
+        columns = []
+        for col_type, col_size, col_name_offset in struct.iter_unpack('<HHI', schema[8:8 + column_count * 8]):
+            col_name = read_string_from_pool(text_pool, col_name_offset)
+            columns.append({"name": f"{col_name}_{col_type}{col_size}", "type": col_type, "size": col_size})
+        if len(columns) != column_count: raise struct.error("schema 區塊長度不足")
+        self._columns = columns
+
+    @property
+    def name(self) -> str:
+        if self._name is None: self._parse_schema()
+        return self._name
+
+    @property
+    def columns(self) -> List[dict]:
+        if self._columns is None: self._parse_schema()
+        return self._columns
+
+    @property
+    def table_name(self) -> str:
+        return f"{self.name}_{self.index:02d}"
+
+    @property
+    def column_names(self) -> List[str]:
+        return [col['name'] for col in self.columns]
+
+    def _row_struct(self):
+        fmt = '<'
+        for col in self.columns:
+            if col['type'] == 4:
+                if col['size'] != 4: raise ValueError(f"字串欄位 {col['name']} 的長度不是 4 bytes")
+                fmt += 'I'
+            elif col['size'] == 1: fmt += 'B'
+            elif col['size'] == 2: fmt += 'h'
+            elif col['size'] == 4: fmt += 'I' if "色" in col['name'] else 'i'
+            else: fmt += f"{col['size']}s"
+        return struct.Struct(fmt)
+
+    def rows(self) -> Iterator[Dict[str, object]]:
+        """逐列回傳 {欄名: 值}；字串欄位會從 text pool 解碼。"""
+        columns = self.columns
+        row_struct = self._row_struct()
+        if row_struct.size == 0: return
+        records = self._data[self._records]
+        records = records[:len(records) // row_struct.size * row_struct.size]
+        text_pool = self.text_pool
+        names = [col['name'] for col in columns]
+        string_cols = [i for i, col in enumerate(columns) if col['type'] == 4]
+        for values in row_struct.iter_unpack(records):
+            if string_cols:
+                values = list(values)
+                for i in string_cols: values[i] = read_string_from_pool(text_pool, values[i])
+            yield dict(zip(names, values))
+
+    def __iter__(self):
+        return self.rows()
+
+
+class MdbFile:
+    """以 mmap 開啟 .bin，只掃描區塊位置；sheets 依檔案內的順序排列。"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._file = open(path, 'rb')
+        size = os.fstat(self._file.fileno()).st_size
+        self._mm = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) if size else b''
+        if self._mm[:4] != MDB_SIGNATURE:
+            self.close()
+            raise ValueError(f"{os.path.basename(path)}: 檔案簽名無效 (不是 mdb)")
+        self.sheets = self._scan()
+
+    def _scan(self) -> List[MdbSheet]:
+        mm, end = self._mm, len(self._mm)
+        sheets, pos = [], 4
+        while pos + 4 <= end:
+            blocks = []
+            for _ in range(3):
+                if pos + 4 > end: return sheets
+                block_size = struct.unpack_from('<I', mm, pos)[0]
+                if not blocks and block_size == 0: return sheets  # 檔案結尾標記
+                blocks.append(slice(pos + 4, min(pos + 4 + block_size, end)))
+                pos += 4 + block_size
+            sheets.append(MdbSheet(mm, len(sheets), *blocks))
+        return sheets
+
+    def _valid_sheets(self) -> Iterator[MdbSheet]:
+        """與 -d 轉換相同：略過 schema 損壞或沒有欄位的 sheet。"""
+        for sheet in self.sheets:
+            try:
+                if sheet.columns: yield sheet
+            except (struct.error, IndexError):
+                continue
+
+    def table_names(self) -> List[str]:
+        return [sheet.table_name for sheet in self._valid_sheets()]
+
+    def table(self, table_name: str) -> Optional[MdbSheet]:
+        return next((sheet for sheet in self._valid_sheets() if sheet.table_name == table_name), None)
+
+    def columns(self, table_name: str) -> List[str]:
+        return self.table(table_name).column_names
+
+    def rows(self, table_name: str) -> Iterator[Dict[str, object]]:
+        return self.table(table_name).rows()
+
+    def close(self):
+        if isinstance(self._mm, mmap.mmap): self._mm.close()
+        self._file.close()
+
+    def __enter__(self): return self
+    def __exit__(self, *exc): self.close()
+
+
+class SqliteTables:
+    """-d 轉出的 .db，提供與 MdbFile 相同的 table_names / columns / rows 介面 (rows 為 sqlite3.Row)。"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.conn = sqlite3.connect(path); self.conn.row_factory = sqlite3.Row
+
+    def table_names(self) -> List[str]:
+        return [row[0] for row in self.conn.execute("SELECT name FROM sqlite_master WHERE type='table'") if row[0] != SOURCE_TABLE]
+
+    def columns(self, table_name: str) -> List[str]:
+        return [info['name'] for info in self.conn.execute(f"PRAGMA table_info([{table_name}])").fetchall()]
+
+    def rows(self, table_name: str):
+        return self.conn.execute(f"SELECT * FROM [{table_name}]")
+
+    def close(self): self.conn.close()
+    def __enter__(self): return self
+    def __exit__(self, *exc): self.close()
+
+
+def open_tables(path: str):
+    """依檔案內容開啟 mdb (.bin) 或 SQLite (.db)，兩者都可用 table_names() / columns() / rows() 讀取。"""
+    with open(path, 'rb') as f:
+        is_mdb = f.read(4) == MDB_SIGNATURE
+    return MdbFile(path) if is_mdb else SqliteTables(path)
+
+
+def _source_stamp(bin_path: str):
+    st = os.stat(bin_path)
+    return st.st_size, st.st_mtime_ns
+
+
+def is_export_current(bin_path: str, db_path: str) -> bool:
+    """SQLite 快取是否由目前這份 .bin 轉出 (比對大小與修改時間)。"""
+    if not os.path.isfile(db_path): return False
+    try:
+        conn = sqlite3.connect(db_path)
+        try: row = conn.execute(f"SELECT size, mtime_ns FROM [{SOURCE_TABLE}]").fetchone()
+        finally: conn.close()
+    except sqlite3.Error:
+        return False
+    return row is not None and tuple(row) == _source_stamp(bin_path)
+
+
+def export_sqlite(bin_path: str, db_path: str, force: bool = False, log=print) -> bool:
+    """
+    將 .bin 轉成 SQLite (表名 / 欄名與直接讀取時相同)。快取仍有效且未指定 force 時不做任何事。
+    回傳是否重新轉換。
+    """
+    if not force and is_export_current(bin_path, db_path):
+        log(f"  [-] .bin 未變更，沿用快取: {db_path}")
+        return False
+    stamp = _source_stamp(bin_path)
+    tmp_path = db_path + '.tmp'
+    if os.path.exists(tmp_path): os.remove(tmp_path)
+    conn = sqlite3.connect(tmp_path); cursor = conn.cursor()
+    try:
+        with MdbFile(bin_path) as mdb:
+            for sheet in mdb._valid_sheets():
+                table_name = sheet.table_name
+                log(f"    - 正在寫入資料表: [{table_name}]")
+                cols_defs = [f"[{col['name']}] {'TEXT' if col['type'] == 4 else 'INTEGER'}" for col in sheet.columns]
+                cursor.execute(f"CREATE TABLE IF NOT EXISTS [{table_name}] ({', '.join(cols_defs)})")
+                col_names = [f"[{col['name']}]" for col in sheet.columns]
+                insert_sql = f"INSERT INTO [{table_name}] ({', '.join(col_names)}) VALUES ({', '.join(['?'] * len(col_names))})"
+                try:
+                    cursor.executemany(insert_sql, (tuple(rec.values()) for rec in sheet.rows()))
+                except (ValueError, struct.error) as e:
+                    log(f"    [!!!] Error parsing data block: {e}")
+        cursor.execute(f"CREATE TABLE [{SOURCE_TABLE}] (size INTEGER, mtime_ns INTEGER)")
+        cursor.execute(f"INSERT INTO [{SOURCE_TABLE}] VALUES (?, ?)", stamp)
+        conn.commit()
+    except BaseException:
+        conn.close(); os.remove(tmp_path)
+        raise
+    conn.close()
+    os.replace(tmp_path, db_path)
+    return True
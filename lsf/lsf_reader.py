@@ -0,0 +1,115 @@
+# -*- coding: utf-8 -*-
+"""
+エスクード (Escude) .lsf 圖層表的共用讀取模組。
+
+lsftocsv.py / lsf_to_csv2.py 的 CSV 匯出，以及 lsf(new)/escude_tools_*.py 的合成都使用這裡的解析結果。
+
+檔案結構 (little-endian)：
+  檔頭 28 bytes   : sig('LSF\\0'), revision, bg, id, layer_count (u16 x4), width, height, bx, by (i32 x4)
+  圖層 164 bytes  : name[64], text[64] (CP932), rect left/top/right/bottom, cx, cy (i32 x6),
+                    index, state, mode, opacity (u8 x4), fill, value (u32 x2)
+
+整個檔案以 mmap 開啟，圖層表用一次 struct.iter_unpack 讀完，不再逐層 f.read(164)。
+大量檔案可用 read_lsf_files(..., workers=N) 分給多個進程解析，結果順序與輸入相同。
+"""
+import glob
+import mmap
+import os
+import struct
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from typing import Iterable, List, Optional
+
+LSF_SIGNATURE = 0x46534C  # 'LSF' in little-endian
+HEADER_STRUCT = struct.Struct('<IHHHHiiii')                # 28 bytes
+LAYER_STRUCT = struct.Struct('<64s64siiiiiiBBBBII')        # 164 bytes
+
+
+# ===========================================================================
+# 資料結構定義
+# ===========================================================================
+@dataclass
+class LsfFileHeader:
+    revision: int = 0; bg: int = 0; id: int = 0; layer_count: int = 0; width: int = 0; height: int = 0; bx: int = 0; by: int = 0
+
+@dataclass
+class Rect:
+    left: int = 0; top: int = 0; right: int = 0; bottom: int = 0
+
+@dataclass
+class LsfLayerInfo:
+    name: str = ""; text: str = ""; rect: Rect = field(default_factory=Rect); cx: int = 0; cy: int = 0; index: int = 0; state: int = 0; mode: int = 0; opacity: int = 0; fill: int = 0; value: int = 0; skip: bool = False
+
+@dataclass
+class LsfImageData:
+    file_path: str = ""; width: int = 0; height: int = 0
+
+@dataclass
+class LsfData:
+    filepath: str; lsf_name: str; header: LsfFileHeader = field(default_factory=LsfFileHeader); layers_info: List[LsfLayerInfo] = field(default_factory=list); images: List[LsfImageData] = field(default_factory=list)
+
+
+def decode_str(b: bytes) -> str:
+    """將 CP932 (Shift-JIS) 編碼的位元組解碼成字串。"""
+    return b.decode('cp932', errors='ignore').strip('\x00')
+
+
+# ===========================================================================
+# 解析
+# ===========================================================================
+def parse_lsf(data, path: str) -> Optional[LsfData]:
+    """解析已載入記憶體 (bytes / mmap) 的 .lsf；格式不符時回傳 None。"""
+    if len(data) < HEADER_STRUCT.size:
+        return None
+    sig, rev, bg, id, l_count, w, h, bx, by = HEADER_STRUCT.unpack_from(data, 0)
+    if sig != LSF_SIGNATURE:
+        return None
+
+    lsf_name = os.path.splitext(os.path.basename(path))[0].lower()
+    lsf_dir = os.path.dirname(path)
+    lsf_data = LsfData(filepath=path, lsf_name=lsf_name, header=LsfFileHeader(rev, bg, id, l_count, w, h, bx, by))
+
+    # 與逐層讀取相同：檔案截斷時只保留完整的圖層
+    count = min(l_count, (len(data) - HEADER_STRUCT.size) // LAYER_STRUCT.size)
+    table_end = HEADER_STRUCT.size + count * LAYER_STRUCT.size
+    with memoryview(data) as view:
+        for name_b, text_b, r_l, r_t, r_r, r_b, cx, cy, idx, state, mode, op, fill, val in LAYER_STRUCT.iter_unpack(view[HEADER_STRUCT.size:table_end]):
+            layer_info = LsfLayerInfo(name=decode_str(name_b), text=decode_str(text_b), rect=Rect(r_l, r_t, r_r, r_b), cx=cx, cy=cy, index=idx, state=state, mode=mode, opacity=op, fill=fill, value=val)
+            if name_b.startswith(b'\x00ul\x00'): layer_info.skip = True
+            lsf_data.layers_info.append(layer_info)
+            img = LsfImageData()
+            if not layer_info.skip: img.file_path = os.path.join(lsf_dir, layer_info.name + ".png")
+            lsf_data.images.append(img)
+    return lsf_data
+
+
+def read_lsf(path: str) -> Optional[LsfData]:
+    """以 mmap 讀取單一 .lsf；檔案不存在、過短或簽名不符時回傳 None。"""
+    if not os.path.isfile(path):
+        return None
+    with open(path, 'rb') as f:
+        if os.fstat(f.fileno()).st_size < HEADER_STRUCT.size:
+            return None
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            return parse_lsf(mm, path)
+
+
+def find_lsf_files(lsf_dir: str, recursive: bool = True) -> List[str]:
+    """搜尋目錄下的 .lsf (預設遞迴)。"""
+    pattern = os.path.join(lsf_dir, '**', '*.lsf') if recursive else os.path.join(lsf_dir, '*.lsf')
+    return glob.glob(pattern, recursive=recursive)
+
+
+def read_lsf_files(paths: Iterable[str], workers: Optional[int] = None) -> List[Optional[LsfData]]:
+    """
+    批次讀取多個 .lsf，回傳與 paths 同順序的 list (無法解析的項目為 None)。
+    workers 為進程數 (None = CPU 核心數)；檔案不多或 workers <= 1 時直接在本進程解析，省去開進程的成本。
+    """
+    paths = list(paths)
+    workers = workers or os.cpu_count() or 1
+    if workers <= 1 or len(paths) < 64:
+        return [read_lsf(p) for p in paths]
+    # 單一 .lsf 只有數 KB，每次派發一整批以減少進程間往返
+    chunksize = max(1, len(paths) // (workers * 4))
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(read_lsf, paths, chunksize=chunksize))
@@ -1,79 +1,21 @@
 # -*- coding: utf-8 -*-
 import argparse
 import os
-import glob
-import struct
 import csv
-from dataclasses import dataclass, field
-from typing import List
+
+import lsf_reader
+from lsf_reader import LsfData
 
 # ===========================================================================
 # 1. 資料結構定義 (Data Structures)
-# 這些是解析 LSF 檔案所需的結構，我們從原腳本中保留下來。
+# LsfFileHeader / Rect / LsfLayerInfo / LsfImageData / LsfData 與檔案解析
+# 都改由共用的 lsf_reader.py 提供 (與 lsftocsv.py、escude_tools_*.py 相同)。
 # ===========================================================================
-@dataclass
-class LsfFileHeader:
-    """LSF 檔案的檔頭資訊"""
-    revision: int = 0
-    bg: int = 0
-    id: int = 0
-    layer_count: int = 0
-    width: int = 0
-    height: int = 0
-    bx: int = 0
-    by: int = 0
-
-@dataclass
-class Rect:
-    """定義一個矩形區域"""
-    left: int = 0
-    top: int = 0
-    right: int = 0
-    bottom: int = 0
-
-@dataclass
-class LsfLayerInfo:
-    """LSF 檔案中單一圖層的詳細資訊"""
-    name: str = ""
-    text: str = ""
-    rect: Rect = field(default_factory=Rect)
-    cx: int = 0
-    cy: int = 0
-    index: int = 0
-    state: int = 0
-    mode: int = 0
-    opacity: int = 0
-    fill: int = 0
-    value: int = 0
-    skip: bool = False
-
-@dataclass
-class LsfImageData:
-    """LSF 圖層對應的圖片資訊 (在此腳本中主要用於結構完整性)"""
-    file_path: str = ""
-    width: int = 0
-    height: int = 0
-
-@dataclass
-class LsfData:
-    """代表一個完整的 LSF 檔案的資料集合"""
-    filepath: str
-    lsf_name: str
-    header: LsfFileHeader = field(default_factory=LsfFileHeader)
-    layers_info: List[LsfLayerInfo] = field(default_factory=list)
-    images: List[LsfImageData] = field(default_factory=list)
 
 # ===========================================================================
 # 2. 核心邏輯實作 (Core Logic)
-# 這裡是解析 LSF 檔案的核心類別和函式。
 # ===========================================================================
 
-def decode_str(b: bytes) -> str:
-    """
-    將 CP932 (Shift-JIS) 編碼的位元組解碼成字串。
-    """
-    return b.decode('cp932', errors='ignore').strip('\x00')
-
 class LsfManager:
     """
     管理 LSF 檔案的讀取和解析。
@@ -85,62 +27,34 @@ class LsfManager:
         """
         從指定路徑讀取並解析一個 .lsf 檔案。
         """
-        if not os.path.isfile(path):
-            return None
-        
-        lsf_name = os.path.splitext(os.path.basename(path))[0].lower()
-        lsf_dir = os.path.dirname(path)
-
         try:
-            with open(path, 'rb') as f:
-                header_bytes = f.read(28)
-                if len(header_bytes) < 28:
-                    return None
-                
-                sig, rev, bg, id, l_count, w, h, bx, by = struct.unpack('<IHHHHiiii', header_bytes)
-                if sig != 0x46534C:  # 'LSF' in little-endian
-                    return None
-                
-                header = LsfFileHeader(rev, bg, id, l_count, w, h, bx, by)
-                lsf_data = LsfData(filepath=path, lsf_name=lsf_name, header=header)
-
-                for _ in range(header.layer_count):
-                    layer_bytes = f.read(164)
-                    if len(layer_bytes) < 164:
-                        continue
-                    
-                    name_b, text_b, r_l, r_t, r_r, r_b, cx, cy, idx, state, mode, op, fill, val = struct.unpack('<64s64siiiiiiBBBBII', layer_bytes)
-                    
-                    layer_info = LsfLayerInfo(
-                        name=decode_str(name_b),
-                        text=decode_str(text_b),
-                        rect=Rect(r_l, r_t, r_r, r_b),
-                        cx=cx, cy=cy, index=idx, state=state,
-                        mode=mode, opacity=op, fill=fill, value=val
-                    )
-                    
-                    if name_b.startswith(b'\x00ul\x00'):
-                        layer_info.skip = True
-                    
-                    lsf_data.layers_info.append(layer_info)
-                    
-                    # 即使我們不處理圖片，也保持結構一致
-                    img = LsfImageData()
-                    if not layer_info.skip:
-                        img.file_path = os.path.join(lsf_dir, layer_info.name + ".png")
-                    lsf_data.images.append(img)
-
-            self._lsf_lookup[lsf_name] = lsf_data
-            return lsf_data
+            lsf_data = lsf_reader.read_lsf(path)
         except Exception as e:
             print(f"[錯誤] 讀取檔案 {path} 時發生問題: {e}")
             return None
+        if lsf_data is not None:
+            self._lsf_lookup[lsf_data.lsf_name] = lsf_data
+        return lsf_data
+
+    def load_many(self, paths: list, workers: int = None) -> list:
+        """
+        批次讀取多個 .lsf (交給 lsf_reader 的進程池)，回傳與 paths 同順序的 LsfData 列表 (失敗為 None)。
+        """
+        try:
+            results = lsf_reader.read_lsf_files(paths, workers)
+        except Exception as e:
+            print(f"[錯誤] 批次讀取 LSF 檔案時發生問題: {e}")
+            results = [self.load_lsf(p) for p in paths]
+        for lsf_data in results:
+            if lsf_data is not None:
+                self._lsf_lookup[lsf_data.lsf_name] = lsf_data
+        return results
 
 # ===========================================================================
 # 3. 主要功能函式 (Main Function)
 # ===========================================================================
 
-def export_lsf_to_csv_combined(image_dir: str):
+def export_lsf_to_csv_combined(image_dir: str, workers: int = None):
     """
     掃描指定目錄下的所有 LSF 檔案，並將其圖層資訊匯出到一個合併的 CSV 檔案中。
     """
@@ -152,7 +66,7 @@ def export_lsf_to_csv_combined(image_dir: str):
     lm = LsfManager()
     
     # 遞迴搜尋所有 .lsf 檔案
-    lsf_files = glob.glob(os.path.join(image_dir, '**', '*.lsf'), recursive=True)
+    lsf_files = lsf_reader.find_lsf_files(image_dir)
     if not lsf_files:
         print(f"[資訊] 在 '{image_dir}' 中找不到任何 .lsf 檔案。")
         return
@@ -176,9 +90,8 @@ def export_lsf_to_csv_combined(image_dir: str):
             writer.writerow(header) # 先寫入檔頭
 
             total_layers_exported = 0
-            # 遍歷所有找到的 LSF 檔案
-            for lsf_path in lsf_files:
-                lsf_data = lm.load_lsf(lsf_path)
+            # 先以多進程解析所有 LSF 檔案，再依原本的檔案順序寫入
+            for lsf_path, lsf_data in zip(lsf_files, lm.load_many(lsf_files, workers)):
                 if not lsf_data:
                     print(f"  [警告] 無法載入或解析 LSF 檔案: {os.path.basename(lsf_path)}")
                     continue
@@ -228,10 +141,15 @@ def main():
         metavar='<LsfPath>', 
         help="包含 .lsf 檔案的來源目錄路徑。\n腳本會遞迴搜尋此目錄下的所有 .lsf 檔案。"
     )
+    parser.add_argument(
+        "-j", "--workers",
+        type=int, default=None,
+        help="解析 LSF 使用的進程數 (預設為 CPU 核心數，1 = 不開子進程)。"
+    )
     
     args = parser.parse_args()
     
-    export_lsf_to_csv_combined(image_dir=args.lsf_dir)
+    export_lsf_to_csv_combined(image_dir=args.lsf_dir, workers=args.workers)
 
 
 if __name__ == '__main__':
@@ -1,9 +1,10 @@
 import os
 import glob
 import csv
-import re
 from typing import List, NamedTuple
 
+import lsf_reader
+
 # --- 資料結構定義 (不變) ---
 class Rect(NamedTuple):
     left: int
@@ -19,54 +20,31 @@ class LayerInfo(NamedTuple):
     state: int
 
 # --- 通用版 LSF 解析函式 ---
-def parse_lsf_universal(byte_data: bytes, source_filename: str) -> List[LayerInfo]:
+def layers_from_lsf_data(lsf_data: lsf_reader.LsfData, source_filename: str) -> List[LayerInfo]:
     """
-    使用通用的正規表示式，解析所有類型的 LSF 檔案。
+    將 lsf_reader 解析出的圖層表轉成匯出用的 LayerInfo。
+    直接依 164 bytes 的圖層結構讀取，不再用正規表示式在整個檔案中找檔名 (不會誤判 text 欄位或其他資料)。
     """
-    layers = []
-    
-    # --- 最終修正點 ---
-    # 使用一個更通用的正規表示式，不再寫死 'Jerusha'
-    # [\w_]+ 匹配一個以上的字母、數字或底線
-    # \d{3} 匹配結尾的三個數字
-    # 這能匹配 '01_Jerusha_p_l_001' 以及 '02_some_other_name_005' 等
-    matches = list(re.finditer(b'[\w_]+_\d{3}', byte_data))
-
-    for match in matches:
-        try:
-            # 直接使用正規表示式匹配到的完整結果作為檔名
-            name = match.group(0).decode('ascii')
-            
-            # 名稱長度必須合理，過短的可能是誤判
-            if len(name) < 5: 
-                continue
-
-            anchor_pos = match.start()
-            
-            # 使用我們之前破解的精確位移量讀取資料
-            rect = Rect(
-                left=int.from_bytes(byte_data[anchor_pos + 128 : anchor_pos + 130], 'little'),
-                top=int.from_bytes(byte_data[anchor_pos + 132 : anchor_pos + 134], 'little'),
-                right=int.from_bytes(byte_data[anchor_pos + 136 : anchor_pos + 138], 'little'),
-                bottom=int.from_bytes(byte_data[anchor_pos + 140 : anchor_pos + 142], 'little')
-            )
-            
-            index_val = byte_data[anchor_pos + 152]
-            state_val = byte_data[anchor_pos + 153]
+    return [
+        LayerInfo(
+            source_file=source_filename,
+            name=layer.name,
+            rect=Rect(layer.rect.left, layer.rect.top, layer.rect.right, layer.rect.bottom),
+            index=layer.index,
+            state=layer.state
+        )
+        for layer in lsf_data.layers_info
+        if layer.name and not layer.skip
+    ]
 
-            layers.append(LayerInfo(
-                source_file=source_filename,
-                name=name,
-                rect=rect,
-                index=index_val,
-                state=state_val
-            ))
-        except Exception as e:
-            # 發生任何錯誤都只針對單一錨點，不影響整個檔案的解析
-            # print(f"  - 解析錨點 '{match.group(0)}' 時出錯: {e}")
-            continue
-            
-    return layers
+def parse_lsf_universal(byte_data: bytes, source_filename: str) -> List[LayerInfo]:
+    """
+    解析所有類型的 LSF 檔案 (檔頭 + 圖層表)。
+    """
+    lsf_data = lsf_reader.parse_lsf(byte_data, source_filename)
+    if lsf_data is None:
+        return []
+    return layers_from_lsf_data(lsf_data, source_filename)
 
 # --- 主程式 ---
 def main():
@@ -84,16 +62,13 @@ def main():
     
     all_layers_data = []
 
-    for lsf_path in lsf_files_to_process:
+    # 檔案很多時由 lsf_reader 分給多個進程解析，結果順序與檔案列表相同
+    for lsf_path, lsf_data in zip(lsf_files_to_process, lsf_reader.read_lsf_files(lsf_files_to_process)):
         lsf_filename = os.path.basename(lsf_path)
-        print(f"  - 正在解析: {lsf_filename}")
-        try:
-            with open(lsf_path, 'rb') as f:
-                lsf_data = f.read()
-            layers_from_file = parse_lsf_universal(lsf_data, lsf_filename)
-            all_layers_data.extend(layers_from_file)
-        except Exception as e:
-            print(f"    處理檔案時發生致命錯誤: {e}")
+        if lsf_data is None:
+            print(f"  - 無法解析: {lsf_filename}")
+            continue
+        all_layers_data.extend(layers_from_lsf_data(lsf_data, lsf_filename))
 
     if not all_layers_data:
         print("解析完成，但未能從任何檔案中提取到圖層資料。")
@@ -2,7 +2,8 @@ import struct
 import os
 import csv
 import argparse
-import io
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
 from PIL import Image, ImageOps
 
 # -----------------------------------------------------------------------------
@@ -30,123 +31,134 @@ def save_image_from_pixels(pixel_data, width, height, bpp, flip, output_path, fi
     except Exception as e:
         print(f"儲存圖片 '{filename}' 時發生嚴重錯誤: {e}")
 
-def decompress_rle(input_stream, unpacked_size, rle_step):
-    """解壓縮交錯式 RLE 數據。"""
-    # ... (此函式內容與前一版完全相同，為求簡潔故省略) ...
+def decompress_rle(data, unpacked_size, rle_step):
+    """
+    解壓縮交錯式 RLE 數據。
+    data 為 bytes / memoryview，以整數游標逐 byte 讀取；每個 stride 平面中的連續重複值以 extended slice 一次寫入。
+    """
     output = bytearray(unpacked_size)
+    end = len(data)
+    pos = 0
     for i in range(rle_step):
-        if input_stream.tell() >= len(input_stream.getbuffer()): break
-        v1 = int.from_bytes(input_stream.read(1), 'little')
+        if pos >= end: break
+        v1 = data[pos]; pos += 1
         if i < len(output): output[i] = v1
         dst = i + rle_step
         while dst < unpacked_size:
-            if input_stream.tell() >= len(input_stream.getbuffer()): break
-            v2 = int.from_bytes(input_stream.read(1), 'little')
+            if pos >= end: break
+            v2 = data[pos]; pos += 1
             output[dst] = v2
             dst += rle_step
             if v2 == v1:
-                if input_stream.tell() >= len(input_stream.getbuffer()): break
-                count = int.from_bytes(input_stream.read(1), 'little')
+                if pos >= end: break
+                count = data[pos]; pos += 1
                 if (count & 0x80) != 0:
-                    if input_stream.tell() >= len(input_stream.getbuffer()): break
-                    count = int.from_bytes(input_stream.read(1), 'little') + ((count & 0x7F) << 8) + 128
-                for _ in range(count):
-                    if dst >= unpacked_size: break
-                    output[dst] = v2
-                    dst += rle_step
+                    if pos >= end: break
+                    count = data[pos] + ((count & 0x7F) << 8) + 128; pos += 1
+                # 重複 count 次 (超出輸出範圍的部分捨棄)
+                run = min(count, -(-(unpacked_size - dst) // rle_step)) if dst < unpacked_size else 0
+                if run > 0:
+                    output[dst:dst + run * rle_step:rle_step] = bytes((v2,)) * run
+                    dst += run * rle_step
                 if dst < unpacked_size:
-                    if input_stream.tell() >= len(input_stream.getbuffer()): break
-                    v2 = int.from_bytes(input_stream.read(1), 'little')
+                    if pos >= end: break
+                    v2 = data[pos]; pos += 1
                     output[dst] = v2
                     dst += rle_step
             v1 = v2
     return output
 
+def add_delta_frame(previous_pixels, delta_pixels):
+    """將 RLE 解出的差分加到上一幀 (逐 byte 相加 mod 256，長度取兩者較短者)。"""
+    n = min(len(previous_pixels), len(delta_pixels))
+    prev = np.frombuffer(previous_pixels, dtype=np.uint8, count=n)
+    delta = np.frombuffer(delta_pixels, dtype=np.uint8, count=n)
+    return (prev + delta).tobytes()
+
 # -----------------------------------------------------------------------------
-# 各版本檔案的處理器 (這部分保持不變)
+# 各版本檔案的處理器 (data 為整個檔案的 memoryview，以 offset 直接取用)
 # -----------------------------------------------------------------------------
-def handle_an00_an10_pl00(f, output_path, base_name, signature, source_filename):
+def handle_an00_an10_pl00(data, output_path, base_name, signature, source_filename):
     """處理 AN00, AN10, 和 PL00 格式。"""
-    # ... (此函式內容與前一版完全相同，為求簡潔故省略) ...
     print(f"DEBUG: 進入 {signature.decode()} 格式處理器。")
     coords_list = []
     if signature == b'AN00':
-        f.seek(4); base_x, base_y = struct.unpack('<ii', f.read(8))
+        base_x, base_y = struct.unpack_from('<ii', data, 4)
     else:
-        f.seek(0x06 if signature == b'PL00' else 0x04); base_x, base_y, _, _ = struct.unpack('<iiII', f.read(16))
+        base_x, base_y, _, _ = struct.unpack_from('<iiII', data, 0x06 if signature == b'PL00' else 0x04)
     if signature == b'PL00':
-        f.seek(4); image_count = struct.unpack('<h', f.read(2))[0]; current_offset = 0x16
+        image_count = struct.unpack_from('<h', data, 4)[0]; current_offset = 0x16
     else:
-        f.seek(20); table_count = struct.unpack('<h', f.read(2))[0]; image_count_offset = 0x18 + table_count * 4
-        f.seek(image_count_offset); image_count = struct.unpack('<h', f.read(2))[0]; current_offset = image_count_offset + 2
+        table_count = struct.unpack_from('<h', data, 20)[0]; image_count_offset = 0x18 + table_count * 4
+        image_count = struct.unpack_from('<h', data, image_count_offset)[0]; current_offset = image_count_offset + 2
     if image_count <= 0: return []
     for i in range(image_count):
-        f.seek(current_offset)
         header_format = '<iiII' if signature == b'AN00' else '<iiIII'
-        header_size = struct.calcsize(header_format); header_bytes = f.read(header_size)
-        if len(header_bytes) < header_size: break
-        frame_header = struct.unpack(header_format, header_bytes)
+        header_size = struct.calcsize(header_format)
+        if current_offset + header_size > len(data): break
+        frame_header = struct.unpack_from(header_format, data, current_offset)
         frame_offset_x, frame_offset_y, width, height = frame_header[0:4]
         channels = 4 if signature == b'AN00' else frame_header[4]
         bpp = channels * 8; final_x = base_x + frame_offset_x; final_y = base_y + frame_offset_y
         coords_list.append({'source_file': source_filename, 'frame': i, 'x': final_x, 'y': final_y, 'width': width, 'height': height, 'bpp': bpp})
         pixel_data_offset = current_offset + header_size; bytes_to_read = width * height * channels
-        f.seek(pixel_data_offset); pixel_data = f.read(bytes_to_read)
+        pixel_data = data[pixel_data_offset:pixel_data_offset + bytes_to_read]
         save_image_from_pixels(pixel_data, width, height, bpp, True, output_path, f"{base_name}_{i:03d}.png")
         current_offset = pixel_data_offset + len(pixel_data)
     return coords_list
 
-def handle_an20(f, output_path, base_name, signature, source_filename):
+def handle_an20(data, output_path, base_name, signature, source_filename):
     """專門處理 AN20 動畫格式。"""
-    # ... (此函式內容與前一版完全相同，為求簡潔故省略) ...
-    coords_list = []; f.seek(0); data = f.read(); f.seek(4); table_count = struct.unpack('<h', f.read(2))[0]; pos = 8
+    coords_list = []; table_count = struct.unpack_from('<h', data, 4)[0]; pos = 8
     for _ in range(table_count):
         byte_val = data[pos]; pos += 1
         if byte_val == 1: pos += 8
         elif byte_val in [2, 3, 4, 5]: pos += 4
-    count = struct.unpack('<H', data[pos:pos+2])[0]; pos += 2; pos += count * 8; f.seek(pos + 2)
-    base_x, base_y, _, _ = struct.unpack('<iiII', f.read(16)); f.seek(pos); image_count = struct.unpack('<h', f.read(2))[0]
+    count = struct.unpack('<H', data[pos:pos+2])[0]; pos += 2; pos += count * 8
+    base_x, base_y, _, _ = struct.unpack_from('<iiII', data, pos + 2); image_count = struct.unpack_from('<h', data, pos)[0]
     if image_count <= 0: return []
-    current_offset = f.tell() + 0x10; header_format = '<iiIII'; header_size = struct.calcsize(header_format)
+    current_offset = pos + 2 + 0x10; header_format = '<iiIII'; header_size = struct.calcsize(header_format)
     for i in range(image_count):
-        f.seek(current_offset); header_bytes = f.read(header_size)
-        if len(header_bytes) < header_size: break
-        frame_offset_x, frame_offset_y, width, height, channels = struct.unpack(header_format, header_bytes)
+        if current_offset + header_size > len(data): break
+        frame_offset_x, frame_offset_y, width, height, channels = struct.unpack_from(header_format, data, current_offset)
         bpp = channels * 8; final_x = base_x + frame_offset_x; final_y = base_y + frame_offset_y
         coords_list.append({'source_file': source_filename, 'frame': i, 'x': final_x, 'y': final_y, 'width': width, 'height': height, 'bpp': bpp})
-        pixel_data_offset = current_offset + header_size; f.seek(pixel_data_offset); pixel_data = f.read(width * height * channels)
+        pixel_data_offset = current_offset + header_size; pixel_data = data[pixel_data_offset:pixel_data_offset + width * height * channels]
         save_image_from_pixels(pixel_data, width, height, bpp, True, output_path, f"{base_name}_{i:03d}.png")
         current_offset = pixel_data_offset + len(pixel_data)
     return coords_list
 
-def handle_rle_animation(f, output_path, base_name, signature, source_filename):
+def handle_rle_animation(data, output_path, base_name, signature, source_filename):
     """處理 AN21 (RLE) 和 PL10 (RLE) 動畫格式。"""
-    # ... (此函式內容與前一版完全相同，為求簡潔故省略) ...
     coords_list = []
     if signature == b'AN21':
         try:
-            f.seek(4); table_count = struct.unpack('<H', f.read(2))[0]; f.seek(2, 1)
+            table_count = struct.unpack_from('<H', data, 4)[0]; pos = 8
             for _ in range(table_count):
-                command = f.read(1)[0]
-                if command == 1: f.seek(8, 1)
-                else: f.seek(4, 1)
-            count2 = struct.unpack('<H', f.read(2))[0]
-            if count2 == 1: f.seek(8, 1)
-            if f.read(7) != b'[PIC]10': raise ValueError("無效的 AN21 簽名, 未找到 [PIC]10")
-            frame_count = struct.unpack('<h', f.read(2))[0]
-            global_l, global_t, _, _ = struct.unpack('<iiii', f.read(16))
-            frame_l, frame_t, w, h, channels = struct.unpack('<iiIIi', f.read(20))
+                command = data[pos]; pos += 1
+                if command == 1: pos += 8
+                else: pos += 4
+            count2 = struct.unpack_from('<H', data, pos)[0]; pos += 2
+            if count2 == 1: pos += 8
+            if data[pos:pos+7] != b'[PIC]10': raise ValueError("無效的 AN21 簽名, 未找到 [PIC]10")
+            pos += 7
+            frame_count = struct.unpack_from('<h', data, pos)[0]; pos += 2
+            global_l, global_t, _, _ = struct.unpack_from('<iiii', data, pos); pos += 16
+            frame_l, frame_t, w, h, channels = struct.unpack_from('<iiIIi', data, pos); pos += 20
             is_special_file = '乳' in source_filename or '胸' in source_filename
             if is_special_file: final_x, final_y = global_l, global_t
             else: final_x, final_y = global_l + frame_l, global_t + frame_t
             bpp = channels * 8; previous_frame_pixels = None; unpacked_size = w * h * channels
             for i in range(frame_count):
                 coords_list.append({'source_file': source_filename, 'frame': i, 'x': final_x, 'y': final_y, 'width': w, 'height': h, 'bpp': bpp})
-                if i == 0: pixels = f.read(unpacked_size)
+                if i == 0:
+                    pixels = data[pos:pos+unpacked_size]; pos += len(pixels)
                 else:
-                    rle_step = f.read(1)[0]; packed_size = struct.unpack('<I', f.read(4))[0]
-                    compressed_data = f.read(packed_size); delta_pixels = decompress_rle(io.BytesIO(compressed_data), unpacked_size, rle_step)
-                    pixels = bytes((p + d) & 0xFF for p, d in zip(previous_frame_pixels, delta_pixels))
+                    rle_step = data[pos]; pos += 1
+                    packed_size = struct.unpack_from('<I', data, pos)[0]; pos += 4
+                    compressed_data = data[pos:pos+packed_size]; pos += len(compressed_data)
+                    delta_pixels = decompress_rle(compressed_data, unpacked_size, rle_step)
+                    pixels = add_delta_frame(previous_frame_pixels, delta_pixels)
                 previous_frame_pixels = pixels
                 save_image_from_pixels(pixels, w, h, bpp, True, output_path, f"{base_name}_{i:03d}.png")
             return coords_list
@@ -154,26 +166,25 @@ def handle_rle_animation(f, output_path, base_name, signature, source_filename):
             print(f"處理 AN21 檔案 '{source_filename}' 時發生嚴重錯誤: {e}"); return []
     else: print(f"警告: PL10 處理邏輯在此版本中未完整實現。"); return []
 
-def handle_ap_formats(f, output_path, base_name, signature, source_filename):
+def handle_ap_formats(data, output_path, base_name, signature, source_filename):
     """處理 AP, AP-0, AP-2, AP-3 靜態圖片格式。"""
-    # ... (此函式內容與前一版完全相同，為求簡潔故省略) ...
     offset_x, offset_y = 0, 0
     flip = True
     if signature == b'AP':
-        f.seek(2); width, height, _ = struct.unpack('<IIh', f.read(10)); bpp = 32
+        width, height, _ = struct.unpack_from('<IIh', data, 2); bpp = 32; pixel_offset = 12
         print(f"DEBUG: AP 格式，強制使用 32 BPP。")
     elif signature == b'AP-0':
-        f.seek(4); width, height = struct.unpack('<II', f.read(8)); bpp = 8; f.seek(12)
+        width, height = struct.unpack_from('<II', data, 4); bpp = 8; pixel_offset = 12
     elif signature == b'AP-2':
-        f.seek(4); offset_x, offset_y, width, height = struct.unpack('<iiII', f.read(16)); bpp = 32; f.seek(0x18)
+        offset_x, offset_y, width, height = struct.unpack_from('<iiII', data, 4); bpp = 32; pixel_offset = 0x18
     elif signature == b'AP-3':
-        f.seek(4); offset_x, offset_y, width, height = struct.unpack('<iiII', f.read(16)); bpp = struct.unpack('<i', f.read(4))[0]; f.seek(0x18)
+        offset_x, offset_y, width, height, bpp = struct.unpack_from('<iiIIi', data, 4); pixel_offset = 0x18
     else:
         print(f"警告: 在 handle_ap_formats 中遇到未知的簽名 '{signature}'"); return []
     bytes_per_pixel = bpp // 8
     if bytes_per_pixel <= 0:
         print(f"警告: BPP 值 ({bpp}) 無效，無法讀取像素。"); return []
-    pixel_data = f.read(width * height * bytes_per_pixel)
+    pixel_data = data[pixel_offset:pixel_offset + width * height * bytes_per_pixel]
     save_image_from_pixels(pixel_data, width, height, bpp, flip, output_path, f"{base_name}.png")
     return [{'source_file': source_filename, 'frame': 0, 'x': offset_x, 'y': offset_y, 'width': width, 'height': height, 'bpp': bpp}]
 
@@ -182,7 +193,6 @@ def handle_ap_formats(f, output_path, base_name, signature, source_filename):
 # -----------------------------------------------------------------------------
 def process_file(filepath, output_dir):
     """處理單一檔案，並返回其座標資訊。"""
-    # ... (此函式內容與前一版完全相同，為求簡潔故省略) ...
     base_name = os.path.splitext(os.path.basename(filepath))[0]
     source_filename = os.path.basename(filepath)
     handlers = {
@@ -194,18 +204,18 @@ def process_file(filepath, output_dir):
     }
     try:
         with open(filepath, 'rb') as f:
-            sig_bytes = f.read(4)
-            f.seek(0)
-            sig_to_use = None
-            if sig_bytes in handlers: sig_to_use = sig_bytes
-            elif sig_bytes[:3] in handlers: sig_to_use = sig_bytes[:3]
-            elif sig_bytes[:2] in handlers: sig_to_use = sig_bytes[:2]
-            handler = handlers.get(sig_to_use)
-            if handler:
-                print(f"處理中: {source_filename} (偵測到格式: {sig_to_use.decode(errors='ignore')})")
-                return handler(f, output_dir, base_name, sig_to_use, source_filename)
-            else:
-                return []
+            data = memoryview(f.read())
+        sig_bytes = bytes(data[:4])
+        sig_to_use = None
+        if sig_bytes in handlers: sig_to_use = sig_bytes
+        elif sig_bytes[:3] in handlers: sig_to_use = sig_bytes[:3]
+        elif sig_bytes[:2] in handlers: sig_to_use = sig_bytes[:2]
+        handler = handlers.get(sig_to_use)
+        if handler:
+            print(f"處理中: {source_filename} (偵測到格式: {sig_to_use.decode(errors='ignore')})")
+            return handler(data, output_dir, base_name, sig_to_use, source_filename)
+        else:
+            return []
     except IOError as e:
         print(f"錯誤: 無法讀取檔案 {source_filename}: {e}"); return []
     except Exception as e:
@@ -217,6 +227,7 @@ def main():
     """主程式入口"""
     parser = argparse.ArgumentParser(description="[整合修正版 v7] 轉換 Kaguya 引擎資源檔為 PNG 和單一 CSV。", formatter_class=argparse.RawTextHelpFormatter)
     parser.add_argument("input_path", help="輸入的資源檔案，或包含這些檔案的目錄路徑。")
+    parser.add_argument("-j", "--workers", type=int, default=os.cpu_count(), help="同時解碼的檔案數 (預設為 CPU 核心數)。")
     args = parser.parse_args()
 
     # --- 1. 獲取腳本所在的目錄 ---
@@ -252,14 +263,17 @@ def main():
     total = len(files_to_process)
     print(f"找到 {total} 個檔案進行處理。")
     processed_count = 0
-    for i, filepath in enumerate(files_to_process):
-        try:
-            coords = process_file(filepath, output_dir)
-            if coords:
-                processed_count += 1
-                master_coords_list.extend(coords)
-        except Exception as e:
-            print(f"處理檔案 {os.path.basename(filepath)} 時發生嚴重錯誤: {e}")
+    # 各檔案彼此獨立，以多個行程平行解碼；結果依原本的檔案順序收集，CSV 順序不變
+    with ProcessPoolExecutor(max_workers=max(1, args.workers)) as executor:
+        futures = [executor.submit(process_file, filepath, output_dir) for filepath in files_to_process]
+        for filepath, future in zip(files_to_process, futures):
+            try:
+                coords = future.result()
+                if coords:
+                    processed_count += 1
+                    master_coords_list.extend(coords)
+            except Exception as e:
+                print(f"處理檔案 {os.path.basename(filepath)} 時發生嚴重錯誤: {e}")
 
     print(f"\n--- 處理完畢 ---")
     print(f"成功處理 {processed_count} 個支援的檔案。")
@@ -0,0 +1,307 @@
+"""
+check_Kaguya_ReaderXY2.py
+功能: Kaguya_ReaderXY2.py 的回歸檢查 —— 對每種簽名 (AN00/AN10/AN20/AN21/PL00/AP/AP-0/AP-2/AP-3)
+      產生合成檔案 (含截斷的檔案)，分別以改版前的 seek/read + io.BytesIO 逐 byte 解碼 (下方 _reference_*)
+      與目前的 memoryview 版本處理，比對每張輸出圖的像素 bytes / 尺寸 / BPP 與回傳的座標是否完全相同
+放置: 與 Kaguya_ReaderXY2.py 同一資料夾
+用法: python check_Kaguya_ReaderXY2.py [每種簽名的檔案數]
+      預設每種簽名 40 個檔案；有不一致時結束代碼為 1
+"""
+import contextlib
+import io
+import os
+import random
+import struct
+import sys
+import tempfile
+import Kaguya_ReaderXY2 as reader
+
+SIGNATURES = (b'AN00', b'AN10', b'AN20', b'AN21', b'PL00', b'AP', b'AP-0', b'AP-2', b'AP-3')
+
+_saved = []
+
+
+def save_image_from_pixels(pixel_data, width, height, bpp, flip, output_path, filename):
+    """取代實際存檔：記錄要輸出的圖片內容，兩個版本記錄後直接比對"""
+    _saved.append((filename, bytes(pixel_data), width, height, bpp, flip))
+
+
+# ─── 改版前的實作 (seek/read + io.BytesIO 逐 byte 解碼)，僅把存檔換成上面的記錄函式 ───
+def _reference_decompress_rle(input_stream, unpacked_size, rle_step):
+    output = bytearray(unpacked_size)
+    for i in range(rle_step):
+        if input_stream.tell() >= len(input_stream.getbuffer()): break
+        v1 = int.from_bytes(input_stream.read(1), 'little')
+        if i < len(output): output[i] = v1
+        dst = i + rle_step
+        while dst < unpacked_size:
+            if input_stream.tell() >= len(input_stream.getbuffer()): break
+            v2 = int.from_bytes(input_stream.read(1), 'little')
+            output[dst] = v2
+            dst += rle_step
+            if v2 == v1:
+                if input_stream.tell() >= len(input_stream.getbuffer()): break
+                count = int.from_bytes(input_stream.read(1), 'little')
+                if (count & 0x80) != 0:
+                    if input_stream.tell() >= len(input_stream.getbuffer()): break
+                    count = int.from_bytes(input_stream.read(1), 'little') + ((count & 0x7F) << 8) + 128
+                for _ in range(count):
+                    if dst >= unpacked_size: break
+                    output[dst] = v2
+                    dst += rle_step
+                if dst < unpacked_size:
+                    if input_stream.tell() >= len(input_stream.getbuffer()): break
+                    v2 = int.from_bytes(input_stream.read(1), 'little')
+                    output[dst] = v2
+                    dst += rle_step
+            v1 = v2
+    return output
+
+
+def _reference_handle_an00_an10_pl00(f, output_path, base_name, signature, source_filename):
+    coords_list = []
+    if signature == b'AN00':
+        f.seek(4); base_x, base_y = struct.unpack('<ii', f.read(8))
+    else:
+        f.seek(0x06 if signature == b'PL00' else 0x04); base_x, base_y, _, _ = struct.unpack('<iiII', f.read(16))
+    if signature == b'PL00':
+        f.seek(4); image_count = struct.unpack('<h', f.read(2))[0]; current_offset = 0x16
+    else:
+        f.seek(20); table_count = struct.unpack('<h', f.read(2))[0]; image_count_offset = 0x18 + table_count * 4
+        f.seek(image_count_offset); image_count = struct.unpack('<h', f.read(2))[0]; current_offset = image_count_offset + 2
+    if image_count <= 0: return []
+    for i in range(image_count):
+        f.seek(current_offset)
+        header_format = '<iiII' if signature == b'AN00' else '<iiIII'
+        header_size = struct.calcsize(header_format); header_bytes = f.read(header_size)
+        if len(header_bytes) < header_size: break
+        frame_header = struct.unpack(header_format, header_bytes)
+        frame_offset_x, frame_offset_y, width, height = frame_header[0:4]
+        channels = 4 if signature == b'AN00' else frame_header[4]
+        bpp = channels * 8; final_x = base_x + frame_offset_x; final_y = base_y + frame_offset_y
+        coords_list.append({'source_file': source_filename, 'frame': i, 'x': final_x, 'y': final_y, 'width': width, 'height': height, 'bpp': bpp})
+        pixel_data_offset = current_offset + header_size; bytes_to_read = width * height * channels
+        f.seek(pixel_data_offset); pixel_data = f.read(bytes_to_read)
+        save_image_from_pixels(pixel_data, width, height, bpp, True, output_path, f"{base_name}_{i:03d}.png")
+        current_offset = pixel_data_offset + len(pixel_data)
+    return coords_list
+
+
+def _reference_handle_an20(f, output_path, base_name, signature, source_filename):
+    coords_list = []; f.seek(0); data = f.read(); f.seek(4); table_count = struct.unpack('<h', f.read(2))[0]; pos = 8
+    for _ in range(table_count):
+        byte_val = data[pos]; pos += 1
+        if byte_val == 1: pos += 8
+        elif byte_val in [2, 3, 4, 5]: pos += 4
+    count = struct.unpack('<H', data[pos:pos+2])[0]; pos += 2; pos += count * 8; f.seek(pos + 2)
+    base_x, base_y, _, _ = struct.unpack('<iiII', f.read(16)); f.seek(pos); image_count = struct.unpack('<h', f.read(2))[0]
+    if image_count <= 0: return []
+    current_offset = f.tell() + 0x10; header_format = '<iiIII'; header_size = struct.calcsize(header_format)
+    for i in range(image_count):
+        f.seek(current_offset); header_bytes = f.read(header_size)
+        if len(header_bytes) < header_size: break
+        frame_offset_x, frame_offset_y, width, height, channels = struct.unpack(header_format, header_bytes)
+        bpp = channels * 8; final_x = base_x + frame_offset_x; final_y = base_y + frame_offset_y
+        coords_list.append({'source_file': source_filename, 'frame': i, 'x': final_x, 'y': final_y, 'width': width, 'height': height, 'bpp': bpp})
+        pixel_data_offset = current_offset + header_size; f.seek(pixel_data_offset); pixel_data = f.read(width * height * channels)
+        save_image_from_pixels(pixel_data, width, height, bpp, True, output_path, f"{base_name}_{i:03d}.png")
+        current_offset = pixel_data_offset + len(pixel_data)
+    return coords_list
+
+
+def _reference_handle_rle_animation(f, output_path, base_name, signature, source_filename):
+    coords_list = []
+    if signature == b'AN21':
+        try:
+            f.seek(4); table_count = struct.unpack('<H', f.read(2))[0]; f.seek(2, 1)
+            for _ in range(table_count):
+                command = f.read(1)[0]
+                if command == 1: f.seek(8, 1)
+                else: f.seek(4, 1)
+            count2 = struct.unpack('<H', f.read(2))[0]
+            if count2 == 1: f.seek(8, 1)
+            if f.read(7) != b'[PIC]10': raise ValueError("無效的 AN21 簽名, 未找到 [PIC]10")
+            frame_count = struct.unpack('<h', f.read(2))[0]
+            global_l, global_t, _, _ = struct.unpack('<iiii', f.read(16))
+            frame_l, frame_t, w, h, channels = struct.unpack('<iiIIi', f.read(20))
+            is_special_file = '乳' in source_filename or '胸' in source_filename
+            if is_special_file: final_x, final_y = global_l, global_t
+            else: final_x, final_y = global_l + frame_l, global_t + frame_t
+            bpp = channels * 8; previous_frame_pixels = None; unpacked_size = w * h * channels
+            for i in range(frame_count):
+                coords_list.append({'source_file': source_filename, 'frame': i, 'x': final_x, 'y': final_y, 'width': w, 'height': h, 'bpp': bpp})
+                if i == 0: pixels = f.read(unpacked_size)
+                else:
+                    rle_step = f.read(1)[0]; packed_size = struct.unpack('<I', f.read(4))[0]
+                    compressed_data = f.read(packed_size); delta_pixels = _reference_decompress_rle(io.BytesIO(compressed_data), unpacked_size, rle_step)
+                    pixels = bytes((p + d) & 0xFF for p, d in zip(previous_frame_pixels, delta_pixels))
+                previous_frame_pixels = pixels
+                save_image_from_pixels(pixels, w, h, bpp, True, output_path, f"{base_name}_{i:03d}.png")
+            return coords_list
+        except Exception as e:
+            print(f"處理 AN21 檔案 '{source_filename}' 時發生嚴重錯誤: {e}"); return []
+    else: print(f"警告: PL10 處理邏輯在此版本中未完整實現。"); return []
+
+
+def _reference_handle_ap_formats(f, output_path, base_name, signature, source_filename):
+    offset_x, offset_y = 0, 0
+    flip = True
+    if signature == b'AP':
+        f.seek(2); width, height, _ = struct.unpack('<IIh', f.read(10)); bpp = 32
+    elif signature == b'AP-0':
+        f.seek(4); width, height = struct.unpack('<II', f.read(8)); bpp = 8; f.seek(12)
+    elif signature == b'AP-2':
+        f.seek(4); offset_x, offset_y, width, height = struct.unpack('<iiII', f.read(16)); bpp = 32; f.seek(0x18)
+    elif signature == b'AP-3':
+        f.seek(4); offset_x, offset_y, width, height = struct.unpack('<iiII', f.read(16)); bpp = struct.unpack('<i', f.read(4))[0]; f.seek(0x18)
+    else:
+        print(f"警告: 在 handle_ap_formats 中遇到未知的簽名 '{signature}'"); return []
+    bytes_per_pixel = bpp // 8
+    if bytes_per_pixel <= 0:
+        print(f"警告: BPP 值 ({bpp}) 無效，無法讀取像素。"); return []
+    pixel_data = f.read(width * height * bytes_per_pixel)
+    save_image_from_pixels(pixel_data, width, height, bpp, flip, output_path, f"{base_name}.png")
+    return [{'source_file': source_filename, 'frame': 0, 'x': offset_x, 'y': offset_y, 'width': width, 'height': height, 'bpp': bpp}]
+
+
+def _reference_process_file(filepath, output_dir):
+    base_name = os.path.splitext(os.path.basename(filepath))[0]
+    source_filename = os.path.basename(filepath)
+    handlers = {
+        b'AN00': _reference_handle_an00_an10_pl00, b'AN10': _reference_handle_an00_an10_pl00, b'PL00': _reference_handle_an00_an10_pl00,
+        b'AN20': _reference_handle_an20,
+        b'AN21': _reference_handle_rle_animation, b'PL10': _reference_handle_rle_animation,
+        b'AP-0': _reference_handle_ap_formats, b'AP-2': _reference_handle_ap_formats, b'AP-3': _reference_handle_ap_formats,
+        b'AP': _reference_handle_ap_formats,
+    }
+    try:
+        with open(filepath, 'rb') as f:
+            sig_bytes = f.read(4)
+            f.seek(0)
+            sig_to_use = None
+            if sig_bytes in handlers: sig_to_use = sig_bytes
+            elif sig_bytes[:3] in handlers: sig_to_use = sig_bytes[:3]
+            elif sig_bytes[:2] in handlers: sig_to_use = sig_bytes[:2]
+            handler = handlers.get(sig_to_use)
+            return handler(f, output_dir, base_name, sig_to_use, source_filename) if handler else []
+    except IOError as e:
+        print(f"錯誤: 無法讀取檔案 {source_filename}: {e}"); return []
+    except Exception as e:
+        print(f"處理檔案 {source_filename} 時發生未預期的錯誤: {e}"); return []
+
+
+# ─── 合成檔案 ───
+def _pixels(rnd, size):
+    return bytes(rnd.getrandbits(8) for _ in range(size))
+
+
+def _rle_stream(rnd, size):
+    """隨機的 RLE 串流：值集中在少數幾個，讓重複 (含 0x80 以上的兩 byte 長度) 經常出現"""
+    out = bytearray()
+    while len(out) < size:
+        r = rnd.random()
+        if r < 0.6: out.append(rnd.choice((0, 0, 1, 0xff)))
+        elif r < 0.7: out += bytes((0x80 | rnd.randrange(2), rnd.getrandbits(8)))
+        else: out.append(rnd.getrandbits(8))
+    return bytes(out)
+
+
+def _frames(rnd, count, header_format, channel_choices):
+    body = b''
+    for _ in range(count):
+        w, h, channels = rnd.randint(1, 12), rnd.randint(1, 12), rnd.choice(channel_choices)
+        fields = (rnd.randint(-50, 50), rnd.randint(-50, 50), w, h) + ((channels,) if header_format == '<iiIII' else ())
+        body += struct.pack(header_format, *fields) + _pixels(rnd, w * h * channels)
+    return body
+
+
+def build_file(signature, rnd):
+    """產生一個該簽名的合成檔案 (bytes)"""
+    base = struct.pack('<iiII', rnd.randint(-300, 300), rnd.randint(-300, 300), 800, 600)
+    count = rnd.randint(1, 4)
+    if signature == b'AN00':
+        table_count = rnd.randint(0, 3)
+        head = b'AN00' + base + struct.pack('<h', table_count) + b'\0\0' + b'\0' * (table_count * 4)
+        return head + struct.pack('<h', count) + _frames(rnd, count, '<iiII', (4,))
+    if signature == b'AN10':
+        table_count = rnd.randint(0, 3)
+        head = b'AN10' + base + struct.pack('<h', table_count) + b'\0\0' + b'\0' * (table_count * 4)
+        return head + struct.pack('<h', count) + _frames(rnd, count, '<iiIII', (1, 3, 4))
+    if signature == b'PL00':
+        return b'PL00' + struct.pack('<h', count) + base + _frames(rnd, count, '<iiIII', (1, 3, 4))
+    if signature == b'AN20':
+        table = b''
+        entries = rnd.randint(0, 4)
+        for _ in range(entries):
+            command = rnd.choice((0, 1, 2, 5, 7))
+            table += bytes((command,)) + b'\0' * (8 if command == 1 else 4 if 2 <= command <= 5 else 0)
+        extra = rnd.randint(0, 2)
+        head = b'AN20' + struct.pack('<hh', entries, 0) + table + struct.pack('<H', extra) + b'\0' * (extra * 8)
+        return head + struct.pack('<h', count) + base + _frames(rnd, count, '<iiIII', (3, 4))
+    if signature == b'AN21':
+        table = b''
+        entries = rnd.randint(0, 3)
+        for _ in range(entries):
+            command = rnd.choice((1, 2))
+            table += bytes((command,)) + b'\0' * (8 if command == 1 else 4)
+        count2 = rnd.choice((0, 1))
+        w, h, channels = rnd.randint(1, 64), rnd.randint(1, 64), rnd.choice((3, 4))
+        frame_count = rnd.randint(1, 4)
+        body = (b'AN21' + struct.pack('<HH', entries, 0) + table + struct.pack('<H', count2) + b'\0' * (8 if count2 == 1 else 0)
+                + b'[PIC]10' + struct.pack('<h', frame_count)
+                + struct.pack('<iiii', rnd.randint(-99, 99), rnd.randint(-99, 99), 800, 600)
+                + struct.pack('<iiIIi', rnd.randint(-20, 20), rnd.randint(-20, 20), w, h, channels)
+                + _pixels(rnd, w * h * channels))
+        for _ in range(frame_count - 1):
+            packed = _rle_stream(rnd, rnd.randint(0, w * h * channels))
+            body += bytes((rnd.choice((1, channels, 4, 7)),)) + struct.pack('<I', len(packed)) + packed
+        return body
+    w, h = rnd.randint(1, 16), rnd.randint(1, 16)
+    if signature == b'AP':
+        return b'AP' + struct.pack('<IIh', w, h, 0) + _pixels(rnd, w * h * 4)
+    if signature == b'AP-0':
+        return b'AP-0' + struct.pack('<II', w, h) + _pixels(rnd, w * h)
+    if signature == b'AP-2':
+        return b'AP-2' + struct.pack('<iiII', rnd.randint(-99, 99), rnd.randint(-99, 99), w, h) + _pixels(rnd, w * h * 4)
+    bpp = rnd.choice((8, 24, 32))
+    return b'AP-3' + struct.pack('<iiIIi', rnd.randint(-99, 99), rnd.randint(-99, 99), w, h, bpp) + _pixels(rnd, w * h * bpp // 8)
+
+
+def run(process, path):
+    """執行 process_file 並回傳 (座標 list, 記錄的圖片 list)；處理器的訊息不輸出"""
+    del _saved[:]
+    with contextlib.redirect_stdout(io.StringIO()):
+        coords = process(path, os.path.dirname(path))
+    return coords, list(_saved)
+
+
+def main():
+    files_per_signature = int(sys.argv[1]) if len(sys.argv) > 1 else 40
+    reader.save_image_from_pixels = save_image_from_pixels
+    rnd = random.Random(0)
+    failed = 0
+    with tempfile.TemporaryDirectory() as work_dir:
+        for signature in SIGNATURES:
+            mismatches = images = 0
+            for n in range(files_per_signature):
+                data = build_file(signature, rnd)
+                if n % 4 == 3:
+                    data = data[:rnd.randrange(len(data))]  # 每 4 個檔案截斷一個
+                # AN21 的檔名含 "乳" / "胸" 時座標算法不同
+                name = f"{'乳' if signature == b'AN21' and n % 5 == 0 else ''}{signature.decode()}_{n:03d}.bin"
+                path = os.path.join(work_dir, name)
+                with open(path, 'wb') as f:
+                    f.write(data)
+                expected = run(_reference_process_file, path)
+                actual = run(reader.process_file, path)
+                images += len(expected[1])
+                if actual != expected:
+                    mismatches += 1
+                    print(f"  不一致: {name}")
+            failed += mismatches
+            print(f"{signature.decode():5s}: {files_per_signature} 個檔案，{images} 張圖，{'一致' if not mismatches else f'{mismatches} 個不一致!'}")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
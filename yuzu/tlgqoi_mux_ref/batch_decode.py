@@ -2,104 +2,196 @@
 import struct
 import glob
 import os
+import mmap
+import zlib
 from multiprocessing import Pool, cpu_count
+import numpy as np
 from PIL import Image
-
-def decode_qoi_data(data, width, height):
-    pixels = []
-    index = [bytes([0, 0, 0, 0])] * 64
-    px = bytes([0, 0, 0, 255])
-    run = 0
-    pos = 0
-
-    while len(pixels) < width * height and pos < len(data):
-        if run > 0:
-            pixels.append(px)
-            run -= 1
-            continue
-        if pos >= len(data): break
-        b1 = data[pos]
-        pos += 1
-        if b1 == 0xfe:
-            if pos + 3 > len(data): break
-            r, g, b = data[pos:pos+3]
-            pos += 3
-            px = bytes([r, g, b, px[3]])
-        elif b1 == 0xff:
-            if pos + 4 > len(data): break
-            r, g, b, a = data[pos:pos+4]
-            pos += 4
-            px = bytes([r, g, b, a])
-        elif (b1 & 0xc0) == 0x00:
-            px = index[b1]
-        elif (b1 & 0xc0) == 0x40:
-            dr = ((b1 >> 4) & 0x03) - 2
-            dg = ((b1 >> 2) & 0x03) - 2
-            db = (b1 & 0x03) - 2
-            px = bytes([(px[0] + dr) & 0xff, (px[1] + dg) & 0xff, (px[2] + db) & 0xff, px[3]])
-        elif (b1 & 0xc0) == 0x80:
-            if pos >= len(data): break
-            b2 = data[pos]
-            pos += 1
-            dg = (b1 & 0x3f) - 32
-            dr = dg + ((b2 >> 4) & 0x0f) - 8
-            db = dg + (b2 & 0x0f) - 8
-            px = bytes([(px[0] + dr) & 0xff, (px[1] + dg) & 0xff, (px[2] + db) & 0xff, px[3]])
-        elif (b1 & 0xc0) == 0xc0:
-            run = (b1 & 0x3f)
-        index[(px[0] * 3 + px[1] * 5 + px[2] * 7 + px[3] * 11) % 64] = px
-        pixels.append(px)
-    while len(pixels) < width * height:
-        pixels.append(px)
-    return b''.join(pixels)
-
-def process_file(filename):
+from qoi_codec import decode_qoi, decode_qoi_into
+
+# Streaming mode: mmap the .tlg, decode tiles in y order and write PNG rows as soon
+# as no later tile can touch them. Per-worker memory is bounded by tile height
+# instead of the full canvas. Set to False to use the old full-canvas path.
+STREAMING = True
+
+TLGQOI_MAGIC = b'TLGqoi\x00raw\x1a'
+
+
+class StreamingPNGWriter:
+    """Minimal RGBA PNG encoder that accepts rows incrementally.
+
+    Each row picks the None/Sub/Up filter with the smallest sum of absolute
+    values, and the compressed stream is flushed as IDAT chunks.
+    """
+    IDAT_SIZE = 1 << 20
+
+    def __init__(self, path, width, height, level=6):
+        self.path = path
+        self.f = open(path, 'wb')
+        self.width = width
+        self.height = height
+        self.rows_written = 0
+        self.prev_row = np.zeros(width * 4, dtype=np.uint8)
+        self.compressor = zlib.compressobj(level)
+        self.pending = bytearray()
+        self.f.write(b'\x89PNG\r\n\x1a\n')
+        self._chunk(b'IHDR', struct.pack('>IIBBBBB', width, height, 8, 6, 0, 0, 0))
+
+    def _chunk(self, tag, payload):
+        self.f.write(struct.pack('>I', len(payload)))
+        self.f.write(tag)
+        self.f.write(payload)
+        self.f.write(struct.pack('>I', zlib.crc32(payload, zlib.crc32(tag)) & 0xffffffff))
+
+    def _flush_idat(self, final=False):
+        while len(self.pending) >= self.IDAT_SIZE or (final and self.pending):
+            self._chunk(b'IDAT', bytes(self.pending[:self.IDAT_SIZE]))
+            del self.pending[:self.IDAT_SIZE]
+
+    def write_rows(self, rows):
+        """rows: (n, width, 4) uint8 array"""
+        if len(rows) == 0:
+            return
+        for row in rows.reshape(len(rows), -1):
+            sub = row.copy()
+            sub[4:] -= row[:-4]
+            up = row - self.prev_row
+            candidates = ((0, row), (1, sub), (2, up))
+            ftype, filtered = min(candidates, key=lambda c: int(np.abs(c[1].view(np.int8).astype(np.int32)).sum()))
+            self.pending += self.compressor.compress(bytes([ftype]) + filtered.tobytes())
+            self.prev_row = row
+            self.rows_written += 1
+        self._flush_idat()
+
+    def close(self):
+        if self.rows_written < self.height:
+            self.write_rows(np.zeros((self.height - self.rows_written, self.width, 4), dtype=np.uint8))
+        self.pending += self.compressor.flush()
+        self._flush_idat(final=True)
+        self._chunk(b'IEND', b'')
+        self.f.close()
+
+    def discard(self):
+        """Close and delete the partially written file."""
+        self.f.close()
+        os.remove(self.path)
+
+
+def read_mux_entries(data):
+    """Parse the CMUX tile table. Returns (base_offset, entries) or None."""
+    pos = 19 + 1
+    pos += 4
+    entry_size = struct.unpack('<I', data[pos:pos+4])[0]
+    pos += 4
+    entry_count = struct.unpack('<I', data[pos:pos+4])[0]
+    pos += 4
+
+    # Find the base offset where tile data starts (first TLGqoi marker)
+    base_offset = data.find(TLGQOI_MAGIC)
+    if base_offset == -1:
+        return None
+
+    entries = []
+    for i in range(entry_count):
+        entry = data[pos:pos+24]
+        x = struct.unpack('<I', entry[0:4])[0]
+        y = struct.unpack('<I', entry[4:8])[0]
+        w = struct.unpack('<I', entry[8:12])[0]
+        h = struct.unpack('<I', entry[12:16])[0]
+        tile_offset = struct.unpack('<I', entry[16:20])[0]
+        entries.append((x, y, w, h, tile_offset))
+        pos += 24
+    return base_offset, entries
+
+
+def y_order_is_safe(entries):
+    """True if sorting tiles by y never changes which tile wins an overlap."""
+    ordered = sorted(range(len(entries)), key=lambda i: entries[i][1])
+    rank = {i: r for r, i in enumerate(ordered)}
+    for i, (x1, y1, w1, h1, _) in enumerate(entries):
+        for j in range(i + 1, len(entries)):
+            x2, y2, w2, h2, _ = entries[j]
+            overlap = x1 < x2 + w2 and x2 < x1 + w1 and y1 < y2 + h2 and y2 < y1 + h1
+            if overlap and rank[i] > rank[j]:
+                return False
+    return True
+
+
+def decode_mux_canvas(data, base_offset, entries, max_x, max_y):
+    canvas = Image.new('RGBA', (max_x, max_y), (0, 0, 0, 0))
+
+    for i, (x, y, w, h, tile_offset) in enumerate(entries):
+        tile_start = base_offset + tile_offset
+        if tile_start + 28 > len(data): continue
+        if data[tile_start:tile_start+11] != TLGQOI_MAGIC: continue
+
+        pixels = decode_qoi(data, tile_start + 28, w, h)
+        tile_img = Image.frombytes('RGBA', (w, h), pixels)
+        canvas.paste(tile_img, (x, y))
+    return canvas
+
+
+def decode_mux_streaming(data, base_offset, entries, max_x, max_y, output):
+    """Decode tiles in y order into a strip buffer and emit finished rows to the PNG.
+
+    Rows go to a temporary file that replaces output only after every tile decoded,
+    so a failed file never leaves a zero-padded PNG behind.
+    """
+    tmp_output = output + '.tmp'
+    writer = StreamingPNGWriter(tmp_output, max_x, max_y)
     try:
-        with open(filename, 'rb') as f:
-            data = f.read()
-
-        pos = 19 + 1
-        pos += 4
-        entry_size = struct.unpack('<I', data[pos:pos+4])[0]
-        pos += 4
-        entry_count = struct.unpack('<I', data[pos:pos+4])[0]
-        pos += 4
-
-        # Find the base offset where tile data starts (first TLGqoi marker)
-        base_offset = data.find(b'TLGqoi\x00raw\x1a')
-        if base_offset == -1:
-            return f"FAIL {os.path.basename(filename)}: No TLGqoi data found"
-
-        entries = []
-        for i in range(entry_count):
-            entry = data[pos:pos+24]
-            x = struct.unpack('<I', entry[0:4])[0]
-            y = struct.unpack('<I', entry[4:8])[0]
-            w = struct.unpack('<I', entry[8:12])[0]
-            h = struct.unpack('<I', entry[12:16])[0]
-            tile_offset = struct.unpack('<I', entry[16:20])[0]
-            entries.append((x, y, w, h, tile_offset))
-            pos += 24
-
-        max_x = max(x + w for x, y, w, h, _ in entries)
-        max_y = max(y + h for x, y, w, h, _ in entries)
-
-        canvas = Image.new('RGBA', (max_x, max_y), (0, 0, 0, 0))
-
-        for i, (x, y, w, h, tile_offset) in enumerate(entries):
+        strip = np.zeros((0, max_x, 4), dtype=np.uint8)
+        strip_y = 0  # canvas row of strip[0]; every row above it is already written
+
+        for x, y, w, h, tile_offset in sorted(entries, key=lambda e: e[1]):
+            # No remaining tile starts above y, so rows [strip_y, y) are final
+            if y > strip_y:
+                done = min(y - strip_y, len(strip))
+                writer.write_rows(strip[:done])
+                if y - strip_y > done:
+                    writer.write_rows(np.zeros((y - strip_y - done, max_x, 4), dtype=np.uint8))
+                strip = strip[done:]
+                strip_y = y
+            if y + h - strip_y > len(strip):
+                grown = np.zeros((y + h - strip_y, max_x, 4), dtype=np.uint8)
+                grown[:len(strip)] = strip
+                strip = grown
+
             tile_start = base_offset + tile_offset
             if tile_start + 28 > len(data): continue
-            if data[tile_start:tile_start+11] != b'TLGqoi\x00raw\x1a': continue
+            if data[tile_start:tile_start+11] != TLGQOI_MAGIC: continue
+
+            tile = np.empty((h, w, 4), dtype=np.uint8)
+            decode_qoi_into(data, tile_start + 28, tile, w * h)
+            strip[y - strip_y:y - strip_y + h, x:x + w] = tile
+
+        writer.write_rows(strip)
+        writer.close()
+    except BaseException:
+        writer.discard()
+        raise
+    os.replace(tmp_output, output)
 
-            qoi_data = data[tile_start + 28:]
-            pixels = decode_qoi_data(qoi_data, w, h)
-            tile_img = Image.frombytes('RGBA', (w, h), pixels)
-            canvas.paste(tile_img, (x, y))
 
+def process_file(filename):
+    try:
         out_dir = os.path.join(os.path.dirname(filename), 'output')
         os.makedirs(out_dir, exist_ok=True)
         output = os.path.join(out_dir, os.path.basename(filename).replace('.tlg', '.png'))
-        canvas.save(output)
+
+        with open(filename, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            parsed = read_mux_entries(data)
+            if parsed is None:
+                return f"FAIL {os.path.basename(filename)}: No TLGqoi data found"
+            base_offset, entries = parsed
+
+            max_x = max(x + w for x, y, w, h, _ in entries)
+            max_y = max(y + h for x, y, w, h, _ in entries)
+
+            if STREAMING and y_order_is_safe(entries):
+                decode_mux_streaming(data, base_offset, entries, max_x, max_y, output)
+            else:
+                decode_mux_canvas(data, base_offset, entries, max_x, max_y).save(output)
         return f"OK {os.path.basename(filename)}"
     except Exception as e:
         return f"FAIL {os.path.basename(filename)}: {e}"
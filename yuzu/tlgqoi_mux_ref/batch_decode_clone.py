@@ -10,11 +10,15 @@ import struct
 import sys
 import os
 import glob
+from concurrent.futures import ThreadPoolExecutor
 import lz4.block
 import numpy as np
 from PIL import Image
 from collections import defaultdict
 
+# LZ4 distance bands are decompressed on this many threads (lz4.block releases the GIL)
+LZ4_WORKERS = min(8, os.cpu_count() or 1)
+
 
 def decode_leb128(buf, offset):
     result = 0
@@ -135,49 +139,65 @@ def decode_clone_container(filename):
 
     qoi = QOIStreamDecoder()
     qoi_pos = data_start + 8  # skip 8-byte prefix
-    dist_pos = dist_data_start
 
+    # Band offsets in the distance stream are known up front, so every band's
+    # LZ4 chain is decompressed on the thread pool while the QOI walk runs.
+    band_dist_offsets = []
+    dist_pos = dist_data_start
     for band_idx in range(num_bands):
-        band_y = band_idx * band_height
-        band_h = min(band_height, height - band_y)
-        total_interleaved = width * num_images * band_h
-
-        dist_size = band_dist_sizes[band_idx]
-        decompressed = decompress_lz4_chunks(data, dist_pos, dist_size)
-        dist_pos += dist_size
-
-        qoi.reset()
-        _, _, qoi_pos = qoi.decode_one(data, qoi_pos)
-        _, _, qoi_pos = qoi.decode_one(data, qoi_pos)
-        dist_off = 0
-        _, dist_off = decode_leb128(decompressed, dist_off)
-
-        pixels = []
-        runs = []
-        total = 0
-        while total < total_interleaved:
-            px, qc, qoi_pos = qoi.decode_one(data, qoi_pos)
-            mask, dist_off = decode_leb128(decompressed, dist_off)
-            rc = mask + qc
-            if total + rc > total_interleaved:
-                rc = total_interleaved - total
-            pixels.append(px)
-            runs.append(rc)
-            total += rc
-
-        flat = np.empty((total_interleaved, 4), dtype=np.uint8)
-        pos = 0
-        for px, rc in zip(pixels, runs):
-            flat[pos:pos+rc] = px
-            pos += rc
-
-        flat_reshaped = flat.reshape(band_h, width, num_images, 4)
-        for img_idx in range(num_images):
-            images[img_idx][band_y:band_y+band_h, :, :] = flat_reshaped[:, :, img_idx, :]
+        band_dist_offsets.append(dist_pos)
+        dist_pos += band_dist_sizes[band_idx]
+
+    # Only a window of bands ahead of the QOI walk is decompressed at a time.
+    with ThreadPoolExecutor(max_workers=LZ4_WORKERS) as pool:
+        dist_futures = {}
+        for band_idx in range(num_bands):
+            for ahead in range(band_idx, min(band_idx + LZ4_WORKERS * 2, num_bands)):
+                if ahead not in dist_futures:
+                    dist_futures[ahead] = pool.submit(decompress_lz4_chunks, data,
+                                                      band_dist_offsets[ahead], band_dist_sizes[ahead])
+            decompressed = dist_futures.pop(band_idx).result()
+            qoi_pos = decode_band(data, qoi, qoi_pos, decompressed, band_idx,
+                                  band_height, width, height, num_images, images)
 
     return images
 
 
+def decode_band(data, qoi, qoi_pos, decompressed, band_idx, band_height, width, height, num_images, images):
+    """Walk one band of the QOI stream and write it into images. Returns the new qoi_pos."""
+    band_y = band_idx * band_height
+    band_h = min(band_height, height - band_y)
+    total_interleaved = width * num_images * band_h
+
+    qoi.reset()
+    _, _, qoi_pos = qoi.decode_one(data, qoi_pos)
+    _, _, qoi_pos = qoi.decode_one(data, qoi_pos)
+    dist_off = 0
+    _, dist_off = decode_leb128(decompressed, dist_off)
+
+    pixels = []
+    runs = []
+    total = 0
+    while total < total_interleaved:
+        px, qc, qoi_pos = qoi.decode_one(data, qoi_pos)
+        mask, dist_off = decode_leb128(decompressed, dist_off)
+        rc = mask + qc
+        if total + rc > total_interleaved:
+            rc = total_interleaved - total
+        pixels.append(px)
+        runs.append(rc)
+        total += rc
+
+    flat = np.repeat(np.array(pixels, dtype=np.uint8).reshape(-1, 4),
+                     np.array(runs, dtype=np.int64), axis=0)
+
+    flat_reshaped = flat.reshape(band_h, width, num_images, 4)
+    for img_idx in range(num_images):
+        images[img_idx][band_y:band_y+band_h, :, :] = flat_reshaped[:, :, img_idx, :]
+
+    return qoi_pos
+
+
 def parse_tlgref(filename):
     """Parse a TLGref file. Returns (container_name, idx, count) or None."""
     with open(filename, 'rb') as f:
@@ -0,0 +1,206 @@
+#!/usr/bin/env python3
+"""Benchmark qoi_codec against the original per-pixel decoders.
+
+Builds synthetic sprite-like tiles (transparent margins, gradients, noise),
+encodes them with a reference QOI encoder, checks that every decoder
+returns identical RGBA bytes and prints the timings.
+
+Usage: python bench_qoi.py [width] [height] [repeat]
+"""
+import sys
+import time
+import random
+
+import qoi_codec
+
+
+# ---- original decoders (copied from batch_decode.py / decode_single.py) ----
+
+def legacy_decode_qoi_data(data, width, height):
+    pixels = []
+    index = [bytes([0, 0, 0, 0])] * 64
+    px = bytes([0, 0, 0, 255])
+    run = 0
+    pos = 0
+
+    while len(pixels) < width * height and pos < len(data):
+        if run > 0:
+            pixels.append(px)
+            run -= 1
+            continue
+        if pos >= len(data): break
+        b1 = data[pos]
+        pos += 1
+        if b1 == 0xfe:
+            if pos + 3 > len(data): break
+            r, g, b = data[pos:pos+3]
+            pos += 3
+            px = bytes([r, g, b, px[3]])
+        elif b1 == 0xff:
+            if pos + 4 > len(data): break
+            r, g, b, a = data[pos:pos+4]
+            pos += 4
+            px = bytes([r, g, b, a])
+        elif (b1 & 0xc0) == 0x00:
+            px = index[b1]
+        elif (b1 & 0xc0) == 0x40:
+            dr = ((b1 >> 4) & 0x03) - 2
+            dg = ((b1 >> 2) & 0x03) - 2
+            db = (b1 & 0x03) - 2
+            px = bytes([(px[0] + dr) & 0xff, (px[1] + dg) & 0xff, (px[2] + db) & 0xff, px[3]])
+        elif (b1 & 0xc0) == 0x80:
+            if pos >= len(data): break
+            b2 = data[pos]
+            pos += 1
+            dg = (b1 & 0x3f) - 32
+            dr = dg + ((b2 >> 4) & 0x0f) - 8
+            db = dg + (b2 & 0x0f) - 8
+            px = bytes([(px[0] + dr) & 0xff, (px[1] + dg) & 0xff, (px[2] + db) & 0xff, px[3]])
+        elif (b1 & 0xc0) == 0xc0:
+            run = (b1 & 0x3f)
+        index[(px[0] * 3 + px[1] * 5 + px[2] * 7 + px[3] * 11) % 64] = px
+        pixels.append(px)
+    while len(pixels) < width * height:
+        pixels.append(px)
+    return b''.join(pixels)
+
+
+def legacy_decode_qoi(data, pos, width, height):
+    index = [(0, 0, 0, 0)] * 64
+    px = (0, 0, 0, 255)
+    pixels = []
+
+    while len(pixels) < width * height and pos < len(data):
+        b1 = data[pos]; pos += 1
+
+        if b1 == 0xFE:
+            px = (data[pos], data[pos+1], data[pos+2], px[3]); pos += 3
+            count = 1
+        elif b1 == 0xFF:
+            px = (data[pos], data[pos+1], data[pos+2], data[pos+3]); pos += 4
+            count = 1
+        elif (b1 & 0xC0) == 0x00:
+            px = index[b1 & 0x3F]
+            count = 1
+        elif (b1 & 0xC0) == 0x40:
+            px = ((px[0]+((b1>>4)&3)-2)&0xFF, (px[1]+((b1>>2)&3)-2)&0xFF,
+                  (px[2]+(b1&3)-2)&0xFF, px[3])
+            count = 1
+        elif (b1 & 0xC0) == 0x80:
+            b2 = data[pos]; pos += 1
+            dg = (b1 & 0x3F) - 32
+            px = ((px[0]+dg+((b2>>4)&0xF)-8)&0xFF, (px[1]+dg)&0xFF,
+                  (px[2]+dg+(b2&0xF)-8)&0xFF, px[3])
+            count = 1
+        else:
+            count = (b1 & 0x3F) + 1
+
+        index[(px[0]*3+px[1]*5+px[2]*7+px[3]*11) % 64] = px
+        for _ in range(count):
+            if len(pixels) < width * height:
+                pixels.append(px)
+
+    return pixels
+
+
+# ---- synthetic tiles ----
+
+def encode_qoi(rgba):
+    """Reference QOI encoder (standard opcodes, runs of up to 62)."""
+    out = bytearray()
+    index = [(0, 0, 0, 0)] * 64
+    prev = (0, 0, 0, 255)
+    run = 0
+    for i in range(0, len(rgba), 4):
+        px = tuple(rgba[i:i + 4])
+        if px == prev:
+            run += 1
+            if run == 62:
+                out.append(0xC0 | (run - 1))
+                run = 0
+            continue
+        if run:
+            out.append(0xC0 | (run - 1))
+            run = 0
+        h = (px[0] * 3 + px[1] * 5 + px[2] * 7 + px[3] * 11) % 64
+        if index[h] == px:
+            out.append(h)
+        else:
+            index[h] = px
+            if px[3] == prev[3]:
+                dr = ((px[0] - prev[0] + 128) & 0xFF) - 128
+                dg = ((px[1] - prev[1] + 128) & 0xFF) - 128
+                db = ((px[2] - prev[2] + 128) & 0xFF) - 128
+                dr_dg, db_dg = dr - dg, db - dg
+                if -2 <= dr <= 1 and -2 <= dg <= 1 and -2 <= db <= 1:
+                    out.append(0x40 | ((dr + 2) << 4) | ((dg + 2) << 2) | (db + 2))
+                elif -32 <= dg <= 31 and -8 <= dr_dg <= 7 and -8 <= db_dg <= 7:
+                    out.append(0x80 | (dg + 32))
+                    out.append(((dr_dg + 8) << 4) | (db_dg + 8))
+                else:
+                    out += bytes([0xFE, px[0], px[1], px[2]])
+            else:
+                out += bytes([0xFF, px[0], px[1], px[2], px[3]])
+        prev = px
+    if run:
+        out.append(0xC0 | (run - 1))
+    return bytes(out)
+
+
+def make_tile(width, height, seed=0):
+    """Sprite-like tile: transparent margins, smooth gradient body, noisy edges."""
+    rnd = random.Random(seed)
+    buf = bytearray(width * height * 4)
+    for y in range(height):
+        left = width // 5 + rnd.randint(-3, 3)
+        right = width - width // 5 + rnd.randint(-3, 3)
+        for x in range(left, right):
+            o = (y * width + x) * 4
+            edge = min(x - left, right - 1 - x)
+            buf[o] = (x * 255 // width + rnd.randint(0, 1)) & 0xFF
+            buf[o + 1] = (y * 255 // height) & 0xFF
+            buf[o + 2] = (128 + (x ^ y) % 7) & 0xFF
+            buf[o + 3] = 255 if edge > 2 else rnd.randint(0, 255)
+    return bytes(buf)
+
+
+def timed(fn, repeat):
+    best = None
+    for _ in range(repeat):
+        t = time.perf_counter()
+        result = fn()
+        elapsed = time.perf_counter() - t
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+if __name__ == '__main__':
+    width = int(sys.argv[1]) if len(sys.argv) > 1 else 512
+    height = int(sys.argv[2]) if len(sys.argv) > 2 else 512
+    repeat = int(sys.argv[3]) if len(sys.argv) > 3 else 3
+
+    raw = make_tile(width, height)
+    stream = encode_qoi(raw)
+    print(f"tile {width}x{height}: {len(raw)} bytes raw, {len(stream)} bytes QOI")
+
+    if qoi_codec._decode_qoi_jit is not None:
+        qoi_codec.decode_qoi(stream, 0, 1, 1)  # JIT warm-up
+
+    cases = [
+        ("batch_decode.decode_qoi_data (old)", lambda: legacy_decode_qoi_data(stream, width, height)),
+        ("decode_single.decode_qoi (old)", lambda: b''.join(bytes(p) for p in legacy_decode_qoi(stream, 0, width, height))),
+        ("qoi_codec pure-Python", lambda: bytes(qoi_codec.decode_qoi(stream, 0, width, height, use_jit=False))),
+    ]
+    if qoi_codec._decode_qoi_jit is not None:
+        cases.append(("qoi_codec numba", lambda: bytes(qoi_codec.decode_qoi(stream, 0, width, height))))
+    else:
+        print("(numba not installed, compiled path skipped)")
+
+    baseline = None
+    for name, fn in cases:
+        elapsed, result = timed(fn, repeat)
+        if result != raw:
+            print(f"{name:40s} MISMATCH")
+            continue
+        baseline = baseline or elapsed
+        print(f"{name:40s} {elapsed * 1000:9.1f} ms  x{baseline / elapsed:6.1f}")
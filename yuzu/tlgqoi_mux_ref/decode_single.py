@@ -2,43 +2,7 @@
 import struct
 import sys
 from PIL import Image
-
-def decode_qoi(data, pos, width, height):
-    index = [(0, 0, 0, 0)] * 64
-    px = (0, 0, 0, 255)
-    pixels = []
-
-    while len(pixels) < width * height and pos < len(data):
-        b1 = data[pos]; pos += 1
-
-        if b1 == 0xFE:
-            px = (data[pos], data[pos+1], data[pos+2], px[3]); pos += 3
-            count = 1
-        elif b1 == 0xFF:
-            px = (data[pos], data[pos+1], data[pos+2], data[pos+3]); pos += 4
-            count = 1
-        elif (b1 & 0xC0) == 0x00:
-            px = index[b1 & 0x3F]
-            count = 1
-        elif (b1 & 0xC0) == 0x40:
-            px = ((px[0]+((b1>>4)&3)-2)&0xFF, (px[1]+((b1>>2)&3)-2)&0xFF,
-                  (px[2]+(b1&3)-2)&0xFF, px[3])
-            count = 1
-        elif (b1 & 0xC0) == 0x80:
-            b2 = data[pos]; pos += 1
-            dg = (b1 & 0x3F) - 32
-            px = ((px[0]+dg+((b2>>4)&0xF)-8)&0xFF, (px[1]+dg)&0xFF,
-                  (px[2]+dg+(b2&0xF)-8)&0xFF, px[3])
-            count = 1
-        else:
-            count = (b1 & 0x3F) + 1
-
-        index[(px[0]*3+px[1]*5+px[2]*7+px[3]*11) % 64] = px
-        for _ in range(count):
-            if len(pixels) < width * height:
-                pixels.append(px)
-
-    return pixels
+from qoi_codec import decode_qoi
 
 def decode_tlg(filename):
     with open(filename, 'rb') as f:
@@ -51,9 +15,7 @@ def decode_tlg(filename):
     width = struct.unpack_from('<I', data, 12)[0]
     height = struct.unpack_from('<I', data, 16)[0]
 
-    pixels = decode_qoi(data, 28, width, height)
-
-    img_data = b''.join(bytes(p) for p in pixels)
+    img_data = decode_qoi(data, 28, width, height)
     img = Image.frombytes('RGBA', (width, height), img_data)
 
     out = filename.rsplit('.', 1)[0] + '.png'
@@ -0,0 +1,193 @@
+#!/usr/bin/env python3
+"""Shared QOI stream decoder for TLGqoi / TLGmux tiles.
+
+Used by batch_decode.py (TLGmux tiles) and decode_single.py (standalone
+TLGqoi). Pixels are written straight into a preallocated RGBA buffer
+(bytearray or uint8 numpy array, 4 * npixels bytes).
+
+Two implementations share the same semantics:
+  - Numba-compiled kernel (used automatically when numba is installed)
+  - pure-Python fallback writing 32-bit pixels through a memoryview
+
+Opcodes (see TLGqoi_Format.md):
+  0xFE RGB / 0xFF RGBA / 0x00-0x3F INDEX / 0x40-0x7F DIFF /
+  0x80-0xBF LUMA / 0xC0-0xFD RUN (1..62)
+
+A truncated stream stops decoding and the remaining pixels are filled
+with the last decoded pixel, same as the original batch_decode loop.
+"""
+import sys
+from array import array
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+try:
+    import numba
+except ImportError:
+    numba = None
+
+# Byte order of a packed 32-bit pixel so that memory layout is R, G, B, A
+if sys.byteorder == 'little':
+    _R_SHIFT, _G_SHIFT, _B_SHIFT, _A_SHIFT = 0, 8, 16, 24
+else:
+    _R_SHIFT, _G_SHIFT, _B_SHIFT, _A_SHIFT = 24, 16, 8, 0
+
+
+def _decode_qoi_py(data, pos, out, npixels):
+    """Pure-Python decoder. Returns the stream position after the last op."""
+    dst = memoryview(out).cast('B').cast('I')
+    end = len(data)
+    index = [(0, 0, 0, 0)] * 64
+    r, g, b, a = 0, 0, 0, 255
+    px = (r << _R_SHIFT) | (g << _G_SHIFT) | (b << _B_SHIFT) | (a << _A_SHIFT)
+    i = 0
+
+    while i < npixels and pos < end:
+        b1 = data[pos]
+        pos += 1
+        if b1 < 0x40:
+            r, g, b, a = index[b1]
+        elif b1 < 0x80:
+            r = (r + ((b1 >> 4) & 3) - 2) & 0xFF
+            g = (g + ((b1 >> 2) & 3) - 2) & 0xFF
+            b = (b + (b1 & 3) - 2) & 0xFF
+        elif b1 < 0xC0:
+            if pos >= end:
+                break
+            b2 = data[pos]
+            pos += 1
+            dg = (b1 & 0x3F) - 32
+            r = (r + dg + ((b2 >> 4) & 0x0F) - 8) & 0xFF
+            g = (g + dg) & 0xFF
+            b = (b + dg + (b2 & 0x0F) - 8) & 0xFF
+        elif b1 == 0xFE:
+            if pos + 3 > end:
+                break
+            r, g, b = data[pos], data[pos + 1], data[pos + 2]
+            pos += 3
+        elif b1 == 0xFF:
+            if pos + 4 > end:
+                break
+            r, g, b, a = data[pos], data[pos + 1], data[pos + 2], data[pos + 3]
+            pos += 4
+        else:
+            # RUN: previous pixel repeated (b1 & 0x3F) + 1 times
+            count = min((b1 & 0x3F) + 1, npixels - i)
+            index[(r * 3 + g * 5 + b * 7 + a * 11) % 64] = (r, g, b, a)
+            dst[i:i + count] = array('I', [px]) * count
+            i += count
+            continue
+
+        index[(r * 3 + g * 5 + b * 7 + a * 11) % 64] = (r, g, b, a)
+        px = (r << _R_SHIFT) | (g << _G_SHIFT) | (b << _B_SHIFT) | (a << _A_SHIFT)
+        dst[i] = px
+        i += 1
+
+    if i < npixels:
+        dst[i:npixels] = array('I', [px]) * (npixels - i)
+    return pos
+
+
+def _decode_qoi_kernel(data, pos, out, npixels):
+    """Numba kernel: data / out are 1-D uint8 arrays."""
+    end = data.shape[0]
+    index = np.zeros(256, dtype=np.uint8)
+    r = 0
+    g = 0
+    b = 0
+    a = 255
+    total = npixels * 4
+    o = 0
+
+    while o < total and pos < end:
+        b1 = int(data[pos])
+        pos += 1
+        count = 1
+        if b1 == 0xFE:
+            if pos + 3 > end:
+                break
+            r = int(data[pos])
+            g = int(data[pos + 1])
+            b = int(data[pos + 2])
+            pos += 3
+        elif b1 == 0xFF:
+            if pos + 4 > end:
+                break
+            r = int(data[pos])
+            g = int(data[pos + 1])
+            b = int(data[pos + 2])
+            a = int(data[pos + 3])
+            pos += 4
+        elif b1 < 0x40:
+            j = b1 * 4
+            r = int(index[j])
+            g = int(index[j + 1])
+            b = int(index[j + 2])
+            a = int(index[j + 3])
+        elif b1 < 0x80:
+            r = (r + ((b1 >> 4) & 3) - 2) & 0xFF
+            g = (g + ((b1 >> 2) & 3) - 2) & 0xFF
+            b = (b + (b1 & 3) - 2) & 0xFF
+        elif b1 < 0xC0:
+            if pos >= end:
+                break
+            b2 = int(data[pos])
+            pos += 1
+            dg = (b1 & 0x3F) - 32
+            r = (r + dg + ((b2 >> 4) & 0x0F) - 8) & 0xFF
+            g = (g + dg) & 0xFF
+            b = (b + dg + (b2 & 0x0F) - 8) & 0xFF
+        else:
+            count = (b1 & 0x3F) + 1
+
+        j = ((r * 3 + g * 5 + b * 7 + a * 11) % 64) * 4
+        index[j] = r
+        index[j + 1] = g
+        index[j + 2] = b
+        index[j + 3] = a
+        for _ in range(count):
+            if o >= total:
+                break
+            out[o] = r
+            out[o + 1] = g
+            out[o + 2] = b
+            out[o + 3] = a
+            o += 4
+
+    while o < total:
+        out[o] = r
+        out[o + 1] = g
+        out[o + 2] = b
+        out[o + 3] = a
+        o += 4
+    return pos
+
+
+if numba is not None and np is not None:
+    _decode_qoi_jit = numba.njit(cache=True, nogil=True)(_decode_qoi_kernel)
+else:
+    _decode_qoi_jit = None
+
+
+def decode_qoi_into(data, pos, out, npixels, use_jit=True):
+    """Decode npixels RGBA pixels of the QOI stream starting at data[pos] into out.
+
+    data: bytes / bytearray / mmap / memoryview
+    out:  writable buffer of at least 4 * npixels bytes (bytearray or uint8 ndarray)
+    Returns the stream position after the last consumed op.
+    """
+    if use_jit and _decode_qoi_jit is not None:
+        src = np.frombuffer(data, dtype=np.uint8)
+        dst = np.frombuffer(out, dtype=np.uint8) if not isinstance(out, np.ndarray) else out.reshape(-1)
+        return int(_decode_qoi_jit(src, pos, dst, npixels))
+    return _decode_qoi_py(data, pos, out, npixels)
+
+
+def decode_qoi(data, pos, width, height, use_jit=True):
+    """Decode one width x height image and return its RGBA bytes as a bytearray."""
+    out = bytearray(width * height * 4)
+    decode_qoi_into(data, pos, out, width * height, use_jit)
+    return out